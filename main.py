@@ -6,68 +6,127 @@ Nutbush Movie Night web app.
 This is the main entry point for the web app. The actual functionality is in
 the nbmn package. See utest for unit testing and test for functional test
 setup.
+
+Nothing is constructed at import time: use create_app to get a configured
+Flask app. The web blueprints (and everything they import) are only loaded
+when they are asked for, so the tools commands that just need config and a
+database come up quickly. Run `./tools importtime` to see where import time
+goes.
 """
 
 # pylama:ignore=E501,D212
 
-# TODO: see deployment.md - need to switch our server deployment
-import socket
-import requests.packages.urllib3.util.connection as urllib3_cn
-
-
-def allowed_gai_family():
-    return socket.AF_INET
-
-urllib3_cn.allowed_gai_family = allowed_gai_family
-
 import os
+import json
 import logging
 from datetime import datetime
 
 from flask import Flask, g
 
-from gludb.config import default_database, Database
-
 import nbmn.log as log
 
-from nbmn.model import User, Movie, Night, Attendee, MovieOverride
-from nbmn.auth import auth
-from nbmn.main_app import main
-from nbmn.data import data
-from nbmn.lawyer import lawyer
-
-app = Flask(__name__)
 
-# Create app and handle configuration
-app = Flask(__name__)
-app.config.from_pyfile('default.config')
-app.config.from_envvar('NBMN_CONFIG', silent=False)
-app.secret_key = app.config.get('FLASK_SECRET', None)
-
-# Handle debug flag from config file - and let them use anything truthy to
-# our DEBUG flag
-app.debug = True if app.config.get('DEBUG', None) else False
-
-# Set up logging
-log.setup(level=logging.DEBUG if app.debug else logging.INFO)
-log.app_logger().info('Application logging begin: debug==%s', app.debug)
-
-# They can specify that certain config variables are copied in to
-# the system environment
-for name in app.config.get("ENV_POPULATE"):
-    val = str(app.config.get(name))
-    log.app_logger().info('Setting env[%s]=%s' % (name, val))
-    os.environ[name] = val
-
-# Now that we're all set up, we can register our blueprints
-app.register_blueprint(auth)
-app.register_blueprint(main)
-app.register_blueprint(data)
-app.register_blueprint(lawyer)
+def create_app(blueprints=True):
+    """Create and configure the app.
+
+    If blueprints is False, you get just the configuration and logging
+    (enough for an app context), which is all the tools commands need.
+    """
+    app = Flask(__name__)
+    app.config.from_pyfile('default.config')
+    app.config.from_envvar('NBMN_CONFIG', silent=False)
+    app.secret_key = app.config.get('FLASK_SECRET', None)
+
+    # Handle debug flag from config file - and let them use anything truthy to
+    # our DEBUG flag
+    app.debug = True if app.config.get('DEBUG', None) else False
+
+    # Set up logging
+    log.setup(
+        level=logging.DEBUG if app.debug else logging.INFO,
+        queue_size=app.config.get('LOG_QUEUE_SIZE', log.DEFAULT_QUEUE_SIZE)
+    )
+    log.app_logger().info('Application logging begin: debug==%s', app.debug)
+
+    # They can specify that certain config variables are copied in to
+    # the system environment
+    for name in app.config.get("ENV_POPULATE"):
+        val = str(app.config.get(name))
+        log.app_logger().info('Setting env[%s]=%s' % (name, val))
+        os.environ[name] = val
+
+    if blueprints:
+        register_blueprints(app)
+
+    return app
+
+
+def register_blueprints(app):
+    """Register our blueprints and request hooks."""
+    import nbmn.assets as assets
+    import nbmn.compress as compress
+    import nbmn.metrics as metrics
+    import nbmn.dbhook as dbhook
+    import nbmn.profiler as profiler
+    import nbmn.fragcache as fragcache
+    import nbmn.pagecache as pagecache
+    import nbmn.prefork as prefork
+    import nbmn.refresh as refresh
+
+    from nbmn.main_app import main
+    from nbmn.data import data
+    from nbmn.lawyer import lawyer
+
+    # Google login is only loaded if it's turned on
+    if app.config.get('GOOGLE_AUTH', False):
+        from nbmn.oauth import auth
+        app.register_blueprint(auth)
+    else:
+        from nbmn.auth import no_login
+        app.register_blueprint(no_login)
+
+    app.register_blueprint(main)
+    app.register_blueprint(data)
+    app.register_blueprint(lawyer)
+    app.register_blueprint(metrics.metrics)
+    app.register_blueprint(profiler.profiler)
+    app.register_blueprint(refresh.refresh)
+    app.register_blueprint(assets.assets)
+
+    app.before_request(setup)
+
+    # Response compression. Flask runs after_request hooks in the reverse of
+    # the order they were added, so adding this first means it runs last
+    app.after_request(compress.after_request)
+
+    # Other worker processes' writes (only when WORKERS > 1)
+    app.before_request(prefork.before_request)
+
+    # Template bytecode and fragment caches
+    fragcache.init_app(app)
+
+    # Built static files for asset_url/asset_urls in templates
+    assets.init_app(app)
+
+    # Request instrumentation - see /metrics
+    app.before_request(metrics.before_request)
+    app.after_request(metrics.after_request)
+    app.teardown_request(metrics.teardown_request)
+    app.after_request(dbhook.after_request)
+
+    # Admin-requested profiles and the optional sampling profiler
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+
+    # Anonymous page cache - registered last so a cache hit has still been
+    # counted by the hooks above
+    pagecache.init_app(app)
+    app.before_request(pagecache.before_request)
+    app.after_request(pagecache.after_request)
 
 
 # Pre-request setup for all requests... currently just setting some values on g
-@app.before_request
 def setup():
     """One-time setup work."""
     now = datetime.now()
@@ -77,23 +136,46 @@ def setup():
     setattr(g, 'timestamp', int(now.timestamp()))
 
 
-def database_config():
+def saved_fields(obj):
+    """JSON snapshot of a saved object's fields for LOG_SAVES.
+
+    Fields like extdata and attendees are mutable and the request can keep
+    changing them after the save, so we dump once here on the request thread
+    rather than later on the log listener thread. One json.dumps of the
+    fields costs less than to_data() (which also bumps _last_update) or a
+    deep copy would.
+    """
+    return json.dumps(dict((fld.name, getattr(obj, fld.name, None)) for fld in obj.__fields__))
+
+
+def database_config(app):
     """Set up the database using app.config."""
+    from gludb.config import default_database, Database
+
+    import nbmn.dbhook as dbhook
+    import nbmn.schema as schema
+
     backend = app.config["DB_BACKEND"]
     if not backend:
         raise ValueError('No database backend specified')
 
     # We actually monkey-patch and log saves to the database if required
-    if app.config["LOG_SAVES"]:
+    if app.config["LOG_SAVES"] and not hasattr(Database, '_old_save'):
         log.app_logger().info("Monkey-patching gludb to log object saves")
         Database._old_save = Database.save
 
         def logged_save(self, obj):
             self._old_save(obj)
-            log.app_logger().info("%s[id=%s] Saved:%s", obj.get_table_name(), obj.get_id(), obj.to_data())
+            log.app_logger().info(
+                "%s[id=%s] Saved:%s",
+                obj.get_table_name(), obj.get_id(), saved_fields(obj)
+            )
 
         Database.save = logged_save
 
+    # Count and time database calls per request (see nbmn/dbhook.py)
+    dbhook.install(app)
+
     # Certain backends need to read certain config variables for DB paramters
     params = dict()
 
@@ -109,16 +191,15 @@ def database_config():
     db_config = Database(backend, **params)
 
     default_database(db_config)
-    User.ensure_table()
-    Movie.ensure_table()
-    MovieOverride.ensure_table()
-    Night.ensure_table()
-    Attendee.ensure_table()
-    Attendee.ensure_attendees()
+
+    # Usually just a version check - see nbmn/schema.py
+    schema.ensure_schema()
 
 
 def main():
     """Entry point."""
+    app = create_app()
+
     HOST = app.config['HOST'] or '0.0.0.0'
     PORT = app.config['PORT']
     BANNER = app.config['BANNER']
@@ -129,13 +210,50 @@ def main():
         print(BANNER)
         print(('*' * 75))
 
-    database_config()
+    database_config(app)
+
+    WORKERS = app.config['WORKERS']
+    THREADS = app.config['THREADS']
+    CONNECTION_LIMIT = app.config['CONNECTION_LIMIT']
+
+    if WORKERS > 1:
+        import nbmn.prefork as prefork
+        prefork.serve(
+            app, HOST, PORT, WORKERS,
+            threads=THREADS,
+            connection_limit=CONNECTION_LIMIT,
+            max_requests=app.config['WORKER_MAX_REQUESTS'],
+            graceful_timeout=app.config['WORKER_GRACEFUL_TIMEOUT'],
+            on_worker_start=start_worker,
+        )
+        return
+
+    start_worker(app, 0)
 
     log.app_logger().info("About to start serving on %s:%d", HOST or "[ALL IFaces]", PORT)
     from waitress import serve
-    serve(app, host=HOST, port=PORT)
+    serve(app, host=HOST, port=PORT, threads=THREADS, connection_limit=CONNECTION_LIMIT)
+
+
+def start_worker(app, slot):
+    """Start the background threads for a serving process.
+
+    With WORKERS > 1 this runs in each worker process after the fork (the
+    threads wouldn't survive it). Only slot 0 runs the movie refresh, so we
+    don't spend the OMDB budget once per worker. Slot 0 is replaced whenever
+    it recycles, so the refresh keeps its budget in the database (see
+    nbmn/refresh.py).
+    """
+    if app.config['PROFILE_SAMPLING']:
+        import nbmn.profiler as profiler
+        profiler.start_sampler(app.config['PROFILE_SAMPLE_INTERVAL'])
+
+    if app.config['REFRESH_ENABLED'] and slot == 0:
+        import nbmn.refresh as refresh
+        refresh.start_refresher(app)
 
 
 if __name__ == '__main__':
     main()
+    log.shutdown()
     logging.shutdown()
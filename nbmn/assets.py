@@ -0,0 +1,455 @@
+"""assets - fingerprinted, precompressed static files.
+
+`./tools assets` builds everything the pages load into ASSET_DIR:
+
+* the bundles in BUNDLES - our own JS and CSS plus the third-party libraries,
+  concatenated and (where they aren't already) minified
+* the single files in FILES and the whole trees in DIRECTORIES (ckeditor
+  loads its plugins relative to where it lives, so the tree is copied as one)
+
+Every output is named for a hash of its contents (site.3f2a9c1b04.js, or
+ckeditor.<hash>/ for a tree), so it never changes and can be cached forever.
+Text files also get .gz (and .br when the brotli module is installed)
+siblings. Images and fonts that the CSS refers to are fingerprinted too, with
+the CSS rewritten to match. manifest.json maps names like "site.js" to the
+built file.
+
+The third-party files live in static/vendor (see VENDOR). `./tools assets
+--fetch` downloads any that are missing, along with the images and fonts
+their CSS needs, so they can be committed. Until they are, the build skips
+any bundle with missing vendor files (with a warning) and pages keep loading
+those files from their CDNs.
+
+The /assets route serves the build with a one year immutable Cache-Control,
+picking the precompressed sibling the browser accepts. Templates ask for
+asset_url('logo.png') or loop over asset_urls('vendor.js'): without a build
+(or with ASSET_DIR empty) you get the original files with their mtime as a
+cache-busting ?v= - or the CDN copies of vendor files we haven't fetched - so
+development doesn't need a build step.
+Rebuilding keeps the old files, since pages already rendered still point at
+them; use --clean to remove anything not in the new manifest. The manifest is
+read at start up, so restart after a build.
+"""
+
+# pylama:ignore=E501,D213
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+from datetime import datetime
+from posixpath import normpath, dirname, join as urljoin_path
+from urllib.parse import urljoin
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from .log import app_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+assets = Blueprint('assets', __name__)
+
+DEFAULT_ASSET_DIR = 'assets'
+DEFAULT_ASSET_MAX_AGE = 365 * 24 * 3600
+
+STATIC_DIR = 'static'
+VENDOR_DIR = 'vendor'
+MANIFEST = 'manifest.json'
+
+HASH_LENGTH = 10
+
+# Precompressed siblings are only written for these (and only if smaller)
+COMPRESSIBLE = {'.js', '.css', '.svg', '.json', '.txt', '.html', '.xml', '.ttf', '.eot', '.ico', '.md'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Third-party files (path under static/vendor) and where they come from
+VENDOR = {
+    'lodash/lodash.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/lodash.js/4.17.2/lodash.min.js',
+    'jquery/jquery.min.js': 'https://ajax.googleapis.com/ajax/libs/jquery/2.2.4/jquery.min.js',
+    'bootstrap/js/bootstrap.min.js': 'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.6/js/bootstrap.min.js',
+    'bootswatch/paper/bootstrap.min.css': 'https://maxcdn.bootstrapcdn.com/bootswatch/3.3.6/paper/bootstrap.min.css',
+    'jquery-ui/jquery-ui.min.js': 'https://ajax.googleapis.com/ajax/libs/jqueryui/1.12.1/jquery-ui.min.js',
+    'jquery-ui/themes/redmond/jquery-ui.css': 'https://ajax.googleapis.com/ajax/libs/jqueryui/1.12.1/themes/redmond/jquery-ui.css',
+    'datatables/js/jquery.dataTables.min.js': 'https://cdn.datatables.net/1.10.13/js/jquery.dataTables.min.js',
+    'datatables/js/dataTables.bootstrap.min.js': 'https://cdn.datatables.net/1.10.13/js/dataTables.bootstrap.min.js',
+    'datatables/css/jquery.dataTables.min.css': 'https://cdn.datatables.net/1.10.13/css/jquery.dataTables.min.css',
+    'datatables/css/dataTables.bootstrap.min.css': 'https://cdn.datatables.net/1.10.13/css/dataTables.bootstrap.min.css',
+    'datatables-responsive/css/responsive.dataTables.min.css': 'https://cdn.datatables.net/responsive/2.1.1/css/responsive.dataTables.min.css',
+}
+
+# Bundle name -> files under static, in load order (same order base.html
+# always used)
+BUNDLES = {
+    'vendor.css': [
+        'vendor/jquery-ui/themes/redmond/jquery-ui.css',
+        'vendor/datatables/css/jquery.dataTables.min.css',
+        'vendor/datatables-responsive/css/responsive.dataTables.min.css',
+        'vendor/datatables/css/dataTables.bootstrap.min.css',
+        'vendor/bootswatch/paper/bootstrap.min.css',
+    ],
+    'site.css': ['nutbush.css'],
+    'vendor.js': [
+        'vendor/lodash/lodash.min.js',
+        'vendor/jquery/jquery.min.js',
+        'vendor/bootstrap/js/bootstrap.min.js',  # jQuery before bootstrap, THEN jQuery UI
+        'vendor/jquery-ui/jquery-ui.min.js',
+        'vendor/datatables/js/jquery.dataTables.min.js',
+        'vendor/datatables/js/dataTables.bootstrap.min.js',
+    ],
+    'site.js': ['nutbush.js'],
+}
+
+FILES = ['logo.png']
+
+# Directory -> sub-directories we don't ship
+DIRECTORIES = {'ckeditor': {'samples'}}
+
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_CSS_IMPORT = re.compile(r'''@import\s+(?:url\()?\s*['"][^'"]+['"]\s*\)?[^;]*;''')
+_CSS_CHARSET = re.compile(r'''@charset\s+['"][^'"]*['"]\s*;''')
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+
+_manifest = None
+
+
+def asset_dir(app=None):
+    """Absolute path of the build directory (None if turned off)."""
+    configured = (app or current_app).config.get('ASSET_DIR', DEFAULT_ASSET_DIR)
+    return os.path.abspath(configured) if configured else None
+
+
+def fingerprint(name, data):
+    """name with a hash of data before the extension: site.js -> site.<hash>.js."""
+    stem, ext = os.path.splitext(name)
+    return '%s.%s%s' % (stem, hashlib.sha256(data).hexdigest()[:HASH_LENGTH], ext)
+
+
+def relative_url(url):
+    """True if url (from CSS) points at a file next to the stylesheet."""
+    return not re.match(r'^([a-z][a-z0-9+.-]*:|/|#)', url, re.I)
+
+
+def split_url(url):
+    """(path, suffix) where suffix is any ?query or #fragment."""
+    match = re.match(r'^([^?#]*)(.*)$', url)
+    return match.group(1), match.group(2)
+
+
+def minify_css(css):
+    """Drop comments and needless whitespace (strings are left alone)."""
+    out = []
+    for i, part in enumerate(_CSS_TOKENS.split(css)):
+        if i % 2:
+            if not part.startswith('/*'):
+                out.append(part)
+            elif part.startswith('/*!'):
+                out.append(part)  # Licenses
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        part = re.sub(r'([{;])([-\w]+)\s*:\s*', r'\1\2:', part)  # Declarations, not selectors
+        part = part.replace(';}', '}')
+        out.append(part)
+    return ''.join(out).strip()
+
+
+def minify_js(js):
+    """Minify with rjsmin if we have it, else just drop indentation and comment lines."""
+    if rjsmin is not None:
+        return rjsmin.jsmin(js, keep_bang_comments=True)
+    out, in_comment = [], False
+    for line in js.splitlines():
+        line = line.strip()
+        if line.startswith('/*') and not line.startswith('/*!') and not in_comment:
+            in_comment, line = True, line[2:]
+        if in_comment:
+            if '*/' not in line:
+                continue
+            in_comment, line = False, line.split('*/', 1)[1].strip()
+        if line and not line.startswith('//'):
+            out.append(line)
+    return '\n'.join(out)
+
+
+def precompress(path):
+    """Write .gz (and .br) siblings for a text file if they come out smaller."""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+        return
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    packed = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        packed.append(('.br', brotli.compress(data, quality=11)))
+    for ext, body in packed:
+        if len(body) < len(data):
+            with open(path + ext, 'wb') as fh:
+                fh.write(body)
+
+
+class Builder(object):
+    """Builds static_dir's assets into out_dir."""
+
+    def __init__(self, static_dir, out_dir, minify=True, bundles=None, files=None, directories=None):
+        """Set up - build does the work."""
+        self.static_dir = static_dir
+        self.out_dir = out_dir
+        self.minify = minify
+        self.bundles = BUNDLES if bundles is None else bundles
+        self.files = FILES if files is None else files
+        self.directories = DIRECTORIES if directories is None else directories
+        self.manifest = dict()
+        self.written = set()
+        self.warnings = []
+
+    def read(self, name):
+        """Contents of a file under static_dir."""
+        with open(os.path.join(self.static_dir, name), 'rb') as fh:
+            return fh.read()
+
+    def write(self, name, data):
+        """Write a fingerprinted output file (once) and return its name."""
+        built = fingerprint(os.path.basename(name), data)
+        if built not in self.written:
+            path = os.path.join(self.out_dir, built)
+            if not os.path.exists(path):
+                with open(path, 'wb') as fh:
+                    fh.write(data)
+                precompress(path)
+            self.written.add(built)
+        return built
+
+    def file(self, name):
+        """A single file, fingerprinted."""
+        built = self.write(name, self.read(name))
+        self.manifest[name] = built
+        return built
+
+    def rebase_css(self, name, css):
+        """Fingerprint the files name's CSS refers to and point at them."""
+        base = dirname(name)
+
+        def rewrite(match):
+            quote, url = match.group(1), match.group(2).strip()
+            if not relative_url(url):
+                return match.group(0)
+            path, suffix = split_url(url)
+            target = normpath(urljoin_path(base, path))
+            if not os.path.isfile(os.path.join(self.static_dir, target)):
+                self.warnings.append('%s refers to missing %s' % (name, target))
+                return match.group(0)
+            return 'url(%s%s%s%s)' % (quote, self.write(target, self.read(target)), suffix, quote)
+
+        return _CSS_URL.sub(rewrite, css)
+
+    def bundle(self, name, sources):
+        """Concatenate (and minify) sources into one fingerprinted file."""
+        is_css = name.endswith('.css')
+        parts = []
+        for source in sources:
+            text = self.read(source).decode('utf-8')
+            if is_css:
+                text = self.rebase_css(source, text)
+            if self.minify and '.min.' not in os.path.basename(source):
+                text = minify_css(text) if is_css else minify_js(text)
+            parts.append(text)
+
+        if is_css:
+            # @import only works at the top of a stylesheet
+            text = '\n'.join(_CSS_CHARSET.sub('', p) for p in parts)
+            imports = _CSS_IMPORT.findall(text)
+            text = '\n'.join(imports + [_CSS_IMPORT.sub('', text)])
+        else:
+            # A file without a trailing semicolon must not run into the next
+            text = '\n;\n'.join(parts)
+
+        built = self.write(name, text.encode('utf-8'))
+        self.manifest[name] = built
+        return built
+
+    def directory(self, name, skip=()):
+        """Copy a whole tree to a fingerprinted directory."""
+        root = os.path.join(self.static_dir, name)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            dirnames[:] = sorted(d for d in dirnames if not (rel_dir == '.' and d in skip))
+            files.extend(os.path.normpath(os.path.join(rel_dir, f)) for f in sorted(filenames))
+
+        digest = hashlib.sha256()
+        for rel in files:
+            digest.update(rel.encode('utf-8') + b'\0')
+            with open(os.path.join(root, rel), 'rb') as fh:
+                digest.update(hashlib.sha256(fh.read()).digest())
+        built = '%s.%s' % (name, digest.hexdigest()[:HASH_LENGTH])
+
+        target = os.path.join(self.out_dir, built)
+        if not os.path.isdir(target):
+            staging = target + '.tmp'
+            shutil.rmtree(staging, ignore_errors=True)
+            for rel in files:
+                os.makedirs(os.path.dirname(os.path.join(staging, rel)), exist_ok=True)
+                shutil.copyfile(os.path.join(root, rel), os.path.join(staging, rel))
+                precompress(os.path.join(staging, rel))
+            os.rename(staging, target)
+        self.written.add(built)
+        self.manifest[name + '/'] = built + '/'
+        return built
+
+    def missing_vendor(self, sources):
+        """The vendor files in sources we don't have (see fetch_vendor)."""
+        return [s for s in sources if s.startswith(VENDOR_DIR + '/') and not os.path.isfile(os.path.join(self.static_dir, s))]
+
+    def build(self):
+        """Build everything and write the manifest. Returns the manifest."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        for name, sources in self.bundles.items():
+            missing = self.missing_vendor(sources)
+            if missing:
+                # Left out of the manifest, so pages load the sources (or their CDN copies)
+                self.warnings.append('Skipped %s: missing %s (try --fetch)' % (name, ', '.join(missing)))
+                continue
+            self.bundle(name, sources)
+        for name in self.files:
+            self.file(name)
+        for name, skip in self.directories.items():
+            self.directory(name, skip)
+
+        manifest = {'built': datetime.now().isoformat(), 'files': self.manifest}
+        tmp = os.path.join(self.out_dir, MANIFEST + '.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        os.replace(tmp, os.path.join(self.out_dir, MANIFEST))
+        return manifest
+
+    def clean(self):
+        """Remove anything in out_dir the last build didn't write. Returns the names."""
+        removed = []
+        keep = self.written | {MANIFEST}
+        for name in sorted(os.listdir(self.out_dir)):
+            base = name[:-3] if name.endswith(('.gz', '.br')) else name
+            if base in keep:
+                continue
+            path = os.path.join(self.out_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            removed.append(name)
+        return removed
+
+
+def fetch_vendor(static_dir, http, timeout=30):
+    """Download missing VENDOR files (and what their CSS refers to). Returns the paths written."""
+    fetched = []
+    todo = sorted(VENDOR.items())
+    seen = set()
+    while todo:
+        rel, url = todo.pop(0)
+        if rel in seen:
+            continue
+        seen.add(rel)
+        path = os.path.join(static_dir, VENDOR_DIR, rel)
+        if not os.path.exists(path):
+            resp = http.get(url, timeout=timeout)
+            resp.raise_for_status()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(resp.content)
+            fetched.append(rel)
+        if rel.endswith('.css'):
+            with open(path, encoding='utf-8') as fh:
+                css = fh.read()
+            for match in _CSS_URL.finditer(css):
+                ref = match.group(2).strip()
+                if relative_url(ref):
+                    ref_path, _ = split_url(ref)
+                    todo.append((normpath(urljoin_path(dirname(rel), ref_path)), urljoin(url, ref_path)))
+    return fetched
+
+
+def load_manifest(out_dir):
+    """The built name for every asset (empty if there's no build)."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as fh:
+            return json.load(fh).get('files', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _static_url(name):
+    """URL for an unbuilt asset: the original file, or the CDN for unfetched vendor files."""
+    path = os.path.join(current_app.static_folder, name)
+    vendor = name[len(VENDOR_DIR) + 1:] if name.startswith(VENDOR_DIR + '/') else None
+    if vendor in VENDOR and not os.path.isfile(path):
+        return VENDOR[vendor]
+    if os.path.isfile(path):
+        # Not fingerprinted, so make sure a changed file isn't read from cache
+        return url_for('static', filename=name, v=int(os.path.getmtime(path)))
+    return url_for('static', filename=name)
+
+
+def asset_url(name):
+    """URL for a file under static (or a directory, ending in /)."""
+    manifest = _manifest or {}
+    built = manifest.get(name, None)
+    if built is None:
+        for prefix, built_prefix in manifest.items():
+            if prefix.endswith('/') and name.startswith(prefix):
+                built = built_prefix + name[len(prefix):]
+                break
+    if built is None:
+        return _static_url(name)
+    return url_for('assets.asset', filename=built)
+
+
+def asset_urls(name):
+    """URLs to load for a bundle: the built bundle, or all its sources."""
+    if _manifest and name in _manifest:
+        return [url_for('assets.asset', filename=_manifest[name])]
+    return [_static_url(source) for source in BUNDLES[name]]
+
+
+def init_app(app):
+    """Read the manifest and give templates asset_url and asset_urls."""
+    global _manifest
+    out_dir = asset_dir(app)
+    _manifest = load_manifest(out_dir) if out_dir else {}
+    if out_dir and not _manifest:
+        app_logger().info("No built assets in %s - serving the original files (see ./tools assets)", out_dir)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
+
+
+@assets.route('/assets/<path:filename>')
+def asset(filename):
+    """A built file, precompressed if the browser takes it, cached forever."""
+    out_dir = asset_dir()
+    if not out_dir or filename == MANIFEST or not safe_join(out_dir, filename):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, served = None, filename
+    for name, ext in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(safe_join(out_dir, filename + ext)):
+            encoding, served = name, filename + ext
+            break
+
+    max_age = current_app.config.get('ASSET_MAX_AGE', DEFAULT_ASSET_MAX_AGE)
+    resp = send_from_directory(out_dir, served, mimetype=mimetype, max_age=max_age)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
@@ -24,6 +24,7 @@
     :license: BSD-3-Clause
 """
 import warnings
+from collections.abc import Iterator
 from datetime import datetime
 
 from werkzeug.utils import escape
@@ -102,7 +103,11 @@ class AtomFeed(object):
                       you don't want to specify one of them, set the item
                       to `None`.
     :param entries: a list with the entries for the feed. Entries can also
-                    be added later with :meth:`add`.
+                    be added later with :meth:`add`.  An iterator (like a
+                    generator of :class:`FeedEntry`) is left alone and only
+                    consumed by :meth:`generate`, so entries are built as
+                    the feed is streamed: pass `updated` with one, or the
+                    whole thing is read up front to find it.
 
     For more information on the elements see
     http://www.atomenabled.org/developers/syndication/
@@ -130,7 +135,10 @@ class AtomFeed(object):
         if self.generator is None:
             self.generator = self.default_generator
         self.links = kwargs.get("links", [])
-        self.entries = list(entries) if entries else []
+        if isinstance(entries, Iterator):
+            self.entries = entries
+        else:
+            self.entries = list(entries) if entries else []
 
         if not hasattr(self.author, "__iter__") or isinstance(
             self.author, (str, dict)
@@ -153,6 +161,8 @@ class AtomFeed(object):
         with a :class:`FeedEntry` or some keyword and positional arguments
         that are forwarded to the :class:`FeedEntry` constructor.
         """
+        if isinstance(self.entries, Iterator):
+            self.entries = list(self.entries)
         if len(args) == 1 and not kwargs and isinstance(args[0], FeedEntry):
             self.entries.append(args[0])
         else:
@@ -160,6 +170,8 @@ class AtomFeed(object):
             self.entries.append(FeedEntry(*args, **kwargs))
 
     def __repr__(self):
+        if isinstance(self.entries, Iterator):
+            return "<%s %r (streamed entries)>" % (self.__class__.__name__, self.title)
         return "<%s %r (%d entries)>" % (
             self.__class__.__name__,
             self.title,
@@ -168,6 +180,10 @@ class AtomFeed(object):
 
     def generate(self):
         """Return a generator that yields pieces of XML."""
+        # we need to look at every entry: give up on streaming them
+        if isinstance(self.entries, Iterator) and (not self.author or not self.updated):
+            self.entries = list(self.entries)
+
         # atom demands either an author element in every entry or a global one
         if not self.author:
             if any(not e.author for e in self.entries):
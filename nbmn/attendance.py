@@ -0,0 +1,143 @@
+"""attendance - who came to which night, as an indexed table.
+
+Night.attendees is a list inside the night's JSON, so "how many nights has
+Ann been to, and when was the last one" meant loading every night. For the
+SQL backends we keep one NightAttendees row per (night, attendee), indexed on
+(key, datestr), the same way catalog keeps its posting lists. The key is the
+lower cased, stripped name, matching Night.has_attendee.
+
+The table is rewritten every time a Night is saved or deleted (see
+dbhook.on_write) and rebuilt by the schema migration. Other backends fall
+back to scanning the nights.
+"""
+
+# pylama:ignore=E501,D213
+
+import time
+from collections import namedtuple
+
+from . import rawsql
+from .dbhook import current_trace, on_write
+from .log import app_logger
+from .model import Night
+
+TABLE = 'NightAttendees'
+
+DDL = [
+    '''create table if not exists %s (
+        night_id text not null,
+        key text not null,
+        datestr text not null,
+        primary key (night_id, key)
+    )''' % TABLE,
+    'create index if not exists %s_key on %s (key, datestr)' % (TABLE, TABLE),
+]
+
+# One person's attendance: count is the number of nights, last is the newest
+# Night (None if they've never been)
+Attended = namedtuple('Attended', ['count', 'last'])
+
+# What we record in the request trace for the counts: the id changes with
+# the count, so the page's ETag does too
+_Counted = namedtuple('_Counted', ['id'])
+
+
+def available():
+    """True if the night database can hold the attendance table."""
+    return rawsql.dialect(Night) is not None
+
+
+def ensure_tables():
+    """Create the attendance table and index if they're missing."""
+    rawsql.execute_all(Night, [(sql, ()) for sql in DDL])
+
+
+def name_key(name):
+    """Lookup key for an attendee name."""
+    return str(name).strip().lower()
+
+
+def project(night):
+    """Replace the attendance rows for a saved Night (in one transaction)."""
+    stmts = [('delete from %s where night_id = ?' % TABLE, (night.id,))]
+    for key in sorted(set(name_key(a) for a in night.attendees if name_key(a))):
+        stmts.append(('insert into %s (night_id, key, datestr) values (?, ?, ?)' % TABLE, (night.id, key, night.datestr)))
+    rawsql.execute_all(Night, stmts)
+
+
+def remove(night_id):
+    """Delete the attendance rows for a Night id."""
+    rawsql.execute(Night, 'delete from %s where night_id = ?' % TABLE, (night_id,))
+
+
+def rebuild():
+    """Recreate the whole table from the nights, returning the night count."""
+    ensure_tables()
+    rawsql.execute(Night, 'delete from %s' % TABLE)
+    count = 0
+    for night in Night.find_all():
+        project(night)
+        count += 1
+    return count
+
+
+def _scan(keys):
+    found = dict((k, []) for k in keys)
+    for night in Night.find_all():
+        for key in set(name_key(a) for a in night.attendees):
+            if key in found:
+                found[key].append(night)
+    return dict((k, Attended(len(ns), max(ns, key=lambda n: n.datestr) if ns else None)) for k, ns in found.items())
+
+
+def attended(names):
+    """Dict of name -> Attended for each of names.
+
+    The cost depends on how many names you ask about, not how many nights
+    there are: one grouped query on the index and one load of the newest
+    night for each person.
+    """
+    keys = dict((name, name_key(name)) for name in names)
+    if not available():
+        found = _scan(set(keys.values()))
+        return dict((name, found[key]) for name, key in keys.items())
+
+    wanted = sorted(set(keys.values()))
+    if not wanted:
+        return {}
+
+    start = time.perf_counter()
+    sql = 'select key, count(*), max(datestr) from %s where key in (%s) group by key' % (TABLE, ', '.join('?' * len(wanted)))
+    counts = dict((r[0], (int(r[1]), r[2])) for r in rawsql.query(Night, sql, wanted))
+    nights = rawsql.find_in(Night, 'index_datestr', sorted(set(d for _, d in counts.values())))
+
+    # Raw SQL skips dbhook, so record it ourselves (the ETag depends on it)
+    trace = current_trace()
+    if trace is not None:
+        secs = time.perf_counter() - start
+        trace.record('attended', TABLE, 'key', [_Counted('%s:%d:%s' % (k, c, d)) for k, (c, d) in counts.items()], secs)
+        trace.record('find_in', Night.get_table_name(), 'index_datestr', nights, 0.0)
+
+    result = {}
+    for name, key in keys.items():
+        if key not in counts:
+            result[name] = Attended(0, None)
+            continue
+        count, datestr = counts[key]
+        # Two nights can share a date: take one this person was at
+        last = [n for n in nights if n.datestr == datestr and n.has_attendee(name)]
+        result[name] = Attended(count, last[0] if last else None)
+    return result
+
+
+@on_write
+def night_written(op, obj):
+    """Keep the attendance table in step with Night saves and deletes."""
+    # Exactly Night: not the tools' copy-out class
+    if type(obj) is not Night or not available():
+        return
+    if op == 'delete':
+        remove(obj.id)
+    else:
+        project(obj)
+    app_logger().debug("Attendance %s for night %s", op, obj.id)
@@ -1,4 +1,9 @@
-"""Authentication Flask Blueprint for login functionality in our app."""
+"""Authorization helpers for our app.
+
+The Google login blueprint itself lives in oauth.py, which is only imported
+when GOOGLE_AUTH is on. When it's off we register no_login instead, so the
+auth.login and auth.logout endpoints always exist.
+"""
 
 import os
 import sys
@@ -6,20 +11,7 @@ import traceback
 
 from functools import wraps
 
-from flask import redirect, request, flash, abort, g, url_for
-
-try:
-    from flask import _app_ctx_stack as stack
-except ImportError:
-    from flask import _request_ctx_stack as stack
-
-from flask_dance.consumer import (
-    OAuth2Session,
-    OAuth2ConsumerBlueprint,
-    oauth_authorized,
-    oauth_error
-)
-from urlobject import URLObject
+from flask import Blueprint, redirect, request, flash, abort, g, url_for
 
 from gludb.utils import now_field
 
@@ -27,6 +19,10 @@ from .log import app_logger
 from .model import User
 
 
+# Stand-in for the oauth blueprint when GOOGLE_AUTH is off
+no_login = Blueprint('auth', __name__)
+
+
 class NotAuthorized(Exception):
     """Simple helper exception for unauthorized users."""
 
@@ -45,7 +41,7 @@ def require_login(func):
     Used on functions decorated with flask route: make sure that it's LAST
     in the decorator list so that the flask magic happens.
 
-    Important: we are assuming the blueprint endpoint auth.login exists
+    auth.login always exists: main registers oauth.auth or no_login
     """
     @wraps(func)
     def wrapper(*args, **kwrds):
@@ -91,62 +87,6 @@ def require_login(func):
     return wrapper
 
 
-class CustomOAuth2Session(OAuth2Session):
-    """This hacky class is here because for whatever reason the Proxy fix for
-    Flask isn't working with flask_dance. Ugh, should have just written my own
-    to start.
-    """
-    def __init__(self, blueprint=None, base_url=None, *args, **kwargs):
-        self._redirect_uri = kwargs.get('redirect_uri', None)
-        super().__init__(*args, **kwargs)
-        self.blueprint = blueprint
-        self.base_url = URLObject(base_url)
-        if getattr(self, "token"):
-            del self.token
-
-    @property
-    def redirect_uri(self):
-        return self._redirect_uri
-
-    @redirect_uri.setter
-    def redirect_uri(self, url):
-        new_uri = (url or '')
-        if not ('localhost' in new_uri or '127.0.0' in new_uri):
-            new_uri = new_uri.replace("http:", "https:")
-        if new_uri != self._redirect_uri:
-            app_logger().debug("oauth2 redirect_uri changing from %s to %s", self._redirect_uri, new_uri)
-        self._redirect_uri = new_uri
-
-
-# Make the google blueprint (taken from their contrib code)
-auth = OAuth2ConsumerBlueprint(
-    "auth",
-    __name__,
-    client_id=None,  # Handled via app config
-    client_secret=None,  # Handled via app config
-    scope=["https://www.googleapis.com/auth/userinfo.profile", "https://www.googleapis.com/auth/userinfo.email"],
-    base_url="https://www.googleapis.com/",
-    authorization_url="https://accounts.google.com/o/oauth2/auth",
-    token_url="https://accounts.google.com/o/oauth2/token",
-    redirect_url=None,
-    redirect_to=None,
-    login_url=None,
-    authorized_url=None,
-    authorization_url_params={},
-    session_class=CustomOAuth2Session,
-)
-
-auth.from_config["client_id"] = "GOOGLE_CLIENT_ID"
-auth.from_config["client_secret"] = "GOOGLE_CLIENT_SECRET"
-
-
-@auth.before_app_request
-def set_applocal_session():
-    """Make sure we can see the google oauth in the session."""
-    ctx = stack.top
-    ctx.google_oauth = auth.session
-
-
 def login_fail(msg):
     """Show and log login failure."""
     flash(msg, category="error")
@@ -154,60 +94,23 @@ def login_fail(msg):
     return False
 
 
-@oauth_authorized.connect
-def log_in_event(blueprint, token):
-    """create/login local user on successful OAuth login."""
-    User.set_user_session()  # Clear previous session
-
-    if not token:
-        return login_fail("Failed to log in")
-
-    app_logger().debug("getting userinfo from Google")
-    resp = blueprint.session.get("/oauth2/v1/userinfo")
-    if not resp.ok:
-        return login_fail("Failed to login user!")
-
-    app_logger().debug("recvd userinfo from Google - parsing")
-    data = resp.json()
-
-    email = data.get('email', '')
-    if not email:
-        return login_fail("Google failed to supply an email address")
-
-    app_logger().debug("looking for userinfo email %s", email)
-    users = User.find_by_index('index_email', email)
-    if users:
-        user = users[0]  # Always first found
-    else:
-        user = User(email=email)
-
-    # Update the user info and save the session info
-    app_logger().debug("Updating db with user %s info", email)
-    user.name = data.get('name', email)
-    user.photo = data.get('picture', '/static/anonymous_person.png')
-    user.logins.append(now_field())
-    user.save()
-
-    User.set_user_session(user.id)
-    app_logger().info("Logged in user id %s, email %s" % (user.id, user.email))
-    flash("You are logged in as " + user.name, category='info')
-
-
-# notify on OAuth provider error
-@oauth_error.connect
-def google_error(blueprint, error, error_description=None, error_uri=None):
-    """Handle any errors seen by flask-dance."""
-    login_fail("OAuth login failure: [%s] %s (uri=%s)" % (
-        error, error_description, error_uri
-    ))
-
-
-@auth.route('/logout')
-def logout():
-    """Logout the current user."""
+def logout_redirect():
+    """Log out the current user and redirect back to where they were."""
     User.set_user_session()
     redir_url = request.args.get("redir", None)
     if not redir_url:
         redir_url = '/'
     flash('You are logged out', category='info')
     return redirect(redir_url)
+
+
+@no_login.route('/login')
+def login():
+    """There's no login with GOOGLE_AUTH off."""
+    abort(403)
+
+
+@no_login.route('/logout')
+def logout():
+    """Logout the current user (a DEBUG_EMAIL login, say)."""
+    return logout_redirect()
@@ -0,0 +1,69 @@
+"""background - run work off the request thread.
+
+submit hands a function to a small thread pool (BACKGROUND_WORKERS threads,
+created on first use). The function runs inside an app context for the app
+that submitted it, and any exception is logged rather than lost. Tasks
+submitted with a key are dropped while an earlier task with the same key is
+still queued or running, so a burst of saves only warms things once.
+
+With BACKGROUND_WORKERS=0 tasks just run in the calling thread, which is what
+you want for tests and the tools.
+"""
+
+# pylama:ignore=E501,D213
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from . import metrics
+from .log import app_logger
+
+DEFAULT_BACKGROUND_WORKERS = 2
+
+metrics.register('nbmn_background_tasks_total', 'counter', 'Background tasks by task name and result')
+
+_executor = None
+_lock = threading.Lock()
+_pending = set()
+
+
+def _get_executor(workers):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nbmn-bg')
+        return _executor
+
+
+def _run(app, key, func, args, kwrds):
+    name = getattr(func, '__name__', 'task')
+    try:
+        with app.app_context():
+            func(*args, **kwrds)
+        metrics.inc('nbmn_background_tasks_total', (('task', name), ('result', 'ok')))
+    except Exception:
+        metrics.inc('nbmn_background_tasks_total', (('task', name), ('result', 'error')))
+        app_logger().exception("Background task %s failed", name)
+    finally:
+        if key is not None:
+            with _lock:
+                _pending.discard(key)
+
+
+def submit(func, *args, key=None, **kwrds):
+    """Run func(*args, **kwrds) in the background. Returns False if skipped."""
+    if key is not None:
+        with _lock:
+            if key in _pending:
+                return False
+            _pending.add(key)
+
+    app = current_app._get_current_object()
+    workers = app.config.get('BACKGROUND_WORKERS', DEFAULT_BACKGROUND_WORKERS)
+    if workers <= 0:
+        _run(app, key, func, args, kwrds)
+    else:
+        _get_executor(workers).submit(_run, app, key, func, args, kwrds)
+    return True
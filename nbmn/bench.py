@@ -0,0 +1,219 @@
+"""bench - route-level benchmarks against synthetic data.
+
+Run this via `./tools bench`. For each data size we create a fresh sqlite
+database, fill it with synth.populate, and then hit every interesting route
+with the Flask test client. For every route we record latency and the number
+of gludb calls (and rows returned) per request, as reported by dbhook in the
+X-DB-Trace header.
+
+Results are written as JSON. Pass a previous result file with --compare to see
+how a change moved the numbers.
+"""
+
+# pylama:ignore=E501,D213
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+from .synth import imdbid_for, populate
+
+SIZES = {
+    'small':  {'nights': 50,   'movies': 40,   'attendees': 10},
+    'medium': {'nights': 500,  'movies': 400,  'attendees': 40},
+    'large':  {'nights': 2000, 'movies': 1500, 'attendees': 100},
+}
+
+BENCH_CONFIG = """
+BANNER=''
+DEBUG=False
+LOG_SAVES=False
+DB_TRACE=True
+DB_TRACE_HEADER=True
+OMDB_API_KEY='bench-no-remote-calls'
+DB_BACKEND='sqlite'
+SQLITE_FILENAME='%s'
+# Measure the real work: the anonymous page cache would answer every request
+PAGE_CACHE_SIZE=0
+"""
+
+
+def routes(night_datestr):
+    """Return the (name, path) pairs we benchmark."""
+    imdbid = imdbid_for(1)
+    return [
+        ('main',        '/'),
+        ('person_all',  '/person'),
+        ('person_one',  '/person/Adam'),
+        ('night_all',   '/night'),
+        ('night_one',   '/night/' + night_datestr),
+        ('movie_all',   '/movie'),
+        ('movie_one',   '/movie/' + imdbid),
+        ('moviedata',   '/moviedata/' + imdbid),
+        ('gimme',       '/gimme'),
+        ('atom',        '/nights.atom'),
+        ('calendar',    '/calendar'),
+    ]
+
+
+def percentile(samples, pct):
+    """The pct (0-100) percentile of a non-empty list: the closest sample, no interpolation."""
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def db_trace(resp):
+    """Return (calls, rows) from the response's database trace header."""
+    from .dbhook import TRACE_HEADER
+    fields = dict(
+        kv.split('=', 1)
+        for kv in resp.headers.get(TRACE_HEADER, '').split()
+        if '=' in kv
+    )
+    return int(fields.get('calls', 0)), int(fields.get('rows', 0))
+
+
+def bench_route(client, path, repeat):
+    """Time repeat GETs of path - the first (warmup) request isn't counted."""
+    client.get(path)
+
+    times, calls, rows = [], [], []
+    status, size = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        resp = client.get(path)
+        times.append((time.perf_counter() - start) * 1000.0)
+        ncalls, nrows = db_trace(resp)
+        calls.append(ncalls)
+        rows.append(nrows)
+        status, size = resp.status_code, len(resp.get_data())
+
+    return {
+        'path': path,
+        'status': status,
+        'bytes': size,
+        'ms_min': round(min(times), 3),
+        'ms_median': round(statistics.median(times), 3),
+        'ms_mean': round(statistics.mean(times), 3),
+        'ms_p95': round(percentile(times, 95), 3),
+        'db_calls': statistics.median(calls),
+        'db_rows': statistics.median(rows),
+    }
+
+
+def bench_size(main, workdir, name, size, repeat, seed):
+    """Build a database for the given size and benchmark every route."""
+    from .model import Night
+
+    filename = os.path.join(workdir, 'bench-%s.sqlite' % name)
+    app = main.create_app()
+    app.config['SQLITE_FILENAME'] = filename
+    main.database_config(app)
+    logging.getLogger('nbmn').setLevel(logging.WARNING)
+
+    # Speed up the data load - durability doesn't matter for a scratch DB
+    from gludb.config import get_mapping
+    get_mapping(Night).backend._conn().execute('pragma synchronous=off')
+
+    start = time.perf_counter()
+    counts = populate(seed=seed, **size)
+    load_secs = time.perf_counter() - start
+
+    night_datestr = Night.str_from_date(datetime.now())
+    client = app.test_client()
+    results = dict()
+    for route_name, path in routes(night_datestr):
+        results[route_name] = bench_route(client, path, repeat)
+        print('  %-8s %-11s %9.2fms median %5d db calls  [%d]' % (
+            name, route_name,
+            results[route_name]['ms_median'],
+            results[route_name]['db_calls'],
+            results[route_name]['status'],
+        ))
+
+    return {
+        'size': counts,
+        'load_secs': round(load_secs, 3),
+        'routes': results,
+    }
+
+
+def compare(baseline, current):
+    """Print a comparison of current results against a baseline."""
+    print('')
+    print('%-8s %-11s %10s %10s %8s %12s' % ('Size', 'Route', 'Base ms', 'Now ms', 'Change', 'DB calls'))
+    for size_name, size_res in sorted(current['results'].items()):
+        base_size = baseline.get('results', {}).get(size_name, {})
+        for route_name, now in sorted(size_res['routes'].items()):
+            base = base_size.get('routes', {}).get(route_name)
+            if not base:
+                print('%-8s %-11s %10s %10.2f' % (size_name, route_name, '-', now['ms_median']))
+                continue
+            change = (now['ms_median'] - base['ms_median']) / (base['ms_median'] or 1.0)
+            print('%-8s %-11s %10.2f %10.2f %+7.1f%% %5d -> %-5d' % (
+                size_name, route_name,
+                base['ms_median'], now['ms_median'], change * 100.0,
+                base['db_calls'], now['db_calls'],
+            ))
+
+
+def main(opts):
+    """Entry point for the tools command."""
+    parser = argparse.ArgumentParser(prog='tools bench', description='Route-level benchmarks on synthetic data')
+    parser.add_argument('--sizes', default='small,medium', help='Comma-delimited sizes from: ' + ','.join(sorted(SIZES)))
+    parser.add_argument('--repeat', default=10, type=int, help='Timed requests per route')
+    parser.add_argument('--seed', default=42, type=int, help='Seed for the synthetic data')
+    parser.add_argument('--output', default='bench-baseline.json', help='Where to write JSON results')
+    parser.add_argument('--compare', default='', help='Previous JSON results to compare against')
+    args = parser.parse_args(opts)
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    for s in sizes:
+        if s not in SIZES:
+            print('Unknown size %s' % s)
+            return 1
+
+    workdir = tempfile.mkdtemp(prefix='nbmn-bench-')
+    try:
+        cfg_file = os.path.join(workdir, 'bench.config')
+        with open(cfg_file, 'w') as fh:
+            fh.write(BENCH_CONFIG % os.path.join(workdir, 'unused.sqlite'))
+        os.environ['NBMN_CONFIG'] = cfg_file
+
+        import main
+
+        output = {
+            'meta': {
+                'when': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'repeat': args.repeat,
+            },
+            'results': dict(),
+        }
+        for name in sizes:
+            print('Benchmarking %s: %s' % (name, SIZES[name]))
+            output['results'][name] = bench_size(main, workdir, name, SIZES[name], args.repeat, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as fh:
+        json.dump(output, fh, indent=2, sort_keys=True)
+    print('Results written to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), output)
+
+    sys.stdout.flush()
+    return 0
@@ -0,0 +1,126 @@
+"""cache - small in-process caches.
+
+Like log, this module doesn't import anything else from nbmn so anyone can
+use it. Named caches are listed in CACHES so /metrics can report on them.
+"""
+
+# pylama:ignore=E501,D213
+
+import threading
+from collections import OrderedDict
+
+# name -> cache
+CACHES = dict()
+
+
+class LRUCache(object):
+    """Thread-safe least-recently-used cache holding at most maxsize items.
+
+    A maxsize of 0 (or less) turns the cache off: set does nothing, so every
+    get misses.
+    """
+
+    def __init__(self, maxsize, name=None):
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if name:
+            CACHES[name] = self
+
+    def __len__(self):
+        """Number of items currently cached."""
+        return len(self.data)
+
+    def get(self, key, default=None):
+        """Return the cached value for key (or default)."""
+        with self.lock:
+            try:
+                val = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def set(self, key, value):
+        """Cache value for key, evicting the oldest entries if needed."""
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Forget key (if it's there)."""
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        """Forget everything."""
+        with self.lock:
+            self.data.clear()
+
+    def resize(self, maxsize):
+        """Change maxsize, dropping the oldest entries if we shrink."""
+        with self.lock:
+            self.maxsize = maxsize
+            while self.data and len(self.data) > max(maxsize, 0):
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls for the same key.
+
+    The first caller for a key runs the function. Anyone asking for the same
+    key while that's still running waits and gets the same result (or
+    exception) instead of doing the work again.
+    """
+
+    def __init__(self):
+        """Nothing in flight."""
+        self.lock = threading.Lock()
+        self.calls = dict()
+        self.shared = 0
+
+    def do(self, key, func):
+        """Return func(), sharing the call with anyone else asking for key."""
+        with self.lock:
+            call = self.calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
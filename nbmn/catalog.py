@@ -0,0 +1,277 @@
+"""catalog - typed, indexed copy of the OMDB movie data.
+
+Movie.extdata is a JSON blob inside a gludb record, so filtering movies on
+year, rating, genre or director means loading and parsing every movie. For
+the SQL backends (sqlite and postgresql) we also project the normalized OMDB
+fields (see remote._norm_omdb_resp) into real tables in the same database:
+
+    MovieCatalog    one row per movie: imdbid, title, year, rating, ...
+    MovieGenres     one row per (movie, genre)
+    MovieDirectors  one row per (movie, director)
+    MovieActors     one row per (movie, actor)
+    MovieWriters    one row per (movie, writer)
+
+The child tables have a lower-cased `key` column (writers lose their credit,
+so "Jonathan Nolan (screenplay)" has the key "jonathan nolan") and are indexed
+on (key, movie_id) for lookups.
+
+extdata stays the source of truth: the catalog is rewritten every time a Movie
+is saved (see dbhook.on_write), can be rebuilt at any time with `./tools
+catalog --rebuild`, and nothing is ever written back from it. Other backends
+just don't get a catalog - check available() first.
+
+find_movies answers the /movie filters: each filter is a posting list (the
+movie ids for one genre, director, year...) and we intersect them in SQL.
+Without a catalog it falls back to scanning every movie.
+"""
+
+# pylama:ignore=E501,D213
+
+import re
+import time
+
+from . import rawsql
+from .dbhook import current_trace, on_write
+from .log import app_logger
+from .model import Movie, Night
+
+TABLE = 'MovieCatalog'
+
+# filter name -> (child table, OMDB field)
+CHILDREN = {
+    'genre':    ('MovieGenres',    'Genre'),
+    'director': ('MovieDirectors', 'Director'),
+    'actor':    ('MovieActors',    'Actors'),
+    'writer':   ('MovieWriters',   'Writer'),
+}
+
+# Query string filters for find_movies
+FILTERS = ('genre', 'director', 'actor', 'writer', 'year')
+
+COLUMNS = ('movie_id', 'imdbid', 'title', 'year', 'rating', 'votes', 'metascore', 'runtime', 'rated', 'stamp')
+
+DDL = [
+    '''create table if not exists %s (
+        movie_id text primary key,
+        imdbid text,
+        title text,
+        year integer,
+        rating double precision,
+        votes integer,
+        metascore integer,
+        runtime integer,
+        rated text,
+        stamp text
+    )''' % TABLE,
+    'create index if not exists %s_imdbid on %s (imdbid)' % (TABLE, TABLE),
+    'create index if not exists %s_year on %s (year)' % (TABLE, TABLE),
+    'create index if not exists %s_rating on %s (rating)' % (TABLE, TABLE),
+]
+for _table, _ in CHILDREN.values():
+    DDL.extend([
+        '''create table if not exists %s (
+            movie_id text not null,
+            key text not null,
+            name text not null,
+            position integer not null,
+            primary key (movie_id, key)
+        )''' % _table,
+        'create index if not exists %s_key on %s (key, movie_id)' % (_table, _table),
+    ])
+
+_CREDIT = re.compile(r'\s*\(.*\)\s*$')
+
+
+def available():
+    """True if the movie database can hold a catalog."""
+    return rawsql.dialect(Movie) is not None
+
+
+def ensure_tables():
+    """Create the catalog tables and indexes if they're missing."""
+    rawsql.execute_all(Movie, [(sql, ()) for sql in DDL])
+
+
+def name_key(name):
+    """Lookup key for a genre/person name."""
+    return _CREDIT.sub('', str(name)).strip().lower()
+
+
+def _int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(v):
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v  # No NaN's
+
+
+def _runtime(v):
+    m = re.match(r'\s*(\d+)', str(v or ''))
+    return int(m.group(1)) if m else None
+
+
+def _text(v):
+    v = str(v or '').strip()
+    return '' if v.upper() == 'N/A' else v
+
+
+def row(movie, stamp=None):
+    """Catalog row (a dict keyed by COLUMNS) for a Movie."""
+    omdb = (movie.extdata or {}).get('omdb', {}) or {}
+    return {
+        'movie_id':  movie.id,
+        'imdbid':    movie.imdbid,
+        'title':     movie.name,
+        'year':      _int(omdb.get('Year')),
+        'rating':    _float(omdb.get('imdbRating')),
+        'votes':     _int(omdb.get('imdbVotes')),
+        'metascore': _int(omdb.get('Metascore')),
+        'runtime':   _runtime(omdb.get('Runtime')),
+        'rated':     _text(omdb.get('Rated')),
+        'stamp':     stamp or movie.stamp or '',
+    }
+
+
+def names(movie, field):
+    """(key, name) pairs for an OMDB list field, in order and without dups."""
+    omdb = (movie.extdata or {}).get('omdb', {}) or {}
+    values = omdb.get(field, [])
+    if not isinstance(values, list):
+        values = str(values).split(',')
+
+    seen = set()
+    result = []
+    for name in values:
+        name = _text(name)
+        key = name_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            result.append((key, name))
+    return result
+
+
+def _delete_statements(movie_id):
+    stmts = [('delete from %s where movie_id = ?' % TABLE, (movie_id,))]
+    for table, _ in CHILDREN.values():
+        stmts.append(('delete from %s where movie_id = ?' % table, (movie_id,)))
+    return stmts
+
+
+def project(movie, stamp=None):
+    """Replace the catalog rows for a saved Movie (in one transaction)."""
+    data = row(movie, stamp)
+    stmts = _delete_statements(movie.id)
+    stmts.append((
+        'insert into %s (%s) values (%s)' % (TABLE, ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+        tuple(data[c] for c in COLUMNS)
+    ))
+    for table, field in CHILDREN.values():
+        for pos, (key, name) in enumerate(names(movie, field)):
+            stmts.append((
+                'insert into %s (movie_id, key, name, position) values (?, ?, ?, ?)' % table,
+                (movie.id, key, name, pos)
+            ))
+    rawsql.execute_all(Movie, stmts)
+
+
+def remove(movie_id):
+    """Delete the catalog rows for a Movie id."""
+    rawsql.execute_all(Movie, _delete_statements(movie_id))
+
+
+def rebuild():
+    """Recreate the whole catalog from the movies, returning the count."""
+    ensure_tables()
+    rawsql.execute_all(Movie, [('delete from %s' % t, ()) for t in [TABLE] + [c[0] for c in CHILDREN.values()]])
+    count = 0
+    for movie in Movie.find_all():
+        project(movie)
+        count += 1
+    return count
+
+
+def parse_filters(args):
+    """The non-empty FILTERS in args (e.g. request.args) as a dict."""
+    return dict((k, args[k].strip()) for k in FILTERS if args.get(k, '').strip())
+
+
+def _matches(movie, filters):
+    for name, value in filters.items():
+        if name == 'year':
+            year = _int(value)
+            if year is None or year != row(movie)['year']:
+                return False
+        elif name_key(value) not in dict(names(movie, CHILDREN[name][1])):
+            return False
+    return True
+
+
+def _traced_find_in(cls, column, values):
+    """rawsql.find_in, recorded in the request trace (the ETag depends on it)."""
+    start = time.perf_counter()
+    objs = rawsql.find_in(cls, column, values)
+    trace = current_trace()
+    if trace is not None:
+        trace.record('find_in', cls.get_table_name(), column, objs, time.perf_counter() - start)
+    return objs
+
+
+def find_movies(filters):
+    """Movies matching every filter (see parse_filters), ordered by title."""
+    if not available():
+        found = [m for m in Movie.find_all() if _matches(m, filters)]
+        return sorted(found, key=lambda m: (m.name, m.id))
+
+    postings, params = [], []
+    for name, value in sorted(filters.items()):
+        if name == 'year':
+            year = _int(value)
+            if year is None:
+                return []
+            postings.append('select movie_id from %s where year = ?' % TABLE)
+            params.append(year)
+        else:
+            postings.append('select movie_id from %s where key = ?' % CHILDREN[name][0])
+            params.append(name_key(value))
+    if not postings:
+        return []
+
+    sql = 'select movie_id from %s where movie_id in (%s) order by title, movie_id' % (TABLE, ' intersect '.join(postings))
+    ids = [r[0] for r in rawsql.query(Movie, sql, params)]
+    movies = dict((m.id, m) for m in _traced_find_in(Movie, 'id', ids))
+    return [movies[i] for i in ids if i in movies]
+
+
+def nights_for(movies):
+    """Dict of imdbid -> nights showing that movie, newest first."""
+    imdbids = sorted(set(m.imdbid for m in movies if m.imdbid))
+    if available():
+        nights = _traced_find_in(Night, 'index_imdbid', imdbids)
+    else:
+        nights = [n for i in imdbids for n in Night.find_by_index('index_imdbid', i)]
+
+    shown = dict((i, []) for i in imdbids)
+    for night in sorted(nights, key=lambda n: n.datestr, reverse=True):
+        shown.setdefault(night.imdbid, []).append(night)
+    return shown
+
+
+@on_write
+def movie_written(op, obj):
+    """Keep the catalog in step with Movie saves and deletes."""
+    # Exactly Movie: not MovieOverride, and not the tools' copy-out classes
+    if type(obj) is not Movie or not available():
+        return
+    if op == 'delete':
+        remove(obj.id)
+    else:
+        # gludb just set _last_update to the stamp it stored
+        project(obj, getattr(obj, '_last_update', None))
+    app_logger().debug("Catalog %s for movie %s", op, obj.id)
@@ -0,0 +1,159 @@
+"""complete - movie title completion for the night editor.
+
+We keep an in-memory prefix index over the movie titles: a sorted list of
+(key, rank, name, imdbid, movie id) entries, searched with bisect. Each movie
+gets an entry for its normalized title (lower case, no accents or
+punctuation), one without a leading "the", "a" or "an", and one for every
+later word, so "knight" finds "The Dark Knight". Title matches (rank 0) come
+before word matches (rank 1).
+
+The index is built from the movies the first time someone asks for it, and
+after that kept current by a dbhook.on_write listener. Other processes don't
+see our writes, so each one keeps its own index: call reset() to have it
+rebuilt on the next lookup.
+"""
+
+# pylama:ignore=E501,D213
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from .dbhook import on_write
+from .model import Movie
+
+DEFAULT_COMPLETE_LIMIT = 10
+
+ARTICLES = ('the ', 'a ', 'an ')
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(title):
+    """Lower case, ASCII only, words separated by single spaces."""
+    title = unicodedata.normalize('NFKD', str(title or ''))
+    title = title.encode('ascii', 'ignore').decode('ascii').lower()
+    return _NON_WORD.sub(' ', title).strip()
+
+
+def title_keys(title):
+    """(key, rank) pairs to index a title under."""
+    norm = normalize(title)
+    if not norm:
+        return []
+    keys = dict()
+    words = norm.split(' ')
+    for i in range(1, len(words)):
+        keys[' '.join(words[i:])] = 1
+    keys[norm] = 0
+    for article in ARTICLES:
+        if norm.startswith(article):
+            keys[norm[len(article):]] = 0
+            break
+    return sorted(keys.items())
+
+
+class PrefixIndex(object):
+    """Sorted array prefix index from title keys to movies."""
+
+    def __init__(self):
+        """Start empty."""
+        self.entries = []
+        self.by_id = dict()   # movie id -> its entries
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Number of movies in the index."""
+        return len(self.by_id)
+
+    def _entries(self, movie_id, name, imdbid):
+        return [(key, rank, name, imdbid, movie_id) for key, rank in title_keys(name)]
+
+    def load(self, movies):
+        """Replace everything with (movie id, name, imdbid) triples."""
+        entries, by_id = [], dict()
+        for movie_id, name, imdbid in movies:
+            mine = self._entries(movie_id, name, imdbid)
+            entries.extend(mine)
+            by_id[movie_id] = mine
+        entries.sort()
+        with self.lock:
+            self.entries, self.by_id = entries, by_id
+
+    def add(self, movie_id, name, imdbid):
+        """Add (or replace) one movie."""
+        mine = self._entries(movie_id, name, imdbid)
+        with self.lock:
+            self._remove(movie_id)
+            for entry in mine:
+                insort(self.entries, entry)
+            self.by_id[movie_id] = mine
+
+    def remove(self, movie_id):
+        """Drop one movie (if we have it)."""
+        with self.lock:
+            self._remove(movie_id)
+
+    def _remove(self, movie_id):
+        for entry in self.by_id.pop(movie_id, []):
+            pos = bisect_left(self.entries, entry)
+            if pos < len(self.entries) and self.entries[pos] == entry:
+                del self.entries[pos]
+
+    def search(self, prefix, limit=DEFAULT_COMPLETE_LIMIT):
+        """Up to limit (name, imdbid) matches for prefix, best first."""
+        prefix = normalize(prefix)
+        if not prefix or limit <= 0:
+            return []
+
+        with self.lock:
+            pos = bisect_left(self.entries, (prefix,))
+            found = []
+            while pos < len(self.entries) and self.entries[pos][0].startswith(prefix):
+                found.append(self.entries[pos])
+                pos += 1
+
+        seen = set()
+        result = []
+        for key, rank, name, imdbid, movie_id in sorted(found, key=lambda e: (e[1], e[0], e[4])):
+            if movie_id not in seen:
+                seen.add(movie_id)
+                result.append((name, imdbid))
+                if len(result) >= limit:
+                    break
+        return result
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def movie_index():
+    """The PrefixIndex of all movies (built on first use)."""
+    global _index
+    with _build_lock:
+        if _index is None:
+            index = PrefixIndex()
+            index.load((m.id, m.name, m.imdbid) for m in Movie.find_all())
+            _index = index
+        return _index
+
+
+def reset():
+    """Forget the index: the next lookup rebuilds it."""
+    global _index
+    with _build_lock:
+        _index = None
+
+
+@on_write
+def movie_written(op, obj):
+    """Keep a built index in step with Movie saves and deletes."""
+    index = _index
+    if index is None or type(obj) is not Movie:
+        return
+    if op == 'delete':
+        index.remove(obj.id)
+    else:
+        index.add(obj.id, obj.name, obj.imdbid)
@@ -0,0 +1,100 @@
+"""compress - gzip/brotli for our HTML, JSON, feed and calendar responses.
+
+after_request compresses the response body when the browser's
+Accept-Encoding allows it: brotli if the brotli module is installed and the
+browser takes it (at least as happily as gzip), else gzip. We leave a
+response alone if it:
+
+* isn't text-like (see COMPRESSIBLE_TYPES) or is smaller than
+  COMPRESS_MIN_SIZE bytes
+* already has a Content-Encoding (like the precompressed /assets files)
+* is streamed or a file passthrough, so we'd have to buffer the whole thing
+* isn't a 200, or says Cache-Control: no-transform
+
+Anything we could have compressed gets "Vary: Accept-Encoding", whether or
+not this particular browser asked, so caches keep the versions apart. A
+strong ETag is made weak when we compress (the bytes differ but the page
+doesn't), which keeps our 304s working.
+
+The hook is registered before all the others in main.register_blueprints.
+Flask runs after_request hooks in reverse, so we run last: the page cache
+stores (and replays) the uncompressed page, and metrics see the real size.
+"""
+
+# pylama:ignore=E501,D213
+
+import gzip
+
+from flask import current_app, request
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_COMPRESS_MIN_SIZE = 500
+DEFAULT_COMPRESS_LEVEL = 6
+DEFAULT_COMPRESS_BR_LEVEL = 4
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/xml', 'text/calendar', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'application/atom+xml',
+    'image/svg+xml',
+}
+
+metrics.register('nbmn_http_compressed_bytes_total', 'counter', 'Response bytes before (in) and after (out) compression by encoding')
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for an Accept-Encoding (werkzeug Accept)."""
+    gzip_q = accept_encodings['gzip']
+    if brotli is not None:
+        br_q = accept_encodings['br']
+        if br_q and br_q >= gzip_q:
+            return 'br'
+    return 'gzip' if gzip_q else None
+
+
+def compressible(response, min_size):
+    """True if response is one we'd compress for a browser that asks."""
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'no-transform' in response.cache_control:
+        return False
+    return response.calculate_content_length() >= min_size
+
+
+def compress(data, encoding, level, br_level):
+    """data compressed with encoding."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=br_level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def after_request(response):
+    """Request hook: compress the body if we can and the browser wants it."""
+    config = current_app.config
+    level = config.get('COMPRESS_LEVEL', DEFAULT_COMPRESS_LEVEL)
+    if level <= 0 or not compressible(response, config.get('COMPRESS_MIN_SIZE', DEFAULT_COMPRESS_MIN_SIZE)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    packed = compress(data, encoding, level, config.get('COMPRESS_BR_LEVEL', DEFAULT_COMPRESS_BR_LEVEL))
+    metrics.inc('nbmn_http_compressed_bytes_total', (('encoding', encoding), ('stage', 'in')), len(data))
+    metrics.inc('nbmn_http_compressed_bytes_total', (('encoding', encoding), ('stage', 'out')), len(packed))
+
+    response.set_data(packed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
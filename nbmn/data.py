@@ -4,13 +4,13 @@
 
 import json
 
-from operator import attrgetter
+from flask import Blueprint, Response, current_app, jsonify, make_response, render_template, request, stream_with_context, url_for
 
-from flask import Blueprint, jsonify, make_response, render_template, request, url_for
-
-from .atom import AtomFeed
 from .utils import templated, use_error_page
 from .model import Night, Movie, Attendee
+from .paging import fetch_page
+
+DEFAULT_FEED_PAGE_SIZE = 20
 
 
 data = Blueprint('data', __name__)
@@ -47,37 +47,79 @@ def explore_data():
     return {}
 
 
-@data.route('/nights.atom')
-def atom_nights():
-    feed = AtomFeed(
-        title='Nutbush Movie Night',
-        title_type='text',
-        subtitle='All Movie Nights',
-        author=sorted(Attendee.OLIGARCHS),
-        feed_url=request.url, # TODO: replace http: with https:
-        url=request.url_root,
-        logo=url_for('static', filename='logo.png'),
-    )
+def _feed_links(page):
+    """RFC 5005 links for one page of the feed: newest first, so "next" is older."""
+    def page_url(**cursor):
+        return url_for('data.atom_nights', _external=True, **cursor)
+
+    links = [
+        {'rel': 'first', 'href': page_url()},
+        {'rel': 'current', 'href': page_url()},
+    ]
+    if page.next_cursor:
+        older = page_url(after=page.next_cursor)
+        links.append({'rel': 'next', 'href': older})
+        links.append({'rel': 'prev-archive', 'href': older})
+    if page.prev_cursor:
+        newer = page_url(before=page.prev_cursor)
+        links.append({'rel': 'previous', 'href': newer})
+        links.append({'rel': 'next-archive', 'href': newer})
+    return links
+
 
-    nights = Night.find_all()
-    nights.sort(key=attrgetter('datestr'), reverse=True)
+def _feed_entries(nights, feed_url):
+    """FeedEntry for each night, rendered as the feed is streamed."""
+    from .atom import FeedEntry
 
     for night in nights:
-        dt = Night.date_from_str(night.datestr)
+        dt = night.date
         night_title = 'Movie Night {} ({})'.format(night.listdate, night.moviename)
         night_text = render_template('night.atom.html', night_title=night_title, night=night, dt=dt)
 
-        feed.add(
+        yield FeedEntry(
             title=night_title,
             title_type='text',
             content=night_text,
             content_type='html',
+            feed_url=feed_url,
             url=url_for('main.night_display', datestr=night.datestr),
             updated=dt,
             published=dt
         )
 
-    return feed.get_response()
+
+@data.route('/nights.atom')
+def atom_nights():
+    """The newest FEED_PAGE_SIZE nights, with paging links to the older ones.
+
+    The entries are rendered while the response is streamed, so the first
+    bytes go out before the last night is rendered.
+    """
+    from .atom import AtomFeed  # Only loaded when someone asks for the feed
+
+    page = fetch_page(
+        Night, 'index_datestr',
+        current_app.config.get('FEED_PAGE_SIZE', DEFAULT_FEED_PAGE_SIZE),
+        after=request.args.get('after', ''),
+        before=request.args.get('before', ''),
+        descending=True,
+    )
+
+    feed = AtomFeed(
+        title='Nutbush Movie Night',
+        title_type='text',
+        subtitle='All Movie Nights',
+        author=sorted(Attendee.OLIGARCHS),
+        id=url_for('data.atom_nights', _external=True),
+        feed_url=request.url, # TODO: replace http: with https:
+        url=request.url_root,
+        logo=url_for('static', filename='logo.png'),
+        links=_feed_links(page),
+        updated=page.items[0].date if page.items else None,
+        entries=_feed_entries(page.items, request.url),
+    )
+
+    return Response(stream_with_context(feed.generate()), mimetype='application/atom+xml')
 
 
 def _line_folder(src):
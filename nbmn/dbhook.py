@@ -0,0 +1,237 @@
+"""dbhook - our hook point around the gludb Database calls.
+
+main.database_config calls install, which wraps the Database methods we care
+about. During a request every call is counted and timed on flask.g, and when
+the request finishes we:
+
+* add the totals to /metrics, attributed to the endpoint that made them
+* log a warning if the same lookup shape (operation, table, index) ran more
+  than DB_NPLUSONE_THRESHOLD times - the classic N+1 query pattern
+* optionally (DB_TRACE_HEADER or DEBUG) report the totals in the X-DB-Trace
+  response header
+
+Calls outside of a request (tools, startup) are passed straight through.
+
+Other modules can also register a function with on_write to be told about
+every successful save or delete (in or out of a request). That's how caches
+find out that the data changed. Inside a listeners_paused block they aren't
+told (the schema migrations use that).
+"""
+
+# pylama:ignore=E501,D213
+
+import time
+import threading
+from zlib import crc32
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+
+from gludb.config import Database
+
+from . import metrics
+from .log import app_logger
+
+TRACED = ['find_one', 'find_all', 'find_by_index', 'save', 'delete']
+WRITES = {'save', 'delete'}
+
+WRITE_LISTENERS = list()
+
+_tracing = True
+
+_paused = threading.local()
+
+TRACE_HEADER = 'X-DB-Trace'
+
+metrics.register('nbmn_db_calls_total', 'counter', 'Database calls by endpoint, operation and table')
+metrics.register('nbmn_db_rows_total', 'counter', 'Rows returned by database reads by endpoint and table')
+metrics.register('nbmn_db_seconds_total', 'counter', 'Time spent in database calls by endpoint and operation')
+metrics.register('nbmn_db_nplusone_total', 'counter', 'Requests flagged for repeated same-shaped lookups')
+
+
+class RequestTrace(object):
+    """Database activity for a single request."""
+
+    def __init__(self):
+        """Start empty."""
+        self.calls = 0
+        self.rows = 0
+        self.secs = 0.0
+        self.shapes = Counter()   # (op, table, index) -> calls
+        self.by_op = Counter()    # (op, table) -> calls
+        self.op_secs = Counter()  # op -> secs
+        self.table_rows = Counter()
+        self.writes = 0
+        self.newest = ''          # Newest stamp of any object read
+        self.ids = 0              # Order-independent digest of the ids read
+
+    def record(self, op, table, index, result, secs):
+        """Record one call."""
+        self.calls += 1
+        self.secs += secs
+        self.shapes[(op, table, index)] += 1
+        self.by_op[(op, table)] += 1
+        self.op_secs[op] += secs
+
+        if op in WRITES:
+            self.writes += 1
+            return
+
+        if isinstance(result, list):
+            rows = len(result)
+            objs = result
+        elif op == 'find_one' and result is not None:
+            rows = 1
+            objs = [result]
+        else:
+            rows = 0
+            objs = []
+        self.rows += rows
+        self.table_rows[table] += rows
+
+        # Stamps are "UTC:<iso format>" so they compare as strings
+        for obj in objs:
+            stamp = getattr(obj, 'stamp', None)
+            if stamp and stamp > self.newest:
+                self.newest = stamp
+            obj_id = getattr(obj, 'id', None)
+            if obj_id:
+                self.ids = (self.ids + crc32(obj_id.encode('utf-8'))) & 0xffffffff
+
+    def repeated(self, threshold):
+        """Yield (shape, count) for lookups repeated more than threshold times."""
+        for shape, count in self.shapes.most_common():
+            if count <= threshold:
+                break
+            if shape[0] in ('find_one', 'find_by_index'):
+                yield shape, count
+
+    def header(self):
+        """Value for our debug response header."""
+        return 'calls=%d rows=%d ms=%.3f' % (self.calls, self.rows, self.secs * 1000.0)
+
+
+def on_write(func):
+    """Decorator: call func(op, obj) after every save or delete."""
+    WRITE_LISTENERS.append(func)
+    return func
+
+
+@contextmanager
+def listeners_paused():
+    """Don't call the write listeners for writes in this block (this thread only)."""
+    was = getattr(_paused, 'on', False)
+    _paused.on = True
+    try:
+        yield
+    finally:
+        _paused.on = was
+
+
+def _notify(op, obj):
+    if getattr(_paused, 'on', False):
+        return
+    for func in WRITE_LISTENERS:
+        try:
+            func(op, obj)
+        except Exception:
+            app_logger().exception("Write listener %s failed for %s", func.__name__, op)
+
+
+def tracing():
+    """True if database calls are being traced (DB_TRACE)."""
+    return _tracing
+
+
+def current_trace(create=True):
+    """Return the trace for the current request (or None outside a request)."""
+    if not has_request_context():
+        return None
+    trace = g.get('dbtrace', None)
+    if trace is None and create:
+        trace = RequestTrace()
+        setattr(g, 'dbtrace', trace)
+    return trace
+
+
+def _call_info(op, args):
+    """Return (table, index) for the call being made."""
+    if op in ('save', 'delete'):
+        return args[0].__class__.get_table_name(), ''
+    table = args[0].get_table_name()
+    if op == 'find_by_index':
+        return table, args[1]
+    if op == 'find_one':
+        return table, 'id'
+    return table, ''
+
+
+def _traced(op, orig):
+    write = op in WRITES
+
+    @wraps(orig)
+    def wrapper(self, *args):
+        trace = current_trace() if _tracing else None
+        if trace is None:
+            result = orig(self, *args)
+        else:
+            start = time.perf_counter()
+            result = orig(self, *args)
+            secs = time.perf_counter() - start
+
+            table, index = _call_info(op, args)
+            trace.record(op, table, index, result, secs)
+
+        if write:
+            _notify(op, args[0])
+        return result
+    return wrapper
+
+
+def install(app):
+    """Wrap the gludb Database methods (only once per process)."""
+    global _tracing
+    _tracing = app.config.get('DB_TRACE', True)
+    if not _tracing:
+        app_logger().info("Database call tracing is disabled")
+    if getattr(Database, '_nbmn_traced', False):
+        return
+
+    app_logger().info("Wrapping gludb calls for database tracing and write listeners")
+    for op in TRACED:
+        setattr(Database, op, _traced(op, getattr(Database, op)))
+    Database._nbmn_traced = True
+
+
+def after_request(response):
+    """Request hook: report on the database activity for this request."""
+    trace = current_trace(create=False)
+    if trace is None:
+        return response
+
+    endpoint = request.endpoint or 'none'
+    for (op, table), count in trace.by_op.items():
+        metrics.inc('nbmn_db_calls_total', (('endpoint', endpoint), ('op', op), ('table', table)), count)
+    for table, rows in trace.table_rows.items():
+        if rows:
+            metrics.inc('nbmn_db_rows_total', (('endpoint', endpoint), ('table', table)), rows)
+    for op, secs in trace.op_secs.items():
+        metrics.inc('nbmn_db_seconds_total', (('endpoint', endpoint), ('op', op)), secs)
+
+    threshold = current_app.config.get('DB_NPLUSONE_THRESHOLD', 10)
+    flagged = False
+    for (op, table, index), count in trace.repeated(threshold):
+        flagged = True
+        app_logger().warning(
+            "Possible N+1: %d %s calls on %s(%s) for %s %s",
+            count, op, table, index, request.method, request.path
+        )
+    if flagged:
+        metrics.inc('nbmn_db_nplusone_total', (('endpoint', endpoint),))
+
+    if current_app.config.get('DB_TRACE_HEADER', False) or current_app.debug:
+        response.headers[TRACE_HEADER] = trace.header()
+
+    return response
@@ -0,0 +1,84 @@
+"""fragcache - template fragment caching and the Jinja bytecode cache.
+
+Templates can cache the output of a block with:
+
+    {% cache mn.id, mn.stamp %}
+        <tr>...</tr>
+    {% endcache %}
+
+The key is the template name, the line of the tag, and the given values. So
+the values should identify everything the block shows: for a single DB object
+that's the id and stamp, since every save changes the stamp (see
+model.loaded_stamp). If any value is None or undefined, the block is rendered
+as usual and not cached.
+
+init_app also turns on the Jinja bytecode cache (JINJA_CACHE_DIR) so compiled
+templates survive restarts.
+"""
+
+# pylama:ignore=E501,D213
+
+import os
+from os.path import abspath
+
+from jinja2 import FileSystemBytecodeCache, Undefined, nodes
+from jinja2.ext import Extension
+
+from .cache import LRUCache
+from .log import app_logger
+
+DEFAULT_FRAGMENT_CACHE_SIZE = 5000
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the {% cache key, ... %}...{% endcache %} tag."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        """Attach our cache to the environment."""
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache(DEFAULT_FRAGMENT_CACHE_SIZE, name='fragment'))
+
+    def parse(self, parser):
+        """Parse the tag: one or more comma separated key expressions."""
+        lineno = next(parser.stream).lineno
+        site = nodes.Const('%s:%d' % (parser.name, lineno))
+
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_cached', [site, nodes.List(keys)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cached(self, site, keys, caller):
+        for k in keys:
+            if k is None or isinstance(k, Undefined):
+                return caller()
+
+        cache = self.environment.fragment_cache
+        key = (site,) + tuple(keys)
+        output = cache.get(key)
+        if output is None:
+            output = caller()
+            cache.set(key, output)
+        return output
+
+
+def init_app(app):
+    """Set up the bytecode cache and fragment caching for app's templates."""
+    env = app.jinja_env
+
+    cache_dir = app.config.get('JINJA_CACHE_DIR', None)
+    if cache_dir:
+        cache_dir = abspath(cache_dir)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError as e:
+            app_logger().error("Jinja bytecode cache disabled - can't use %s: %s", cache_dir, e)
+
+    env.add_extension(FragmentCacheExtension)
+    env.fragment_cache.resize(app.config.get('FRAGMENT_CACHE_SIZE', DEFAULT_FRAGMENT_CACHE_SIZE))
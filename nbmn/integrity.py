@@ -0,0 +1,188 @@
+"""integrity - one pass over the data looking for the things that go wrong.
+
+The checks used to be spread around: `tools fixpeeps` and `tools
+orphanmovies` each scanned the tables themselves, and duplicate movies or
+nights were only noticed (and logged) when a request happened to hit one in
+Movie.find_by_imdb or Night.find_datestr. scan() reads Nights, then Movies,
+then Attendees exactly once each, keeping only ids and keys in memory, and
+reports:
+
+    duplicate_movies   imdbid -> movie ids, when more than one
+    duplicate_nights   datestr -> night ids, when more than one
+    orphan_movies      movies no night refers to
+    missing_attendees  names used by a night with no Attendee record
+    missing_movies     imdbid -> datestrs of nights whose movie isn't stored
+    unkeyed_movies     movies with an empty or unparseable imdbid
+    unkeyed_nights     nights with an unparseable imdbid
+
+A movie we can't key can't be a duplicate or an orphan of anything, so the
+unkeyed ones are only listed, never deleted.
+
+For the SQL backends the rows are read a chunk at a time in id order (see
+stream) so a big table is never loaded whole, and a row the model refuses to
+load (Movie and Night normalize imdbid as they load, which raises ValueError
+for junk) is reported from its raw JSON instead of stopping the scan. Other
+backends fall back to find_all.
+
+fix() repairs what can be repaired without a person looking at it: extra
+movies are deleted (we keep one that has OMDB data), missing attendees are
+created, missing movies are fetched like Movie.find_by_imdb always has, and
+orphans are deleted only if asked. Duplicate nights and anything unkeyed are
+only reported - they need a person to look at them.
+"""
+
+# pylama:ignore=E501,D213
+
+import json
+
+from . import rawsql
+from .imdb import norm_imdbid
+from .model import Attendee, Movie, Night
+
+DEFAULT_CHUNK = 500
+
+PROBLEMS = (
+    'duplicate_movies', 'duplicate_nights', 'orphan_movies', 'missing_attendees',
+    'missing_movies', 'unkeyed_movies', 'unkeyed_nights',
+)
+
+
+def stream(cls, chunk=DEFAULT_CHUNK, bad=None):
+    """Yield every object of cls, chunk rows at a time when we can.
+
+    If bad is given, rows that fail to load with a ValueError are passed to
+    it (as the raw field dict) and skipped instead of raising.
+    """
+    if not rawsql.dialect(cls):
+        yield from cls.find_all()
+        return
+
+    table = cls.get_table_name()
+    sql = 'select id, %s from %s where id > ? order by id limit ?' % (rawsql.value_col(cls), table)
+    last = ''
+    while True:
+        rows = rawsql.query(cls, sql, (last, chunk))
+        for row in rows:
+            try:
+                obj = rawsql.load(cls, row)
+            except ValueError:
+                if bad is None:
+                    raise
+                bad(json.loads(row[1]))
+                continue
+            yield obj
+        if len(rows) < chunk:
+            return
+        last = str(rows[-1][0]).strip()
+
+
+def _key(imdbid):
+    """Normalized imdbid, or None if it's empty or not an IMDB id at all."""
+    try:
+        return norm_imdbid(imdbid) or None
+    except ValueError:
+        return None
+
+
+def _dups(keyed):
+    return dict((key, ids) for key, ids in sorted(keyed.items()) if len(ids) > 1)
+
+
+def scan(chunk=DEFAULT_CHUNK):
+    """Read each table once and return the report as a JSON-ready dict."""
+    night_dates = {}
+    night_movies = {}
+    night_attendees = set()
+    unkeyed_nights = []
+    counts = dict(nights=0, movies=0, attendees=0)
+
+    def add_night(id, datestr, imdbid, attendees):
+        counts['nights'] += 1
+        night_dates.setdefault(datestr, []).append(id)
+        key = _key(imdbid)
+        if key:
+            night_movies.setdefault(key, []).append(datestr)
+        elif str(imdbid or '').strip():
+            unkeyed_nights.append(dict(id=id, datestr=datestr, imdbid=imdbid))
+        night_attendees.update(attendees or [])
+
+    def bad_night(raw):
+        add_night(raw.get('id', ''), str(raw.get('datestr', '')), raw.get('imdbid', ''), raw.get('attendees', []))
+
+    for night in stream(Night, chunk, bad_night):
+        add_night(night.id, night.datestr, night.imdbid, night.attendees)
+
+    # (has OMDB data, id) so the best copy of a duplicate sorts first
+    movies = {}
+    orphans = []
+    unkeyed_movies = []
+
+    def bad_movie(raw):
+        counts['movies'] += 1
+        unkeyed_movies.append(dict(id=raw.get('id', ''), imdbid=raw.get('imdbid', ''), name=raw.get('name', '')))
+
+    for movie in stream(Movie, chunk, bad_movie):
+        counts['movies'] += 1
+        imdbid = _key(movie.imdbid)
+        if not imdbid:
+            unkeyed_movies.append(dict(id=movie.id, imdbid=movie.imdbid, name=movie.name))
+            continue
+        movies.setdefault(imdbid, []).append((not (movie.extdata or {}).get('omdb'), movie.id))
+        if imdbid not in night_movies:
+            orphans.append(dict(id=movie.id, imdbid=imdbid, name=movie.name))
+
+    names = set()
+    for att in stream(Attendee, chunk):
+        counts['attendees'] += 1
+        names.add(att.name)
+
+    return {
+        'counts': counts,
+        'duplicate_movies': _dups(dict((imdbid, [id for _, id in sorted(found)]) for imdbid, found in movies.items())),
+        'duplicate_nights': _dups(night_dates),
+        'orphan_movies': orphans,
+        'missing_attendees': sorted(night_attendees - names),
+        'missing_movies': dict((imdbid, sorted(dates)) for imdbid, dates in sorted(night_movies.items()) if imdbid not in movies),
+        'unkeyed_movies': unkeyed_movies,
+        'unkeyed_nights': unkeyed_nights,
+    }
+
+
+def problems(report):
+    """Number of problems in a scan report."""
+    return sum(len(report[k]) for k in PROBLEMS)
+
+
+def fix(report, delete_orphans=False, fetch_missing=True):
+    """Repair what we can from a scan report; return what was done."""
+    deleted = set()
+
+    def delete_movie(id):
+        movie = Movie.find_one(id)
+        if movie is not None and id not in deleted:
+            movie.delete()
+            deleted.add(id)
+
+    if delete_orphans:
+        for orphan in report['orphan_movies']:
+            delete_movie(orphan['id'])
+
+    # The first id is the one we keep (scan sorts them that way)
+    for ids in report['duplicate_movies'].values():
+        for id in ids[1:]:
+            delete_movie(id)
+
+    for name in report['missing_attendees']:
+        Attendee(name=name).save()
+
+    fetched = []
+    if fetch_missing:
+        for imdbid in report['missing_movies']:
+            Movie.find_by_imdb(imdbid)
+            fetched.append(imdbid)
+
+    return {
+        'deleted_movies': sorted(deleted),
+        'created_attendees': list(report['missing_attendees']),
+        'fetched_movies': fetched,
+    }
@@ -0,0 +1,350 @@
+"""loadtest - drive a running instance with a mix of routes.
+
+Run this via `./tools loadtest --url http://host:port`. Unlike bench (which
+calls the app in-process with the test client) this goes over real HTTP, so
+it sees everything a visitor would: waitress, its thread pool, and the caches.
+
+The routes (and their weights in the mix) are:
+
+    main       /
+    night      /night/<datestr>      a random night
+    moviedata  /moviedata/<imdbid>   a random movie (the movie dialog)
+    gimme      /gimme
+    atom       /nights.atom
+    calendar   /calendar
+
+The nights and movies are picked from the target's own /gimme at start up.
+
+There are two ways to generate load:
+
+* closed loop (--concurrency N): N clients each send a request as soon as
+  their last one finishes. Good for "how much can it take"
+* open loop (--rate R): requests arrive at R per second (Poisson arrivals) no
+  matter how the server is doing, with up to --max-inflight outstanding.
+  Latency is measured from when the request was *due*, so a saturated
+  waitress thread pool shows up as latency instead of quietly slowing the
+  test down
+
+For every route we report throughput, p50/p95/p99 latency and errors, and
+the whole thing is saved as JSON. Pass an earlier file to --compare to see
+what changed between deployments.
+"""
+
+# pylama:ignore=E501,D213
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import statistics
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .bench import percentile
+
+# PORT in default.config
+DEFAULT_URL = 'http://127.0.0.1:8081'
+
+DEFAULT_MIX = 'main=10,night=6,moviedata=6,gimme=1,atom=2,calendar=2'
+
+ROUTES = {
+    'main': lambda rng, pool: '/',
+    'night': lambda rng, pool: '/night/' + rng.choice(pool['nights']),
+    'moviedata': lambda rng, pool: '/moviedata/' + rng.choice(pool['movies']),
+    'gimme': lambda rng, pool: '/gimme',
+    'atom': lambda rng, pool: '/nights.atom',
+    'calendar': lambda rng, pool: '/calendar',
+}
+
+# Routes that need something from the pool
+NEEDS = {'night': 'nights', 'moviedata': 'movies'}
+
+
+def parse_mix(text):
+    """Dict of route -> weight from "main=10,night=5" (a bare name is weight 1)."""
+    mix = dict()
+    for part in str(text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError('Unknown route %s (choose from %s)' % (name, ', '.join(sorted(ROUTES))))
+        mix[name] = float(weight) if weight else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('Empty route mix')
+    return mix
+
+
+def arrivals(rate, duration, rng):
+    """Poisson arrival offsets (seconds) for rate per second over duration."""
+    times, t = [], 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+class Recorder(object):
+    """Thread-safe per-route results."""
+
+    def __init__(self):
+        """Nothing recorded yet."""
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)   # route -> [ms]
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, route, ms, status, nbytes):
+        """One request: status is the HTTP status, or an exception name."""
+        with self.lock:
+            self.latencies[route].append(ms)
+            self.statuses[route][str(status)] += 1
+            self.bytes[route] += nbytes
+            if not isinstance(status, int) or status >= 400:
+                self.errors[route] += 1
+
+    def summary(self, secs):
+        """Dict of route -> stats (plus 'ALL') for a run of secs seconds."""
+        def stats(lat, errors, statuses, nbytes):
+            if not lat:
+                return {'requests': 0, 'errors': errors, 'statuses': statuses}
+            return {
+                'requests': len(lat),
+                'errors': errors,
+                'statuses': statuses,
+                'rps': round(len(lat) / secs, 3) if secs else 0.0,
+                'bytes': nbytes,
+                'ms_p50': round(percentile(lat, 50), 3),
+                'ms_p95': round(percentile(lat, 95), 3),
+                'ms_p99': round(percentile(lat, 99), 3),
+                'ms_mean': round(statistics.mean(lat), 3),
+                'ms_max': round(max(lat), 3),
+            }
+
+        with self.lock:
+            result = dict(
+                (route, stats(lat, self.errors[route], dict(self.statuses[route]), self.bytes[route]))
+                for route, lat in self.latencies.items()
+            )
+            everything = [ms for lat in self.latencies.values() for ms in lat]
+            statuses = defaultdict(int)
+            for route_statuses in self.statuses.values():
+                for status, count in route_statuses.items():
+                    statuses[status] += count
+            result['ALL'] = stats(everything, sum(self.errors.values()), dict(statuses), sum(self.bytes.values()))
+        return result
+
+
+class LoadTest(object):
+    """One load test run against base_url."""
+
+    def __init__(self, base_url, mix, pool, seed=42, timeout=30.0, fetch=None):
+        """Set up - fetch(url) -> (status, nbytes) is only given by tests."""
+        self.base_url = base_url.rstrip('/')
+        self.pool = pool
+        self.mix = dict((r, w) for r, w in mix.items() if pool.get(NEEDS.get(r, ''), True))
+        if not self.mix:
+            raise ValueError('Nothing to request: the target has no nights or movies')
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.timeout = timeout
+        self.fetch = fetch or self._http_fetch
+        self.local = threading.local()
+        self.recorder = Recorder()
+        self.max_lag = 0.0
+
+    def _http_fetch(self, url):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            from .remote import http
+            session = self.local.session = http().Session()
+        resp = session.get(url, timeout=self.timeout)
+        return resp.status_code, len(resp.content)
+
+    def pick(self):
+        """(route, path) for the next request."""
+        with self.rng_lock:
+            route = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            return route, ROUTES[route](self.rng, self.pool)
+
+    def one(self, route, path, due, record=True):
+        """Make one request; latency is measured from due (a perf_counter)."""
+        try:
+            status, nbytes = self.fetch(self.base_url + path)
+        except Exception as e:
+            status, nbytes = type(e).__name__, 0
+        if record:
+            self.recorder.record(route, (time.perf_counter() - due) * 1000.0, status, nbytes)
+
+    def closed(self, concurrency, duration, warmup=0.0):
+        """Closed loop: concurrency clients back to back. Returns seconds measured."""
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop = measure_from + duration
+
+        def client():
+            while True:
+                now = time.perf_counter()
+                if now >= stop:
+                    return
+                route, path = self.pick()
+                self.one(route, path, now, record=now >= measure_from)
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - measure_from
+
+    def open(self, rate, duration, warmup=0.0, max_inflight=256):
+        """Open loop: Poisson arrivals at rate per second. Returns seconds measured."""
+        with self.rng_lock:
+            schedule = arrivals(rate, warmup + duration, self.rng)
+        inflight = threading.BoundedSemaphore(max_inflight)
+
+        def run(route, path, due, record):
+            try:
+                self.one(route, path, due, record)
+            finally:
+                inflight.release()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+            for offset in schedule:
+                due = start + offset
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                inflight.acquire()
+                # How far behind schedule we are when we can finally send
+                self.max_lag = max(self.max_lag, time.perf_counter() - due)
+                route, path = self.pick()
+                pool.submit(run, route, path, due, offset >= warmup)
+        return time.perf_counter() - start - warmup
+
+
+def discover(base_url, timeout=30.0):
+    """Nights and movies to ask for, from the target's /gimme."""
+    from .remote import http
+    data = http().get(base_url.rstrip('/') + '/gimme', timeout=timeout).json()
+    return {
+        'nights': sorted(n['datestr'] for n in data.get('nights', []) if n.get('datestr')),
+        'movies': sorted(m for m in data.get('movies', {}) if m),
+    }
+
+
+def report(results):
+    """Print the per-route table."""
+    print('')
+    print('%-10s %8s %8s %9s %9s %9s %9s %7s' % ('Route', 'Reqs', 'Req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms', 'Errors'))
+    for route in sorted(results, key=lambda r: (r == 'ALL', r)):
+        res = results[route]
+        if not res['requests']:
+            print('%-10s %8d' % (route, 0))
+            continue
+        print('%-10s %8d %8.1f %9.2f %9.2f %9.2f %9.2f %7d' % (
+            route, res['requests'], res['rps'],
+            res['ms_p50'], res['ms_p95'], res['ms_p99'], res['ms_max'], res['errors'],
+        ))
+
+
+def compare(baseline, current):
+    """Print p50/p99 and throughput changes against a baseline result."""
+    print('')
+    print('%-10s %18s %18s %18s' % ('Route', 'Req/s', 'p50 ms', 'p99 ms'))
+    for route, now in sorted(current['results'].items()):
+        base = baseline.get('results', {}).get(route)
+        if not base or not base.get('requests') or not now.get('requests'):
+            continue
+        print('%-10s %8.1f -> %-7.1f %8.2f -> %-7.2f %8.2f -> %-7.2f' % (
+            route, base['rps'], now['rps'],
+            base['ms_p50'], now['ms_p50'], base['ms_p99'], now['ms_p99'],
+        ))
+
+
+def main(opts):
+    """Entry point for the tools command."""
+    parser = argparse.ArgumentParser(prog='tools loadtest', description='Drive a running instance with a mix of routes')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Base URL of the instance to test')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Route weights, from: ' + ','.join(sorted(ROUTES)))
+    parser.add_argument('--concurrency', default=8, type=int, help='Closed loop clients (ignored with --rate)')
+    parser.add_argument('--rate', default=0.0, type=float, help='Open loop arrivals per second')
+    parser.add_argument('--max-inflight', default=256, type=int, help='Open loop limit on outstanding requests')
+    parser.add_argument('--duration', default=30.0, type=float, help='Seconds to measure')
+    parser.add_argument('--warmup', default=5.0, type=float, help='Seconds of load before we start measuring')
+    parser.add_argument('--timeout', default=30.0, type=float, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', default=42, type=int, help='Seed for route picks and arrivals')
+    parser.add_argument('--output', default='loadtest-results.json', help='Where to write JSON results')
+    parser.add_argument('--compare', default='', help='Previous JSON results to compare against')
+    args = parser.parse_args(opts)
+
+    try:
+        mix = parse_mix(args.mix)
+        pool = discover(args.url, args.timeout)
+        test = LoadTest(args.url, mix, pool, seed=args.seed, timeout=args.timeout)
+    except Exception as e:
+        print('Could not start load test against %s: %s' % (args.url, e))
+        return 1
+
+    dropped = sorted(set(mix) - set(test.mix))
+    if dropped:
+        print('Skipping %s: the target has nothing to ask for' % ', '.join(dropped))
+
+    mode = 'open' if args.rate > 0 else 'closed'
+    print('Load testing %s (%s loop, %s) for %.0fs after %.0fs warmup: %d nights, %d movies' % (
+        args.url, mode,
+        ('%.1f req/s' % args.rate) if mode == 'open' else ('%d clients' % args.concurrency),
+        args.duration, args.warmup, len(pool['nights']), len(pool['movies']),
+    ))
+    if mode == 'open':
+        secs = test.open(args.rate, args.duration, args.warmup, args.max_inflight)
+    else:
+        secs = test.closed(args.concurrency, args.duration, args.warmup)
+
+    results = test.recorder.summary(secs)
+    report(results)
+
+    achieved = results['ALL'].get('rps', 0.0)
+    if mode == 'open':
+        print('Max scheduling lag: %.1f ms' % (test.max_lag * 1000.0))
+        if achieved < 0.9 * args.rate:
+            print('WARNING: only %.1f of %.1f req/s completed - the target looks saturated' % (achieved, args.rate))
+
+    output = {
+        'meta': {
+            'when': datetime.now().isoformat(),
+            'url': args.url,
+            'mode': mode,
+            'rate': args.rate,
+            'concurrency': args.concurrency if mode == 'closed' else None,
+            'max_inflight': args.max_inflight if mode == 'open' else None,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'measured_secs': round(secs, 3),
+            'max_lag_ms': round(test.max_lag * 1000.0, 3),
+            'mix': test.mix,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as fh:
+        json.dump(output, fh, indent=2, sort_keys=True)
+    print('Results written to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), output)
+
+    sys.stdout.flush()
+    return 0 if not results['ALL']['errors'] else 2
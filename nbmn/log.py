@@ -4,15 +4,118 @@ IMPORTANT!
 Because logging is needed at such a low level, this file should NEVER import
 from other sub-packages/modules in nbmn. All other python files can confidently
 import functions from us without worrying about cyclical dependencies
+
+Logging never blocks a request: setup puts a queue handler on the root logger
+and moves the real (daiquiri) handlers to a background listener thread. The
+queue is bounded - if the listener falls behind we drop records and count
+them (see dropped_count) rather than stall the caller. Records are formatted
+on the listener thread, so anything expensive to format should be passed as a
+lazy() argument.
 """
 
+import queue
+import atexit
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+
 import daiquiri
 
+DEFAULT_QUEUE_SIZE = 10000
+
+_listener = None
+_handler = None
+_settings = None
+_drops = itertools.count(1)
+_dropped = 0
+
+
+class lazy(object):
+    """Log argument that is only computed if/when the record is formatted."""
+
+    __slots__ = ('func', 'args', 'kwrds')
+
+    def __init__(self, func, *args, **kwrds):
+        """Store the call to make later."""
+        self.func = func
+        self.args = args
+        self.kwrds = kwrds
 
-def setup(level):
+    def __str__(self):
+        """Make the call - this happens on the listener thread."""
+        return str(self.func(*self.args, **self.kwrds))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks and leaves formatting to the listener."""
+
+    def prepare(self, record):
+        """Keep msg and args as-is, but render tracebacks while we still can."""
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        """Queue the record, or drop it if the queue is full."""
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped = next(_drops)
+
+
+def setup(level, queue_size=DEFAULT_QUEUE_SIZE):
     """Centralized logging setup."""
+    global _listener, _handler, _settings
+    shutdown()
+    _settings = (level, queue_size)
+
     daiquiri.setup(level=level)
 
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    root.addHandler(_handler)
+
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread."""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+
+
+atexit.register(shutdown)
+
+
+def restart():
+    """Set up logging again as the last call to setup did (e.g. after a fork)."""
+    if _settings is not None:
+        setup(*_settings)
+
+
+def dropped_count():
+    """Number of records dropped because the queue was full."""
+    return _dropped
+
+
+def queue_depth():
+    """Number of records waiting for the listener."""
+    return _handler.queue.qsize() if _handler is not None else 0
+
+
 def app_logger():
     """Centralized logger."""
     return daiquiri.getLogger("nbmn")
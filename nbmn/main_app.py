@@ -2,13 +2,10 @@
 
 # pylama:ignore=E501,D213
 
-from io import BytesIO
 from os.path import isfile
 from datetime import datetime
 from operator import attrgetter
 
-import requests
-
 from flask import (
     abort,
     Blueprint,
@@ -18,16 +15,21 @@ from flask import (
     jsonify,
     redirect,
     request,
-    send_file,
     url_for
 )
 
+from . import background
 from .imdb import norm_imdbid
 from .log import app_logger
+from .metrics import INTERNAL_ENVIRON
 from .auth import NotAuthorized, require_login
 from .utils import logged_errors, template, templated, use_error_page, project_file
 from .model import User, Movie, Night, Attendee, MovieOverride
-from .remote import create_omdb_poster_get
+from .attendance import attended
+from .catalog import find_movies, nights_for, parse_filters
+from .complete import DEFAULT_COMPLETE_LIMIT, movie_index
+from .paging import request_page
+from .remote import create_omdb_poster_get, http, search_titles
 from .slack import notify
 
 main = Blueprint('main', __name__)
@@ -97,13 +99,51 @@ def movie_display(moviekey=None):
 
         return movie
 
+    filters = parse_filters(request.args)
     if moviekey:
         movie = fixup(Movie.find_by_imdb(moviekey))
         return {'movie': movie, 'movie_name': movie.name or '???'}
+    elif filters:
+        # ?genre=&director=&actor=&writer=&year= (see nbmn/catalog.py)
+        movies = [fixup(m) for m in find_movies(filters)]
+        return {
+            'movies': movies,
+            'shown': nights_for(movies),
+            'filters': filters,
+            'movie_name': ', '.join('%s: %s' % kv for kv in sorted(filters.items())),
+        }
     else:
-        movies = [fixup(m) for m in Movie.find_all()]
-        movies.sort(key=attrgetter('name'))
-        return {'movies': movies, 'movie_name': 'ALL'}
+        page = request_page(Movie, 'index_name')
+        movies = [fixup(m) for m in page.items]
+        return {'movies': movies, 'page': page, 'movie_name': 'ALL'}
+
+
+@main.route('/complete/movie')
+@logged_errors
+def complete_movie():
+    """Movie title completion for the night editor (see nbmn/complete.py)."""
+    limit = current_app.config.get('COMPLETE_LIMIT', DEFAULT_COMPLETE_LIMIT)
+    try:
+        limit = min(limit, int(request.args.get('limit', limit)))
+    except ValueError:
+        pass
+    matches = movie_index().search(request.args.get('prefix', ''), limit)
+    return jsonify(matches=[{'name': name, 'imdbid': imdbid} for name, imdbid in matches])
+
+
+@main.route('/search/movie')
+@require_login
+@logged_errors
+def search_movie():
+    """OMDB title search for admins looking up an IMDB id (see remote.search_titles)."""
+    if g.user.utype != "admin":
+        # Not abort: require_login and logged_errors would make it a 500
+        return jsonify(error='Only admins can search OMDB'), 403
+    try:
+        page = int(request.args.get('page', 1))
+    except ValueError:
+        page = 1
+    return jsonify(**search_titles(request.args.get('q', ''), page))
 
 
 @main.route('/moviedata/<imdbkey>')
@@ -141,7 +181,7 @@ def bad_movie(imdbkey):
 @use_error_page
 def person_display(name=None):
     """Display 1 or all persons."""
-    person, persons, person_name = None, None, ""
+    person, persons, person_name, page = None, None, "", None
 
     if name:
         person = Attendee.find_by_index("index_name", name)
@@ -163,23 +203,20 @@ def person_display(name=None):
     else:
         # Don't fixup attendees for the list
         person_name = 'Listing Them All!'
-        persons = Attendee.find_all()
-
-        for p in persons:
-            p.nights = []
-        for n in Night.find_all():
-            for p in persons:
-                if n.has_attendee(p.name):
-                    p.nights.append(n)
+        page = request_page(Attendee, 'index_name')
+        persons = page.items
 
+        # Just the people on this page - not every night there's ever been
+        counts = attended(p.name for p in persons)
         for p in persons:
-            p.nights.sort(key=attrgetter('datestr'), reverse=True)
+            p.night_count, p.last_night = counts[p.name]
         Attendee.sort(persons)
 
     return {
         'persons': persons,
         'person': person,
-        'person_name': person_name
+        'person_name': person_name,
+        'page': page
     }
 
 
@@ -189,17 +226,16 @@ def person_display(name=None):
 def night_display(datestr=None):
     """Movie night display - all, 1 , edit one, or save (on POST)."""
     if not datestr:
-        # all nights
-        nights = Night.find_all()
-        nights.sort(key=attrgetter('datestr'))
-        return template("night.html", movienights=nights, movie_night_name='ALL Movie Nights')
+        # all nights - newest first, a page at a time
+        page = request_page(Night, 'index_datestr', descending=True)
+        return template("night.html", movienights=page.items, page=page, movie_night_name='ALL Movie Nights')
 
     # If we have a datestr but no mode, it's a detail display
     mode = request.args.get("mode", "").lower()
     if not mode and datestr.lower() != "add":
         # single night
         night = Night.find_datestr(datestr)
-        Attendee.sort(night.attendees)
+        Attendee.sort(night.attendees, seed=night.datestr)
         return template(
             "night.html",
             movienight=night,
@@ -293,6 +329,8 @@ def night_save(datestr):
         # Yippee!
         night.save()
         night_url = url_for("main.night_display", datestr=night.datestr)
+        if current_app.config.get("WARM_ON_SAVE", True):
+            background.submit(warm_night, night.imdbid, warm_paths(night), key=('warm_night', night.datestr))
         notify(
             "%s just saved data for movie night: %s\nSee it here: <%s%s>",
             g.user.email,
@@ -303,8 +341,59 @@ def night_save(datestr):
         return redirect(night_url)
 
 
+def warm_paths(night):
+    """Pages that change (or get busy) when a night is saved.
+
+    Not the Atom feed: it's streamed, so there's nothing cached to fill.
+    """
+    paths = [
+        url_for('main.main_page'),
+        url_for('main.night_display', datestr=night.datestr),
+        url_for('main.night_display'),
+        url_for('data.calendar'),
+        url_for('data.data_dump'),
+    ]
+    if night.imdbid:
+        paths.append(url_for('main.movie_display', moviekey=night.imdbid))
+        paths.append(url_for('main.movie_data', imdbkey=night.imdbid))
+    return paths
+
+
+def warm_night(imdbid, paths):
+    """Background task after a night save: get the slow stuff done early.
+
+    We make sure we have the movie's OMDB data, ask for the poster (so the
+    poster service has it ready) and then render the night's pages so the
+    page and fragment caches are full before the Slack crowd arrives.
+
+    The caches are per process: with WORKERS > 1 only the worker that took
+    the save is warmed (the others render on their first request).
+    """
+    app = current_app._get_current_object()
+    if imdbid:
+        try:
+            movie = Movie.find_by_imdb(imdbid)
+            poster = calc_movie_poster(movie)
+            if app.config.get("WARM_POSTERS", True) and poster.startswith('http'):
+                http().get(poster, timeout=10)
+        except Exception as e:
+            app_logger().warning("Could not prefetch movie %s: %s", imdbid, e)
+
+    client = app.test_client()
+    for path in paths:
+        # A request reuses the current app context (and its g), so give
+        # each one a fresh context of its own. Not user traffic: metrics
+        # skip these
+        with app.app_context():
+            resp = client.get(path, environ_overrides={INTERNAL_ENVIRON: True})
+        if resp.status_code != 200:
+            app_logger().info("Warming %s returned %d", path, resp.status_code)
+
+
 def validate_night(night):
     """Validate the night object and yield any errors we find."""
+    if not night.dateord:
+        yield "Please enter a valid date"
     if len(night.attendees) < 2:
         yield "Need at least 2 attendees"
     if not night.moviename:
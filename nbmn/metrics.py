@@ -0,0 +1,251 @@
+"""metrics - request instrumentation exposed in Prometheus text format.
+
+The request hooks are registered on the app in main.py. Everything is
+recorded into per-thread shards: a request thread only ever touches its own
+shard, so the hot path never takes a lock. The only lock is taken when a new
+thread creates its shard and when /metrics merges the shards for output.
+
+Other modules can add their own lines to the /metrics output with the
+collector decorator.
+"""
+
+# pylama:ignore=E501,D213
+
+import time
+import threading
+from collections import defaultdict
+
+from flask import Blueprint, Response, abort, g, request
+
+from .cache import CACHES
+from .log import dropped_count, queue_depth
+from .model import User
+
+metrics = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LOCAL_ADDRS = {'127.0.0.1', '::1', 'localhost'}
+
+# Set in the WSGI environ of requests we make to ourselves (like cache
+# warming) so they don't count as traffic
+INTERNAL_ENVIRON = 'nbmn.internal'
+
+# name -> (type, help, buckets)
+METRICS = {
+    'nbmn_http_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'nbmn_http_response_size_bytes': ('histogram', 'Response body size by endpoint', SIZE_BUCKETS),
+    'nbmn_http_requests_total': ('counter', 'Requests by endpoint, method and status', None),
+    'nbmn_http_requests_in_flight': ('gauge', 'Requests currently being handled', None),
+}
+
+COLLECTORS = list()
+
+_shards = list()
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def register(name, mtype, helptext, buckets=None):
+    """Declare a metric owned by another module."""
+    METRICS[name] = (mtype, helptext, buckets)
+
+
+def collector(func):
+    """Decorator for functions that yield extra exposition lines for /metrics."""
+    COLLECTORS.append(func)
+    return func
+
+
+def _shard():
+    """Return this thread's shard, creating it on first use."""
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = (defaultdict(float), dict())  # (counters, histograms)
+        with _shards_lock:
+            _shards.append(shard)
+        _local.shard = shard
+    return shard
+
+
+def inc(name, labels=(), amount=1):
+    """Add amount to the counter (or gauge) name with the given labels."""
+    _shard()[0][(name, labels)] += amount
+
+
+def observe(name, labels, value):
+    """Record value in the histogram name with the given labels."""
+    hists = _shard()[1]
+    key = (name, labels)
+    hist = hists.get(key)
+    if hist is None:
+        # One slot per bucket plus +Inf, then sum
+        hist = [0] * (len(METRICS[name][2]) + 2)
+        hists[key] = hist
+
+    buckets = METRICS[name][2]
+    idx = 0
+    while idx < len(buckets) and value > buckets[idx]:
+        idx += 1
+    hist[idx] += 1
+    hist[-1] += value
+
+
+def reset():
+    """Forget everything recorded so far (mainly for testing)."""
+    with _shards_lock:
+        for counters, hists in _shards:
+            counters.clear()
+            hists.clear()
+
+
+def _merged():
+    counters, hists = defaultdict(float), dict()
+    with _shards_lock:
+        shards = list(_shards)
+    for shard_counters, shard_hists in shards:
+        for key, val in list(shard_counters.items()):
+            counters[key] += val
+        for key, hist in list(shard_hists.items()):
+            total = hists.get(key)
+            if total is None:
+                hists[key] = list(hist)
+            else:
+                for i, v in enumerate(hist):
+                    total[i] += v
+    return counters, hists
+
+
+def _escape(val):
+    return str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_str(labels, extra=None):
+    """Format labels (a tuple of (name, value) pairs) for exposition."""
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _num(val):
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    return repr(val) if isinstance(val, float) else str(val)
+
+
+def exposition():
+    """Return all metrics in Prometheus text format."""
+    counters, hists = _merged()
+    lines = []
+
+    for name, (mtype, helptext, buckets) in sorted(METRICS.items()):
+        lines.append('# HELP %s %s' % (name, helptext))
+        lines.append('# TYPE %s %s' % (name, mtype))
+        if mtype == 'histogram':
+            for (hname, labels), hist in sorted(hists.items()):
+                if hname != name:
+                    continue
+                running = 0
+                for le, count in zip(list(buckets) + ['+Inf'], hist[:-1]):
+                    running += count
+                    lines.append('%s_bucket%s %d' % (name, label_str(labels, ('le', le)), running))
+                lines.append('%s_sum%s %s' % (name, label_str(labels), _num(hist[-1])))
+                lines.append('%s_count%s %d' % (name, label_str(labels), running))
+        else:
+            for (cname, labels), val in sorted(counters.items()):
+                if cname == name:
+                    lines.append('%s%s %s' % (name, label_str(labels), _num(val)))
+
+    for func in COLLECTORS:
+        lines.extend(func())
+
+    return '\n'.join(lines) + '\n'
+
+
+@collector
+def log_queue():
+    """Expose the state of the background logging queue."""
+    yield '# HELP nbmn_log_dropped_total Log records dropped because the log queue was full'
+    yield '# TYPE nbmn_log_dropped_total counter'
+    yield 'nbmn_log_dropped_total %d' % dropped_count()
+    yield '# HELP nbmn_log_queue_depth Log records waiting to be written'
+    yield '# TYPE nbmn_log_queue_depth gauge'
+    yield 'nbmn_log_queue_depth %d' % queue_depth()
+
+
+def before_request():
+    """Request hook: start the clock (unless it's one of our own requests)."""
+    if request.environ.get(INTERNAL_ENVIRON):
+        return
+    inc('nbmn_http_requests_in_flight')
+    setattr(g, 'metrics_start', time.perf_counter())
+
+
+def after_request(response):
+    """Request hook: record latency, status, and size."""
+    # calculate_content_length would read a streamed body into memory
+    _record(response.status_code, None if response.is_streamed else response.calculate_content_length())
+    return response
+
+
+def teardown_request(exc):
+    """Request hook: always runs, even if the request blew up."""
+    if getattr(g, 'metrics_start', None) is None:
+        return
+    if not getattr(g, 'metrics_recorded', False):
+        _record(500, None)
+    inc('nbmn_http_requests_in_flight', amount=-1)
+
+
+def _record(status, size):
+    start = getattr(g, 'metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'none'
+
+    observe('nbmn_http_request_duration_seconds', (('endpoint', endpoint),), elapsed)
+    if size is not None:
+        observe('nbmn_http_response_size_bytes', (('endpoint', endpoint),), size)
+    inc('nbmn_http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+    setattr(g, 'metrics_recorded', True)
+
+
+def scrape_allowed():
+    """True if this request may see /metrics.
+
+    Direct connections from the local machine are allowed. Anything that came
+    through our proxy (which also connects from localhost) needs an admin.
+    """
+    local = request.remote_addr in LOCAL_ADDRS and not request.headers.get('X-Forwarded-For')
+    return local or User.get_user().admin
+
+
+@metrics.route('/metrics')
+def metrics_page():
+    """Prometheus scrape target."""
+    if not scrape_allowed():
+        abort(403)
+    return Response(exposition(), mimetype='text/plain; version=0.0.4')
+
+
+@collector
+def caches():
+    """Expose hit/miss counts for our named in-process caches."""
+    stats = [
+        ('hits', 'counter', 'Cache hits'),
+        ('misses', 'counter', 'Cache misses'),
+        ('evictions', 'counter', 'Entries evicted to stay under the size limit'),
+    ]
+    for stat, mtype, helptext in stats:
+        name = 'nbmn_cache_%s_total' % stat
+        yield '# HELP %s %s' % (name, helptext)
+        yield '# TYPE %s %s' % (name, mtype)
+        for cname, cache in sorted(CACHES.items()):
+            yield '%s%s %d' % (name, label_str((('cache', cname),)), getattr(cache, stat))
+    yield '# HELP nbmn_cache_entries Entries currently cached'
+    yield '# TYPE nbmn_cache_entries gauge'
+    for cname, cache in sorted(CACHES.items()):
+        yield 'nbmn_cache_entries%s %d' % (label_str((('cache', cname),)), len(cache))
@@ -17,6 +17,17 @@ from .imdb import norm_imdbid
 from .remote import get_movie_data
 
 
+def loaded_stamp(kwrds):
+    """Return the _last_update an object was saved with (or None if new).
+
+    gludb overwrites _last_update with the current time every time an object
+    is loaded (it calls to_data to remember the original version), so models
+    keep the stored value as `stamp` in their setup. Use stamp (never
+    _last_update) for cache keys and "last modified" times.
+    """
+    return kwrds.get('_last_update', None) or None
+
+
 @DBObject(table_name='Users')
 class User(object):
     """System user.
@@ -82,12 +93,18 @@ class Movie(object):
     def setup(self, *args, **kwrds):
         """After construction we force imdbid to be correct."""
         self.imdbid = norm_imdbid(self.imdbid)
+        self.stamp = loaded_stamp(kwrds)
 
     @Index
     def index_imdbid(self):
         """Index by IMDB key."""
         return norm_imdbid(self.imdbid)
 
+    @Index
+    def index_name(self):
+        """Index by name (for paging)."""
+        return self.name
+
     @classmethod
     def find_by_imdb(cls, imdbid, force=False):
         """Find by IMDB id in DB - search remote sources if not found.
@@ -194,6 +211,10 @@ class Attendee(object):
 
     name = Field('')
 
+    def setup(self, *args, **kwrds):
+        """Remember our stamp."""
+        self.stamp = loaded_stamp(kwrds)
+
     @property
     def urlname(self):
         """Name suitable for URL use."""
@@ -218,15 +239,22 @@ class Attendee(object):
             Attendee(name=name).save()
 
     @classmethod
-    def sort(cls, attendees):
-        """Sort attendees in place - we support both string and objects."""
+    def sort(cls, attendees, seed=None):
+        """Sort attendees in place - we support both string and objects.
+
+        Oligarchs come first, in an order picked at random using seed (which
+        defaults to today's date). The same seed always gives the same order,
+        so a page renders the same way until its data changes.
+        """
         def sortkey(att):
             name = att if isinstance(att, str) else att.name
             prefix = '0' if name in cls.OLIGARCHS else '1'
             return prefix + name
         attendees.sort(key=sortkey)
         if len(attendees) >= 2 and cls.olis(attendees[:2]):
-            if random.random() < 0.5:
+            if seed is None:
+                seed = datetime.now().strftime(Night.DATE_FMT)
+            if random.Random(seed).random() < 0.5:
                 attendees[0], attendees[1] = attendees[1], attendees[0]
 
 
@@ -245,11 +273,25 @@ class Night(object):
     attendees = Field(list)
     ccsi = Field(0)
 
+    # Parsed from datestr by insure_data and stored with the night, so we
+    # don't need strptime every time a date is displayed
+    dateord = Field(0)
+    dates = Field(dict)
+
     DATE_FMT = "%Y%m%d"
 
+    # dates key -> strftime format
+    DISPLAY_FMTS = {
+        'long': "%A, %B %d, %Y",
+        'short': "%b %d, %Y",
+        'js': "%Y-%m-%d (%a, %b %d)",
+        'ical': "%Y%m%dT233000Z",
+    }
+
     def setup(self, *args, **kwrds):
         """Insure fields are ok."""
         self.insure_data()
+        self.stamp = loaded_stamp(kwrds)
 
     def insure_data(self):
         """Provide a method to insure all the fields are correct."""
@@ -263,15 +305,58 @@ class Night(object):
         except:
             pass  # Just allow non-int field for now
 
+        # Only parse if the stored dates are missing or out of date.
+        # dates_changed tells ./tools fixdates which nights need a save
+        self.dates_changed = self.dates.get('datestr', None) != self.datestr
+        if self.dates_changed:
+            self.set_dates()
+
+    def set_dates(self):
+        """Fill in dateord and dates from datestr."""
+        try:
+            dt = self.date_from_str(self.datestr)
+        except ValueError:
+            dt = None  # See validate_night
+        if dt:
+            self.dateord = dt.toordinal()
+            fmts = self.DISPLAY_FMTS.items()
+            self.dates = dict((k, dt.strftime(fmt)) for k, fmt in fmts)
+            self.dates['year'] = dt.year
+        else:
+            self.dateord = 0
+            self.dates = dict((k, '') for k in self.DISPLAY_FMTS)
+            self.dates['year'] = 0
+        self.dates['datestr'] = self.datestr
+
+    @classmethod
+    def backfill_dates(cls):
+        """Save any nights missing stored dates, returning the count."""
+        count = 0
+        for night in cls.find_all():
+            if night.dates_changed:
+                night.save()
+                count += 1
+        return count
+
+    @property
+    def date(self):
+        """The night's date as a datetime (None if we don't have a valid one)."""
+        return datetime.fromordinal(self.dateord) if self.dateord else None
+
     @Index
     def index_datestr(self):
         """Index by datestr."""
         return self.datestr
 
+    @Index
+    def index_imdbid(self):
+        """Index by IMDB key (the nights a movie was shown)."""
+        return self.imdbid
+
     @Index
     def index_year(self):
         """Index by the year component of datestr."""
-        return Night.date_from_str(self.datestr).year
+        return self.dates['year']
 
     @classmethod
     def str_from_date(cls, date):
@@ -318,27 +403,27 @@ class Night(object):
     @property
     def listdate(self):
         """Displayable date - longer format."""
-        return self.date_from_str(self.datestr).strftime("%A, %B %d, %Y")
+        return self.dates['long']
 
     @property
     def listdate_short(self):
         """Displayable date - shorter format."""
-        return self.date_from_str(self.datestr).strftime("%b %d, %Y")
+        return self.dates['short']
 
     @property
     def listdate_js(self):
         """Displayable date that sorts correctly with JS-based date tables."""
-        return self.date_from_str(self.datestr).strftime("%Y-%m-%d (%a, %b %d)")
+        return self.dates['js']
 
     @property
     def listdate_ical(self):
         """Return version of a date compatible with iCalendar DTSTART."""
-        return self.date_from_str(self.datestr).strftime("%Y%m%dT233000Z")
+        return self.dates['ical']
 
     @property
     def dstamp_ical(self):
         """Return string compatible with iCal DTSTAMP."""
-        ndt = getattr(self, '_last_update', None) or getattr(self, '_create_date', None)
+        ndt = self.stamp or getattr(self, '_create_date', None)
         if ndt:
             dt = parse_now_field(ndt)
         else:
@@ -0,0 +1,187 @@
+"""omdbstub - a local stand-in for the OMDB API.
+
+Start it with `./tools omdbstub` and point OMDB_BASE_URL (and OMDB_POSTER_URL)
+at it to exercise everything behind remote.py without our real API key or
+quota. It answers the same queries we make of the real thing:
+
+    /?i=<imdbid>&apikey=...        movie lookup
+    /?s=<title>&page=n&apikey=...  title search (10 per page, optional type/y)
+    /img/?i=<imdbid>&apikey=...    poster (a tiny PNG)
+    /_stats                        request counts, as JSON
+
+Movies come from the recorded responses in the fixtures directory (one
+<imdbid>.json file each, see test/omdb) and from synth: every synthetic id
+(synth.imdbid_for(1..movies)) gets a made-up movie that's the same every
+time for a given seed.
+
+To make life harder it can add latency (plus random jitter), fail a fraction
+of requests with a 503, and answer a fraction with "Response": "False" - the
+dice are seeded too, so runs are repeatable.
+"""
+
+# pylama:ignore=E501,D213
+
+import os
+import json
+import time
+import random
+import threading
+from collections import Counter
+
+from flask import Flask, Response, jsonify, request
+
+from .imdb import norm_imdbid
+from .synth import imdbid_for, omdb_record
+
+SEARCH_PAGE_SIZE = 10
+
+# A 1x1 transparent PNG
+POSTER_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+    '0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082'
+)
+
+
+def load_fixtures(fixture_dir):
+    """Dict of imdbid -> recorded OMDB response from a directory of .json files."""
+    fixtures = dict()
+    if not fixture_dir or not os.path.isdir(fixture_dir):
+        return fixtures
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(fixture_dir, name)) as fh:
+            record = json.load(fh)
+        imdbid = norm_imdbid(record.get('imdbID', '') or name[:-5])
+        if imdbid:
+            fixtures[imdbid] = record
+    return fixtures
+
+
+class OMDBStub(object):
+    """The fake OMDB: movie data plus the misbehavior settings."""
+
+    def __init__(self, fixture_dir=None, movies=500, latency=0.0, jitter=0.0,
+                 error_rate=0.0, false_rate=0.0, seed=42, apikey=''):
+        """Load the fixtures and generate the synthetic movies."""
+        self.fixtures = load_fixtures(fixture_dir)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.false_rate = false_rate
+        self.seed = seed
+        self.apikey = apikey
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+        self.synthetic = dict()
+        for num in range(1, movies + 1):
+            imdbid = imdbid_for(num)
+            self.synthetic[imdbid] = omdb_record(random.Random('%s:%s' % (seed, imdbid)), imdbid)
+
+    def lookup(self, imdbid):
+        """Raw OMDB record for imdbid (or None)."""
+        imdbid = norm_imdbid(imdbid)
+        return self.fixtures.get(imdbid, None) or self.synthetic.get(imdbid, None)
+
+    def search(self, query, page=1, mtype='', year=''):
+        """(total, records) for one page of a title search."""
+        query = str(query or '').strip().lower()
+        found = []
+        for source in (self.fixtures, self.synthetic):
+            for imdbid, record in sorted(source.items()):
+                if query not in record.get('Title', '').lower():
+                    continue
+                if mtype and record.get('Type', '') != mtype:
+                    continue
+                if year and str(record.get('Year', '')) != str(year):
+                    continue
+                found.append(record)
+        start = (page - 1) * SEARCH_PAGE_SIZE
+        return len(found), found[start:start + SEARCH_PAGE_SIZE]
+
+    def _dice(self):
+        """Sleep for the latency and then return a roll in [0, 1)."""
+        with self.lock:
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            roll = self.rng.random()
+        if delay > 0:
+            time.sleep(delay)
+        return roll
+
+    def _count(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def _false(self, error, status=200):
+        resp = jsonify(Response='False', Error=error)
+        resp.status_code = status
+        return resp
+
+    def _check(self, kind):
+        """Common misbehavior for every API call. Returns a response or None."""
+        self._count('requests', kind)
+        roll = self._dice()
+
+        apikey = request.args.get('apikey', '')
+        if not apikey:
+            self._count('unauthorized')
+            return self._false('No API key provided.', 401)
+        if self.apikey and apikey != self.apikey:
+            self._count('unauthorized')
+            return self._false('Invalid API key!', 401)
+
+        if roll < self.error_rate:
+            self._count('errors')
+            return Response('OMDB stub: simulated failure\n', status=503, mimetype='text/plain')
+        if roll < self.error_rate + self.false_rate:
+            self._count('false')
+            return self._false('Error getting data.')
+        return None
+
+    def api(self):
+        """The / endpoint: lookups and searches."""
+        imdbid = request.args.get('i', '')
+        query = request.args.get('s', '')
+        failed = self._check('lookup' if imdbid else 'search' if query else 'other')
+        if failed is not None:
+            return failed
+
+        if imdbid:
+            record = self.lookup(imdbid)
+            return jsonify(record) if record else self._false('Incorrect IMDb ID.')
+
+        if query:
+            try:
+                page = max(1, int(request.args.get('page', 1)))
+            except ValueError:
+                page = 1
+            total, records = self.search(query, page, request.args.get('type', ''), request.args.get('y', ''))
+            if not records:
+                return self._false('Movie not found!')
+            return jsonify(
+                Search=[dict((k, r.get(k, 'N/A')) for k in ('Title', 'Year', 'imdbID', 'Type', 'Poster')) for r in records],
+                totalResults=str(total),
+                Response='True',
+            )
+
+        return self._false('Something went wrong.')
+
+    def poster(self):
+        """The /img/ endpoint."""
+        failed = self._check('poster')
+        if failed is not None:
+            return failed
+        if not self.lookup(request.args.get('i', '')):
+            return Response('Not found\n', status=404, mimetype='text/plain')
+        return Response(POSTER_PNG, mimetype='image/png')
+
+    def create_app(self):
+        """A Flask app serving this stub."""
+        app = Flask('omdbstub')
+        app.add_url_rule('/', 'api', self.api)
+        app.add_url_rule('/img/', 'poster', self.poster)
+        app.add_url_rule('/_stats', 'stats', lambda: jsonify(dict(self.stats)))
+        return app
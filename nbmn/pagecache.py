@@ -0,0 +1,114 @@
+"""pagecache - whole-page response cache for anonymous visitors.
+
+Most of our traffic is logged-out visitors looking at the same few pages, so
+we keep the finished response for GETs made without a session user. Pages are
+keyed by path and query string. The cache is a bounded LRU (PAGE_CACHE_SIZE)
+and entries expire after PAGE_CACHE_TTL seconds, which covers the pages that
+depend on the date.
+
+Any model write (see dbhook.on_write) empties the cache. A request that was
+already rendering when a write happened won't store its (possibly stale) page:
+we compare the write generation from before and after the request.
+
+Bypassed automatically for: logged in users, requests with flash messages
+waiting, profiling requests, anything that sets a cookie or changes the
+session, non-200 responses, error pages (utils.use_error_page renders them as
+a 200), and the metrics/profiler/refresh/assets/auth
+blueprints.
+"""
+
+# pylama:ignore=E501,D213
+
+import time
+import threading
+
+from flask import current_app, g, request, session
+
+from .cache import LRUCache
+from .dbhook import on_write
+
+DEFAULT_PAGE_CACHE_SIZE = 500
+DEFAULT_PAGE_CACHE_TTL = 300
+
+CACHE_HEADER = 'X-Page-Cache'
+
+NO_CACHE_BLUEPRINTS = {'metrics', 'profiler', 'refresh', 'assets', 'auth'}
+
+# Per-request headers that must not be replayed from the cache
+SKIP_HEADERS = {'content-length', 'set-cookie', 'x-db-trace', 'x-profile-id', CACHE_HEADER.lower()}
+
+_cache = LRUCache(DEFAULT_PAGE_CACHE_SIZE, name='page')
+_lock = threading.Lock()
+_generation = 0
+
+
+def init_app(app):
+    """Size the cache from app config."""
+    _cache.resize(app.config.get('PAGE_CACHE_SIZE', DEFAULT_PAGE_CACHE_SIZE))
+
+
+@on_write
+def invalidate(op=None, obj=None):
+    """Forget every cached page."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
+
+
+def cacheable():
+    """True if the current request may be served from (or stored in) the cache."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if not request.endpoint or request.endpoint == 'static' or request.blueprint in NO_CACHE_BLUEPRINTS:
+        return False
+    if session.get('user_id') or '_flashes' in session:
+        return False
+    if request.args.get('_profile') or request.headers.get('X-Profile'):
+        return False
+    return True
+
+
+def before_request():
+    """Request hook: answer from the cache if we can."""
+    if _cache.maxsize <= 0 or not cacheable():
+        return None
+
+    key = request.full_path
+    entry = _cache.get(key)
+    if entry is not None:
+        expires, status, headers, body = entry
+        if not expires or expires > time.time():
+            response = current_app.response_class(body, status=status, headers=headers)
+            response.headers[CACHE_HEADER] = 'hit'
+            # The page's validators were cached too, so we can still 304
+            return response.make_conditional(request)
+
+    setattr(g, 'pagecache', (key, _generation))
+    return None
+
+
+def after_request(response):
+    """Request hook: store the page if it's safe to share."""
+    pending = g.get('pagecache', None)
+    if not pending:
+        return response
+    setattr(g, 'pagecache', None)
+    key, generation = pending
+
+    if request.method != 'GET' or response.status_code != 200 or g.get('error_page', False):
+        return response
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if 'Set-Cookie' in response.headers or session.modified or '_flashes' in session:
+        return response
+
+    ttl = current_app.config.get('PAGE_CACHE_TTL', DEFAULT_PAGE_CACHE_TTL)
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in SKIP_HEADERS]
+    entry = (time.time() + ttl if ttl else 0, response.status_code, headers, response.get_data())
+
+    with _lock:
+        if generation == _generation:
+            _cache.set(key, entry)
+    response.headers[CACHE_HEADER] = 'miss'
+    return response
@@ -0,0 +1,138 @@
+"""paging - keyset pagination for the big list pages.
+
+A page is ordered by an index column and then by id (so ties are stable), and
+the cursors are just the (index value, id) of the first and last rows. Asking
+for the rows after (or before) a cursor is an index range scan, so the cost of
+a page doesn't grow with the size of the table, and adding or deleting rows
+never makes a page skip or repeat rows the way an offset would.
+
+For sqlite and postgresql we query the table directly (see rawsql). Other
+backends fall back to loading everything and slicing in Python.
+"""
+
+# pylama:ignore=E501,D213
+
+import json
+import time
+import base64
+import binascii
+
+from flask import current_app, request
+
+from . import rawsql
+from .dbhook import current_trace
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class Page(object):
+    """One page of objects, plus cursors for the pages either side."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        """Page of items - a cursor is None if there's no page that way."""
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def paged(self):
+        """True if there's more than this one page."""
+        return bool(self.next_cursor or self.prev_cursor)
+
+
+def encode_cursor(key, id):
+    """Cursor string for a row: opaque and URL safe."""
+    raw = json.dumps([key, id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (key, id) from a cursor string, or None if it's not valid."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, id = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    return str(key), str(id)
+
+
+def _sql_rows(cls, index, cursor, forward, limit):
+    """Up to limit (key, id, obj) rows from cursor, in the forward direction."""
+    table = cls.get_table_name()
+    order = 'asc' if forward else 'desc'
+    sql = 'select id, %s, %s from %s' % (rawsql.value_col(cls), index, table)
+    params = []
+    if cursor:
+        sql += ' where (%s, id) %s (?, ?)' % (index, '>' if forward else '<')
+        params.extend(cursor)
+    sql += ' order by %s %s, id %s limit ?' % (index, order, order)
+    params.append(limit)
+
+    return [(str(row[2]), str(row[0]).strip(), rawsql.load(cls, row)) for row in rawsql.query(cls, sql, params)]
+
+
+def _scan_rows(cls, index, cursor, forward, limit):
+    """Same as _sql_rows, the slow way."""
+    rows = sorted(
+        (str(getattr(obj, index)()), obj.id, obj)
+        for obj in cls.find_all()
+    )
+    if not forward:
+        rows.reverse()
+    if cursor:
+        if forward:
+            rows = [r for r in rows if (r[0], r[1]) > cursor]
+        else:
+            rows = [r for r in rows if (r[0], r[1]) < cursor]
+    return rows[:limit]
+
+
+def fetch_page(cls, index, size, after=None, before=None, descending=False):
+    """Return the Page of cls ordered by index.
+
+    after is the cursor of the last row of the page before this one (the
+    "next" link) and before is the cursor of the first row of the page after
+    this one (the "prev" link). With neither you get the first page.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    # "forward" is ascending (key, id); descending pages flip everything
+    backwards = bool(before and not after)
+    cursor = before if backwards else after
+    forward = descending == backwards
+
+    fetch = _sql_rows if rawsql.dialect(cls) else _scan_rows
+    start = time.perf_counter()
+    rows = fetch(cls, index, cursor, forward, size + 1)
+
+    # Raw SQL skips dbhook, so record it ourselves (the ETag depends on it)
+    trace = current_trace()
+    if trace is not None and fetch is _sql_rows:
+        trace.record('find_page', cls.get_table_name(), index, [r[2] for r in rows], time.perf_counter() - start)
+
+    more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return Page([])
+
+    first = encode_cursor(rows[0][0], rows[0][1])
+    last = encode_cursor(rows[-1][0], rows[-1][1])
+    if backwards:
+        return Page([r[2] for r in rows], next_cursor=last, prev_cursor=first if more else None)
+    return Page([r[2] for r in rows], next_cursor=last if more else None, prev_cursor=first if cursor else None)
+
+
+def request_page(cls, index, descending=False):
+    """fetch_page using the after/before cursors from the query string."""
+    return fetch_page(
+        cls, index,
+        current_app.config.get('LIST_PAGE_SIZE', DEFAULT_PAGE_SIZE),
+        after=request.args.get('after', ''),
+        before=request.args.get('before', ''),
+        descending=descending,
+    )
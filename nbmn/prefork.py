@@ -0,0 +1,337 @@
+"""prefork - serve with several worker processes sharing one socket.
+
+A single waitress process only ever uses one core (the GIL), so CPU-heavy
+pages like the feed, the person list and /gimme queue up behind each other.
+With WORKERS > 1, main.main calls serve instead of waitress.serve:
+
+* the master binds the listening socket once and forks WORKERS children,
+  each running waitress with THREADS threads and CONNECTION_LIMIT open
+  connections on that same socket (the kernel hands each new connection to
+  whichever worker accepts it first)
+* after WORKER_MAX_REQUESTS requests (plus up to 10% so they don't all go at
+  once, 0 for never) a worker retires: it stops accepting, answers requests
+  on its open connections with "Connection: close", closes keep-alive
+  connections once they go idle and exits. The master starts a replacement
+  in the same slot
+* SIGHUP to the master recycles every worker that way, SIGTERM or SIGINT
+  stops them all (anything still busy after WORKER_GRACEFUL_TIMEOUT seconds
+  is killed)
+
+Every worker has its own in-memory caches, so a write in one worker has to
+reach the others: the master shares a write counter with the children. Our
+on_write listener bumps it, and before_request (registered ahead of the page
+cache) empties the page cache and the completion index when another process
+has written since we last looked.
+
+Worker.run is waitress's own server loop plus the retiring logic, and it
+reaches into waitress internals (the socket map, active_channels and the
+channel/task attributes) that aren't a public API. That's why waitress is
+pinned in the Pipfile: prefork_test retires a live worker, so run it after
+changing the version.
+
+Other per-process things to know about: /metrics and /profile/samples only
+describe the worker that answered, the background refresh only runs in
+worker slot 0 (its budget is in the database, so a recycle doesn't reset
+it), and warming after a night save (WARM_ON_SAVE) only fills the
+caches of the worker that took the save.
+"""
+
+# pylama:ignore=E501,D213
+
+import os
+import sys
+import time
+import random
+import signal
+import socket
+import itertools
+
+from . import log
+from .dbhook import on_write
+
+DEFAULT_THREADS = 4
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_GRACEFUL_TIMEOUT = 30
+
+# A retiring worker closes keep-alive connections that have been idle this
+# long. Busy ones are told to close with their next response instead, since a
+# client may be sending on an idle connection just as we close it
+IDLE_CLOSE = 2.0
+
+# A worker that dies quicker than this is probably failing at start up, so
+# we wait a bit before starting another one
+MIN_WORKER_LIFE = 1.0
+
+_writes = None   # multiprocessing.Value shared by the master and workers
+_seen = 0
+
+
+def _invalidate_local():
+    """Forget the caches that only this process's writes keep current."""
+    from . import pagecache, complete
+    pagecache.invalidate()
+    complete.reset()
+
+
+def share_writes(counter):
+    """Start sharing writes through counter (a multiprocessing.Value)."""
+    global _writes, _seen
+    _writes = counter
+    _seen = counter.value if counter is not None else 0
+
+
+@on_write
+def note_write(op, obj):
+    """Tell the other processes that we wrote something."""
+    global _seen
+    if _writes is None:
+        return
+    with _writes.get_lock():
+        missed = _writes.value != _seen
+        _writes.value += 1
+        _seen = _writes.value
+    if missed:
+        _invalidate_local()
+
+
+def before_request():
+    """Drop our caches if another process has written since we last looked."""
+    global _seen
+    if _writes is None:
+        return
+    current = _writes.value
+    if current != _seen:
+        _seen = current
+        _invalidate_local()
+
+
+def bind(host, port, backlog=1024):
+    """The listening socket the workers share."""
+    family, socktype, proto, _, addr = socket.getaddrinfo(host or None, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker(object):
+    """A waitress server in a forked child - retires gracefully when asked."""
+
+    def __init__(self, app, sock, slot, threads, connection_limit, max_requests, graceful_timeout):
+        """Set up - run does the serving."""
+        self.app = app
+        self.sock = sock
+        self.slot = slot
+        self.threads = threads
+        self.connection_limit = connection_limit
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.requests = itertools.count(1)
+        self.retiring = False
+        self.server = None
+
+    def retire(self, *args):
+        """Stop accepting and exit once in-flight requests are done."""
+        self.retiring = True
+        if self.server is not None:
+            self.server.pull_trigger()
+
+    def wsgi(self, environ, start_response):
+        """Our app, counting requests."""
+        if self.max_requests and next(self.requests) == self.max_requests:
+            log.app_logger().info("Worker %d (pid %d) served %d requests: recycling", self.slot, os.getpid(), self.max_requests)
+            self.retire()
+        return self.app(environ, start_response)
+
+    def run(self):
+        """Serve until we retire (never returns)."""
+        from waitress.channel import HTTPChannel
+        from waitress.server import create_server
+        from waitress.task import WSGITask
+
+        worker = self
+
+        class ClosingTask(WSGITask):
+            def build_response_header(self):
+                # Same as the client asking for "Connection: close" (a WSGI
+                # app isn't allowed to set hop-by-hop headers itself)
+                if worker.retiring:
+                    self.request.headers['CONNECTION'] = 'close'
+                return super().build_response_header()
+
+        class ClosingChannel(HTTPChannel):
+            task_class = ClosingTask
+
+        self.server = server = create_server(
+            self.wsgi,
+            sockets=[self.sock],
+            threads=self.threads,
+            connection_limit=self.connection_limit,
+        )
+        server.channel_class = ClosingChannel
+        loop = server.asyncore.loop
+        deadline = None
+        while True:
+            loop(timeout=server.adj.asyncore_loop_timeout, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+            if not self.retiring:
+                continue
+
+            if deadline is None:
+                deadline = time.monotonic() + self.graceful_timeout
+                server.accepting = False
+            busy = 0
+            idle_since = time.time() - IDLE_CLOSE
+            for channel in list(server.active_channels.values()):
+                if channel.requests or channel.request is not None or channel.total_outbufs_len:
+                    busy += 1
+                elif channel.last_activity < idle_since:
+                    channel.will_close = True
+            if not busy and len(server.active_channels) == 0:
+                break
+            if time.monotonic() > deadline:
+                log.app_logger().warning("Worker %d (pid %d) gave up waiting on %d busy connections", self.slot, os.getpid(), busy)
+                break
+
+        server.task_dispatcher.shutdown(timeout=self.graceful_timeout)
+        log.shutdown()
+        os._exit(0)
+
+
+class Master(object):
+    """Forks, watches and replaces the workers."""
+
+    def __init__(self, app, host, port, workers, threads=DEFAULT_THREADS,
+                 connection_limit=DEFAULT_CONNECTION_LIMIT, max_requests=0,
+                 graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT, on_worker_start=None):
+        """Set up - call run to start serving."""
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.connection_limit = connection_limit
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.on_worker_start = on_worker_start
+        self.children = dict()    # pid -> (slot, start time)
+        self.stopping = False
+        self.sock = None
+
+    def worker_max_requests(self):
+        """Requests before a new worker recycles - jittered so they don't all go at once."""
+        if not self.max_requests:
+            return 0
+        return self.max_requests + random.randint(0, self.max_requests // 10)
+
+    def spawn(self, slot):
+        """Fork a worker for slot."""
+        max_requests = self.worker_max_requests()   # Before the fork, or every child rolls the same
+        log.shutdown()   # Don't fork with the log listener thread mid-write
+        pid = os.fork()
+        if pid:
+            log.restart()
+            self.children[pid] = (slot, time.monotonic())
+            log.app_logger().info("Started worker %d (pid %d)", slot, pid)
+            return pid
+
+        # In the child
+        try:
+            for sig in (signal.SIGHUP, signal.SIGCHLD):
+                signal.signal(sig, signal.SIG_DFL)
+            log.restart()
+            worker = Worker(
+                self.app, self.sock, slot, self.threads, self.connection_limit,
+                max_requests, self.graceful_timeout
+            )
+            signal.signal(signal.SIGTERM, worker.retire)
+            signal.signal(signal.SIGINT, worker.retire)
+            if self.on_worker_start:
+                self.on_worker_start(self.app, slot)
+            worker.run()
+        except BaseException:
+            log.app_logger().exception("Worker %d failed", slot)
+            log.shutdown()
+        os._exit(1)
+
+    def signal_workers(self, sig):
+        """Send sig to every worker."""
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, *args):
+        """Signal handler: stop serving."""
+        self.stopping = True
+
+    def recycle(self, *args):
+        """Signal handler: gracefully replace every worker."""
+        log.app_logger().info("Recycling all workers")
+        self.signal_workers(signal.SIGTERM)
+
+    def reap(self):
+        """Collect exited workers. Returns [(slot, seconds it lived, status)]."""
+        gone = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            if pid in self.children:
+                slot, started = self.children.pop(pid)
+                gone.append((slot, time.monotonic() - started, status))
+        return gone
+
+    def run(self):
+        """Serve until told to stop."""
+        import multiprocessing
+
+        self.sock = bind(self.host, self.port)
+        share_writes(multiprocessing.Value('Q', 0))
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.recycle)
+
+        log.app_logger().info(
+            "Serving on %s:%d with %d workers (%d threads, %d connections each, recycle after %s requests)",
+            self.host or "[ALL IFaces]", self.port, self.workers, self.threads, self.connection_limit,
+            self.max_requests or 'unlimited'
+        )
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        while not self.stopping:
+            for slot, lived, status in self.reap():
+                if self.stopping:
+                    break
+                if status:
+                    log.app_logger().warning("Worker %d exited with status %d", slot, status)
+                if lived < MIN_WORKER_LIFE:
+                    time.sleep(MIN_WORKER_LIFE)
+                self.spawn(slot)
+            time.sleep(0.2)
+
+        log.app_logger().info("Stopping %d workers", len(self.children))
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.children:
+            log.app_logger().warning("Killing %d workers that didn't stop", len(self.children))
+            self.signal_workers(signal.SIGKILL)
+            for pid in list(self.children):
+                os.waitpid(pid, 0)
+        self.sock.close()
+
+
+def serve(app, host, port, workers, **kwrds):
+    """Serve app from workers processes (see Master for kwrds)."""
+    if not hasattr(os, 'fork'):
+        raise RuntimeError('WORKERS > 1 needs os.fork, which %s does not have' % sys.platform)
+    Master(app, host, port, workers, **kwrds).run()
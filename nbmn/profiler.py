@@ -0,0 +1,255 @@
+"""profiler - on-demand and sampling profilers for finding slow pages.
+
+On-demand: an admin adds `_profile=1` to the query string (or sends the header
+`X-Profile: 1`) and that one request runs under cProfile. A second thread
+samples the request thread's stack at the same time so we can also write a
+flamegraph-compatible collapsed-stack file. cProfile only hooks the thread
+that enables it, so other requests are unaffected. The report files land in
+PROFILE_DIR and the response gets an X-Profile-Id header; use `_profile=text`
+to get the cProfile report back instead of the page.
+
+Sampling: with PROFILE_SAMPLING on, a background thread periodically samples
+the stacks of every thread currently handling a request. That is cheap enough
+to leave running; the accumulated collapsed stacks are at /profile/samples.
+
+All the /profile routes are admin-only.
+"""
+
+# pylama:ignore=E501,D213
+
+import io
+import os
+import re
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from os.path import abspath, basename, isdir, join
+
+from flask import Blueprint, Response, abort, current_app, g, request, send_from_directory
+
+from .log import app_logger
+from .model import User
+
+profiler = Blueprint('profiler', __name__)
+
+MAX_DEPTH = 128
+MAX_STACKS = 20000
+REQUEST_SAMPLE_INTERVAL = 0.001
+
+PROFILE_ID_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+# thread ident -> endpoint for every request in progress
+_active = dict()
+
+_sampler = None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return '%s:%s' % (basename(code.co_filename), code.co_name)
+
+
+def collapse(frame, root=''):
+    """Return the stack for frame in collapsed format (outermost first)."""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ';'.join(reversed(labels))
+
+
+def folded(stacks):
+    """Format a Counter of collapsed stacks for flamegraph.pl and friends."""
+    return ''.join('%s %d\n' % (stack, count) for stack, count in stacks.most_common())
+
+
+class StackSampler(object):
+    """Sample the stacks of some threads from a background thread.
+
+    If thread_ids is given we sample just those threads, otherwise we sample
+    every thread currently handling a request.
+    """
+
+    def __init__(self, interval, thread_ids=None):
+        """Set up - call start to begin sampling."""
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the sampling thread."""
+        self.thread = threading.Thread(target=self.run, name='nbmn-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the thread to finish."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        """Sampling loop."""
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Take one sample."""
+        frames = sys._current_frames()
+        if self.thread_ids is not None:
+            targets = dict((tid, '') for tid in self.thread_ids)
+        else:
+            targets = dict(_active)
+
+        with self.lock:
+            self.samples += 1
+            for tid, root in targets.items():
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = collapse(frame, root)
+                if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] += 1
+
+    def folded(self, reset=False):
+        """Return the collected stacks in collapsed format."""
+        with self.lock:
+            text = folded(self.stacks)
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        return text
+
+
+def start_sampler(interval):
+    """Start the always-on sampling profiler."""
+    global _sampler
+    if _sampler is None:
+        app_logger().info("Starting sampling profiler every %.3fs", interval)
+        _sampler = StackSampler(interval).start()
+    return _sampler
+
+
+def _profile_dir():
+    return abspath(current_app.config.get('PROFILE_DIR', None) or 'profiles')
+
+
+def _requested():
+    mode = request.args.get('_profile', '') or request.headers.get('X-Profile', '')
+    return mode.strip().lower()
+
+
+def before_request():
+    """Request hook: track active requests and start a profile if asked."""
+    _active[threading.get_ident()] = request.endpoint or 'none'
+
+    mode = _requested()
+    if not mode:
+        return
+    if not User.get_user().admin:
+        # Debug only: anyone can send the header, so a warning would let them fill the log
+        app_logger().debug("Ignoring profile request from non-admin for %s", request.path)
+        return
+
+    sampler = StackSampler(REQUEST_SAMPLE_INTERVAL, [threading.get_ident()]).start()
+    prof = cProfile.Profile()
+    setattr(g, 'profile', (mode, prof, sampler, time.perf_counter()))
+    prof.enable()
+
+
+def after_request(response):
+    """Request hook: finish any profile and write the report files."""
+    _active.pop(threading.get_ident(), None)
+
+    running = g.get('profile', None)
+    if not running:
+        return response
+    mode, prof, sampler, start = running
+    prof.disable()
+    sampler.stop()
+    setattr(g, 'profile', None)
+    elapsed = time.perf_counter() - start
+
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    out.write('%s %s: %.3f ms wall, %d stack samples\n\n' % (request.method, request.full_path, elapsed * 1000.0, sampler.samples))
+    stats.sort_stats('cumulative').print_stats(60)
+    report = out.getvalue()
+
+    profile_id = '%s-%s-%s' % (time.strftime('%Y%m%d%H%M%S'), request.endpoint or 'none', uuid.uuid4().hex[:6])
+    target = _profile_dir()
+    try:
+        os.makedirs(target, exist_ok=True)
+        stats.dump_stats(join(target, profile_id + '.prof'))
+        with open(join(target, profile_id + '.txt'), 'w') as fh:
+            fh.write(report)
+        with open(join(target, profile_id + '.folded'), 'w') as fh:
+            fh.write(sampler.folded())
+        app_logger().info("Profile %s written to %s", profile_id, target)
+    except OSError as e:
+        app_logger().error("Could not write profile %s: %s", profile_id, e)
+
+    if mode == 'text':
+        response = Response(report, mimetype='text/plain')
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def teardown_request(exc):
+    """Request hook: never leave a dead thread in the active list.
+
+    If the view raised, after_request never ran: stop any profile here or it
+    keeps running on this pool thread for every later request.
+    """
+    _active.pop(threading.get_ident(), None)
+
+    running = g.get('profile', None)
+    if running:
+        _, prof, sampler, _ = running
+        prof.disable()
+        sampler.stop()
+        setattr(g, 'profile', None)
+        app_logger().warning("Dropped profile of %s %s: the request failed", request.method, request.path)
+
+
+def _require_admin():
+    if not User.get_user().admin:
+        abort(403)
+
+
+@profiler.route('/profile')
+def profile_list():
+    """List the stored profiles."""
+    _require_admin()
+    target = _profile_dir()
+    names = sorted(os.listdir(target), reverse=True) if isdir(target) else []
+    ids = [n[:-4] for n in names if n.endswith('.txt')]
+    return Response(''.join(i + '\n' for i in ids), mimetype='text/plain')
+
+
+@profiler.route('/profile/samples')
+def profile_samples():
+    """Collapsed stacks from the sampling profiler (add reset=1 to clear)."""
+    _require_admin()
+    if _sampler is None:
+        abort(404)
+    return Response(_sampler.folded(reset=bool(request.args.get('reset'))), mimetype='text/plain')
+
+
+@profiler.route('/profile/<profile_id>.<ext>')
+def profile_file(profile_id, ext):
+    """Return one of the files for a stored profile."""
+    _require_admin()
+    if ext not in ('txt', 'folded', 'prof') or not PROFILE_ID_RE.match(profile_id):
+        abort(404)
+    return send_from_directory(_profile_dir(), profile_id + '.' + ext, mimetype='text/plain' if ext != 'prof' else None)
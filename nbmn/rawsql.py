@@ -0,0 +1,96 @@
+"""rawsql - direct SQL for the few things gludb can't do for us.
+
+gludb only does lookups by id or by equality on an index. When the backend is
+a SQL database (sqlite or postgresql) we can reach past gludb to the backend's
+connection for range queries and schema changes. Callers should check dialect
+first: it returns None for any other backend, and then they need to fall back
+to plain gludb calls.
+
+Write queries with ? placeholders - we switch them to %s for postgresql.
+"""
+
+# pylama:ignore=E501,D213
+
+from gludb.config import get_mapping
+
+DIALECTS = ('sqlite', 'postgresql')
+
+
+def _backend(cls):
+    return get_mapping(cls).backend
+
+
+def dialect(cls):
+    """Return 'sqlite' or 'postgresql' for cls's backend, otherwise None."""
+    name = type(_backend(cls)).__module__.rsplit('.', 1)[-1]
+    return name if name in DIALECTS else None
+
+
+def value_col(cls):
+    """Column expression that selects the JSON value as text."""
+    return 'value::text' if dialect(cls) == 'postgresql' else 'value'
+
+
+def _sql(cls, sql):
+    return sql.replace('?', '%s') if dialect(cls) == 'postgresql' else sql
+
+
+def _run(cls, sql, params, fetch):
+    conn = _backend(cls)._conn()
+    with conn:  # Commits (or rolls back) for both sqlite3 and psycopg2
+        cur = conn.cursor()
+        try:
+            cur.execute(_sql(cls, sql), tuple(params))
+            return cur.fetchall() if fetch else None
+        finally:
+            cur.close()
+
+
+def query(cls, sql, params=()):
+    """Run a query against cls's database and return all the rows."""
+    return _run(cls, sql, params, True)
+
+
+def execute(cls, sql, params=()):
+    """Run a statement against cls's database."""
+    _run(cls, sql, params, False)
+
+
+def execute_all(cls, statements):
+    """Run a list of (sql, params) statements in a single transaction."""
+    conn = _backend(cls)._conn()
+    with conn:
+        cur = conn.cursor()
+        try:
+            for sql, params in statements:
+                cur.execute(_sql(cls, sql), tuple(params))
+        finally:
+            cur.close()
+
+
+def columns(cls):
+    """Return the set of column names in cls's table."""
+    table = cls.get_table_name()
+    if dialect(cls) == 'postgresql':
+        rows = query(cls, 'select column_name from information_schema.columns where table_name = ?', (table.lower(),))
+        return set(r[0] for r in rows)
+    return set(r[1] for r in query(cls, 'pragma table_info(%s)' % table))
+
+
+def find_in(cls, column, values, chunk=500):
+    """Objects of cls whose column (id or an index) is any of values."""
+    values = list(values)
+    table = cls.get_table_name()
+    result = []
+    for start in range(0, len(values), chunk):
+        part = values[start:start + chunk]
+        sql = 'select id, %s from %s where %s in (%s)' % (value_col(cls), table, column, ', '.join('?' * len(part)))
+        result.extend(load(cls, row) for row in query(cls, sql, part))
+    return result
+
+
+def load(cls, row):
+    """Create an object from a (id, value, ...) row - like gludb's finds."""
+    obj = cls.from_data(row[1])
+    assert str(row[0]).strip() == obj.id
+    return obj
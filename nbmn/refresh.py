@@ -0,0 +1,290 @@
+"""refresh - keep movie data fresh in the background.
+
+Movie.extdata records an update_time, but nothing used to look at it: data
+only changed when someone hit /badmovie or ran `./tools fixmovies`. When
+REFRESH_ENABLED is on, main.main starts a Refresher thread that wakes up every
+REFRESH_INTERVAL seconds and re-queries OMDB for the stalest movies:
+
+* only movies older than REFRESH_MAX_AGE days are candidates
+* movies shown in the last REFRESH_RECENT_DAYS days go first, then oldest
+  first
+* movies with a MovieOverride are skipped (the override IS the data)
+* we never make more than REFRESH_DAILY_BUDGET OMDB requests a day, and a
+  movie whose refresh failed isn't tried again until tomorrow
+* a failed lookup never replaces good data
+
+The day's budget (requests used, movies that failed) and the time of the last
+pass are kept in a RefreshState record, not in memory: with WORKERS > 1 the
+refresher lives in worker slot 0, which is replaced every time it recycles,
+and a new Refresher has to pick up where the old one stopped. For the same
+reason the first pass after a start waits out whatever is left of
+REFRESH_INTERVAL since the last pass, not the whole interval. The budget
+resets at midnight. Admins can see what it's doing at /admin/refresh, and
+`./tools refresh` runs a single pass by hand (out of the same budget).
+"""
+
+# pylama:ignore=E501,D213
+
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify
+from gludb.simple import DBObject, Field
+
+from .log import app_logger
+from .model import User, Movie, MovieOverride, Night
+from .remote import get_movie_data
+
+refresh = Blueprint('refresh', __name__)
+
+DEFAULT_REFRESH_INTERVAL = 600
+DEFAULT_REFRESH_DAILY_BUDGET = 200
+DEFAULT_REFRESH_MAX_AGE = 30
+DEFAULT_REFRESH_RECENT_DAYS = 90
+
+# str(datetime.now()) as written by remote.get_movie_data
+UPDATE_TIME_FMTS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+HISTORY_SIZE = 50
+
+STATE_ID = 'refresh'
+
+_refresher = None
+
+
+@DBObject(table_name='RefreshState')
+class RefreshState(object):
+    """Single record with the refresher's budget for the day."""
+
+    day = Field('')
+    used = Field(0)
+    failed = Field(list)    # imdbids whose refresh failed today
+    last_run = Field('')
+
+
+def _parse_time(raw):
+    raw = str(raw or '')
+    for fmt in UPDATE_TIME_FMTS:
+        try:
+            return datetime.strptime(raw, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def update_time(movie):
+    """When movie's remote data was last fetched (None if never or unknown)."""
+    return _parse_time((movie.extdata or {}).get('update_time', ''))
+
+
+def found(extdata):
+    """True if extdata holds a real OMDB reply.
+
+    get_movie_data normalizes failed lookups (like "Request limit reached!")
+    into a dict of empty fields, so we can't just check for omdb.
+    """
+    omdb = (extdata or {}).get('omdb', None) or {}
+    return str(omdb.get('Response', '')).lower() == 'true' or bool(omdb.get('Title', ''))
+
+
+class Refresher(object):
+    """Budgeted background refresh of stale movie data."""
+
+    def __init__(self, app):
+        """Set up - call start to begin the background thread."""
+        self.app = app
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.last_stale = 0
+        self.runs = 0
+
+    def config(self, key, default):
+        """Read our app's config."""
+        return self.app.config.get(key, default)
+
+    @property
+    def budget(self):
+        """OMDB requests allowed per day."""
+        return self.config('REFRESH_DAILY_BUDGET', DEFAULT_REFRESH_DAILY_BUDGET)
+
+    @property
+    def interval(self):
+        """Seconds between passes."""
+        return self.config('REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+
+    def state(self):
+        """Today's RefreshState, read fresh (an earlier process may have spent some)."""
+        state = RefreshState.find_one(STATE_ID) or RefreshState(id=STATE_ID)
+        today = str(date.today())
+        if state.day != today:
+            state.day = today
+            state.used = 0
+            state.failed = []
+        return state
+
+    def update_state(self, func):
+        """Apply func to the stored state and save it."""
+        with self.lock:
+            state = self.state()
+            func(state)
+            state.save()
+
+    def remaining(self):
+        """OMDB requests we can still make today."""
+        return max(self.budget - self.state().used, 0)
+
+    def first_wait(self, now=None):
+        """Seconds before our first pass: what's left of the interval since the last one."""
+        last = _parse_time(self.state().last_run)
+        if last is None:
+            return self.interval
+        since = ((now or datetime.now()) - last).total_seconds()
+        return min(max(self.interval - since, 0), self.interval)
+
+    def start(self):
+        """Start the refresh thread."""
+        self.thread = threading.Thread(target=self.run, name='nbmn-refresh', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop refreshing and wait for the thread to finish."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        """Refresh loop."""
+        try:
+            wait = self.first_wait()
+        except Exception:
+            app_logger().exception("Could not read the movie refresh state")
+            wait = self.interval
+        while not self.stopping.wait(wait):
+            wait = self.interval
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                app_logger().exception("Movie refresh pass failed")
+
+    def candidates(self, now=None):
+        """Stale movies in the order we want to refresh them."""
+        now = now or datetime.now()
+        max_age = timedelta(days=self.config('REFRESH_MAX_AGE', DEFAULT_REFRESH_MAX_AGE))
+        recent_ord = (now - timedelta(days=self.config('REFRESH_RECENT_DAYS', DEFAULT_REFRESH_RECENT_DAYS))).toordinal()
+
+        failed = set(self.state().failed)
+        overridden = set(o.imdbid for o in MovieOverride.find_all())
+        recent = set(n.imdbid for n in Night.find_all() if n.dateord >= recent_ord)
+
+        stale = []
+        for movie in Movie.find_all():
+            if not movie.imdbid or movie.imdbid in overridden:
+                continue
+            if movie.imdbid in failed:
+                continue
+            updated = update_time(movie)
+            if updated and now - updated < max_age:
+                continue
+            stale.append((movie.imdbid not in recent, updated or datetime.min, movie.name, movie))
+        stale.sort(key=lambda s: s[:3])
+        return [s[3] for s in stale]
+
+    def refresh_movie(self, movie):
+        """Re-query OMDB for one movie. Returns True if it was updated."""
+        def spend(state):
+            state.used += 1
+
+        self.update_state(spend)
+        try:
+            extdata = get_movie_data(movie.imdbid)
+        except Exception as e:
+            app_logger().warning("Refresh of %s failed: %s", movie.imdbid, e)
+            extdata = dict()
+
+        ok = found(extdata)
+        if ok:
+            movie.extdata = extdata
+            movie.name = extdata['omdb'].get('Title', '').strip() or movie.name
+            movie.save()
+        else:
+            def fail(state):
+                if movie.imdbid not in state.failed:
+                    state.failed.append(movie.imdbid)
+
+            self.update_state(fail)
+
+        with self.lock:
+            self.history.appendleft({
+                'time': str(datetime.now()),
+                'imdbid': movie.imdbid,
+                'name': movie.name,
+                'result': 'refreshed' if ok else 'failed',
+            })
+        return ok
+
+    def run_once(self, now=None):
+        """One refresh pass: as many stale movies as the budget allows."""
+        todo = self.candidates(now)
+        refreshed = 0
+        for movie in todo:
+            if self.stopping.is_set() or not self.remaining():
+                break
+            if self.refresh_movie(movie):
+                refreshed += 1
+
+        def ran(state):
+            state.last_run = str(datetime.now())
+
+        self.update_state(ran)
+        with self.lock:
+            self.last_stale = len(todo)
+            self.runs += 1
+        if todo:
+            app_logger().info("Refreshed %d of %d stale movies (%d requests left today)", refreshed, len(todo), self.remaining())
+        return refreshed
+
+    def status(self):
+        """Dict describing what we've been doing."""
+        state = self.state()
+        with self.lock:
+            return {
+                'running': bool(self.thread and self.thread.is_alive()),
+                'interval': self.interval,
+                'day': state.day,
+                'budget': self.budget,
+                'used': state.used,
+                'remaining': max(self.budget - state.used, 0),
+                'failed_today': sorted(state.failed),
+                'runs': self.runs,
+                'last_run': state.last_run or None,
+                'stale_at_last_run': self.last_stale,
+                'history': list(self.history),
+            }
+
+
+def start_refresher(app):
+    """Start the background refresher for app (only once per process)."""
+    global _refresher
+    if _refresher is None:
+        app_logger().info(
+            "Starting movie refresh every %ds with a daily budget of %d",
+            app.config.get('REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL),
+            app.config.get('REFRESH_DAILY_BUDGET', DEFAULT_REFRESH_DAILY_BUDGET),
+        )
+        _refresher = Refresher(app).start()
+    return _refresher
+
+
+@refresh.route('/admin/refresh')
+def refresh_status():
+    """Status of the background movie refresh (admin only)."""
+    if not User.get_user().admin:
+        abort(403)
+    if _refresher is None:
+        return jsonify(running=False, enabled=current_app.config.get('REFRESH_ENABLED', False))
+    return jsonify(enabled=True, **_refresher.status())
@@ -54,12 +54,59 @@ Many of the fields might contain "N/A" (Not Applicable).
 
 # pylama:ignore=E501,D213
 
+import math
+import time
+import socket
 from datetime import datetime
-import requests
 
 from flask import current_app
 
+from .cache import LRUCache, SingleFlight
 from .imdb import norm_imdbid
+from .log import app_logger
+
+DEFAULT_OMDB_BASE_URL = "http://www.omdbapi.com/"
+DEFAULT_OMDB_POSTER_URL = "http://img.omdbapi.com/"
+DEFAULT_OMDB_TIMEOUT = 10
+
+DEFAULT_SEARCH_CACHE_SIZE = 200
+DEFAULT_SEARCH_TTL = 86400
+
+# OMDB returns 10 search results per page
+SEARCH_PAGE_SIZE = 10
+
+# The only OMDB error worth caching: the rest ("Invalid API key!", "Request
+# limit reached!", ...) say nothing about the query
+SEARCH_NOT_FOUND = 'Movie not found!'
+
+_search_cache = LRUCache(DEFAULT_SEARCH_CACHE_SIZE, name='omdb_search')
+_search_flight = SingleFlight()
+
+
+def force_ipv4():
+    """Make requests/urllib3 resolve hosts to IPv4 only.
+
+    TODO: see deployment.md - need to switch our server deployment
+    """
+    import requests.packages.urllib3.util.connection as urllib3_cn
+
+    def allowed_gai_family():
+        return socket.AF_INET
+
+    urllib3_cn.allowed_gai_family = allowed_gai_family
+
+
+_requests = None
+
+
+def http():
+    """Return the requests module - imported (and patched) on first use."""
+    global _requests
+    if _requests is None:
+        import requests
+        force_ipv4()
+        _requests = requests
+    return _requests
 
 
 def get_movie_data(imdbid):
@@ -80,7 +127,16 @@ def get_movie_data(imdbid):
     }
 
 
-def create_omdb_get(omdb_id, base="http://www.omdbapi.com/"):
+def _omdb_url(key, default):
+    """OMDB endpoint from config - point these at `./tools omdbstub` to test offline."""
+    return current_app.config.get(key, "") or default
+
+
+def _omdb_timeout():
+    return current_app.config.get("OMDB_TIMEOUT", DEFAULT_OMDB_TIMEOUT)
+
+
+def create_omdb_get(omdb_id, base=None):
     """Return a requests GET for OMDB API."""
     apikey = current_app.config.get("OMDB_API_KEY", "").strip()
     if not apikey:
@@ -90,7 +146,7 @@ def create_omdb_get(omdb_id, base="http://www.omdbapi.com/"):
     if not omdb_id:
         return None
 
-    return requests.get(base, params={
+    return http().get(base or _omdb_url("OMDB_BASE_URL", DEFAULT_OMDB_BASE_URL), timeout=_omdb_timeout(), params={
         'apikey':   apikey,
         'i':        omdb_id,
         'r':        'json',
@@ -99,7 +155,7 @@ def create_omdb_get(omdb_id, base="http://www.omdbapi.com/"):
     })
 
 
-def create_omdb_poster_get(omdb_id, base="http://img.omdbapi.com/"):
+def create_omdb_poster_get(omdb_id, base=None):
     """Return a requests GET for OMDB API."""
     apikey = current_app.config.get("OMDB_API_KEY", "").strip()
     if not apikey:
@@ -109,12 +165,123 @@ def create_omdb_poster_get(omdb_id, base="http://img.omdbapi.com/"):
     if not omdb_id:
         return None
 
-    return requests.get(base, params={
+    return http().get(base or _omdb_url("OMDB_POSTER_URL", DEFAULT_OMDB_POSTER_URL), timeout=_omdb_timeout(), params={
         'apikey':   apikey,
         'i':        omdb_id
     })
 
 
+def create_omdb_search(query, page=1, base=None):
+    """Return a requests GET for an OMDB API title search."""
+    apikey = current_app.config.get("OMDB_API_KEY", "").strip()
+    if not apikey:
+        raise ValueError("No OMDB API Key supplied in configuration!")
+
+    return http().get(base or _omdb_url("OMDB_BASE_URL", DEFAULT_OMDB_BASE_URL), timeout=_omdb_timeout(), params={
+        'apikey':   apikey,
+        's':        query,
+        'page':     page,
+        'r':        'json',
+    })
+
+
+def norm_search_query(query):
+    """Search queries are case and whitespace insensitive."""
+    return ' '.join(str(query or '').lower().split())
+
+
+def search_titles(query, page=1):
+    """Search OMDB by title, returning a page of candidates.
+
+    Results are cached per (query, page) for OMDB_SEARCH_TTL seconds, and
+    identical searches running at the same time share one OMDB request. Only
+    real answers are cached (results or "Movie not found!"): an HTTP or OMDB
+    error gives an empty page this time and is asked again next time. The
+    result is a dict:
+
+    {
+        'query': 'normalized query',
+        'page': int,
+        'pages': int,  // total pages available
+        'total': int,  // total results
+        'results': [{'Title', 'Year', 'imdbID', 'Type', 'Poster'}, ...]
+    }
+    """
+    query = norm_search_query(query)
+    page = max(1, int(page or 1))
+    if not query:
+        return _norm_omdb_search(dict(), query, page)
+
+    size = current_app.config.get('OMDB_SEARCH_CACHE_SIZE', DEFAULT_SEARCH_CACHE_SIZE)
+    if size != _search_cache.maxsize:
+        _search_cache.resize(size)
+    ttl = current_app.config.get('OMDB_SEARCH_TTL', DEFAULT_SEARCH_TTL)
+
+    key = (query, page)
+    cached = _search_cache.get(key)
+    if cached and (not ttl or time.time() - cached[0] < ttl):
+        return cached[1]
+
+    def fetch():
+        resp = create_omdb_search(query, page)
+        if not 200 <= resp.status_code < 300:
+            app_logger().warning("OMDB search for %r failed: HTTP %s", query, resp.status_code)
+            return _norm_omdb_search(dict(), query, page)
+
+        data = resp.json()
+        result = _norm_omdb_search(data, query, page)
+        if _search_answered(data):
+            _search_cache.set(key, (time.time(), result))
+        else:
+            app_logger().warning("OMDB search for %r failed: %s", query, data.get("Error", "no error given"))
+        return result
+
+    return _search_flight.do(key, fetch)
+
+
+def _search_answered(resp):
+    """True if an OMDB search reply is an answer to the query (so cacheable)."""
+    if str(resp.get("Response", "")).lower() == "true":
+        return True
+    return str(resp.get("Error", "")).strip() == SEARCH_NOT_FOUND
+
+
+def _norm_omdb_search(resp, query, page):
+    """Normalize an OMDB search response (see search_titles)."""
+    results = []
+    if str(resp.get("Response", "")).lower() == "true":
+        for item in resp.get("Search", None) or []:
+            imdbid = norm_imdbid(item.get('imdbID', ''))
+            if not imdbid:
+                continue
+            year = str(item.get('Year', '')).strip()
+            try:
+                year = int(year)
+            except ValueError:
+                pass  # Series have year ranges
+            poster = str(item.get('Poster', '')).strip()
+            results.append({
+                'Title': str(item.get('Title', '')).strip(),
+                'Year': year,
+                'imdbID': imdbid,
+                'Type': str(item.get('Type', '')).strip(),
+                'Poster': '' if poster.upper() == "N/A" else poster,
+            })
+
+    try:
+        total = int(resp.get('totalResults', 0))
+    except (TypeError, ValueError):
+        total = len(results)
+
+    return {
+        'query': query,
+        'page': page,
+        'pages': int(math.ceil(total / float(SEARCH_PAGE_SIZE))),
+        'total': total,
+        'results': results,
+    }
+
+
 # Simple mapper from omdbapi.com to the format we expect from rot tom
 # in imdb format
 def _omdb_get(omdb_id):
@@ -0,0 +1,208 @@
+"""schema - database schema version marker and migrations.
+
+We keep a single SchemaInfo record that says which schema version the
+database is at and which oligarchs have been seeded. A warm start is then one
+find_one on that record: no table DDL and no Attendee scan. When the version
+(or the oligarch list) changes, ensure_schema runs the missing migrations in
+order and then updates the marker.
+
+Migrations are registered with the migration decorator and MUST be safe to
+run more than once - two workers can start at the same time, and `./tools
+migrate --force` re-runs everything.
+
+Migrations run with the dbhook write listeners paused: an early migration
+that saves (like night_dates) runs before the tables the listeners keep
+(the catalog, attendance) exist. Those tables are rebuilt by their own
+migrations, so a new migration that saves movies or nights after them has
+to rebuild them too.
+"""
+
+# pylama:ignore=E501,D213
+
+from gludb.config import get_mapping
+from gludb.simple import DBObject, Field
+
+from . import rawsql, catalog, attendance
+from .dbhook import listeners_paused
+from .log import app_logger
+from .model import User, Movie, MovieOverride, Night, Attendee
+from .refresh import RefreshState
+
+# Bump this (and add a migration) whenever the tables change
+SCHEMA_VERSION = 7
+
+MARKER_ID = 'schema'
+
+MIGRATIONS = dict()
+
+
+@DBObject(table_name='SchemaInfo')
+class SchemaInfo(object):
+    """Single record marking the current schema version."""
+
+    version = Field(0)
+    seeded = Field(list)
+
+
+def migration(version):
+    """Decorator registering a function as the migration to version."""
+    def dec(f):
+        if version in MIGRATIONS:
+            raise ValueError('Duplicate migration for schema version %d' % version)
+        MIGRATIONS[version] = f
+        return f
+    return dec
+
+
+def _seed_names():
+    return sorted(Attendee.OLIGARCHS)
+
+
+def _rollback(cls):
+    """Clear a failed transaction (postgresql) so we can keep going."""
+    conn = getattr(get_mapping(cls).backend, '_conn', None)
+    if conn:
+        rollback = getattr(conn(), 'rollback', None)
+        if rollback:
+            rollback()
+
+
+def ensure_table(cls):
+    """Like cls.ensure_table, but it also adds missing index columns.
+
+    gludb's ensure_table only creates missing tables, and then fails to
+    create the db index for an @Index added since. For SQL backends we add
+    the missing columns ourselves first. The new columns are empty: use
+    add_index to fill them in.
+    """
+    existing = rawsql.columns(cls) if rawsql.dialect(cls) else set()
+    if existing:
+        for name in cls.index_names() or []:
+            if name not in existing:
+                app_logger().warning("Adding column %s.%s", cls.get_table_name(), name)
+                rawsql.execute(cls, 'alter table %s add column %s text' % (cls.get_table_name(), name))
+    cls.ensure_table()
+
+
+def add_index(cls, index_name):
+    """Add a new @Index to an existing table and fill it in.
+
+    For SQL backends we backfill the column directly, without re-saving, so
+    the stamps don't change. Other backends don't have columns, so there we
+    just re-save everything.
+    """
+    if not rawsql.dialect(cls):
+        for obj in cls.find_all():
+            obj.save()
+        return
+
+    ensure_table(cls)
+    update = 'update %s set %s = ? where id = ?' % (cls.get_table_name(), index_name)
+    for obj in cls.find_all():
+        rawsql.execute(cls, update, (obj.indexes()[index_name], obj.id))
+
+
+def read_marker():
+    """Return the SchemaInfo marker, or None if the database has none yet."""
+    try:
+        return SchemaInfo.find_one(MARKER_ID)
+    except Exception as e:
+        # Most likely the table doesn't exist yet: a new (or pre-marker)
+        # database. Either way, the migrations will sort it out.
+        app_logger().info("No schema marker found (%s)", e)
+        _rollback(SchemaInfo)
+        return None
+
+
+def ensure_schema(force=False):
+    """Bring the database up to SCHEMA_VERSION.
+
+    Returns True if anything was done.
+    """
+    marker = read_marker()
+    version = marker.version if marker else 0
+    seeded = marker.seeded if marker else []
+
+    if version > SCHEMA_VERSION:
+        app_logger().warning(
+            "Database schema version %d is newer than ours (%d): skipping migrations",
+            version, SCHEMA_VERSION
+        )
+        return False
+
+    if not force and version == SCHEMA_VERSION and seeded == _seed_names():
+        return False
+
+    SchemaInfo.ensure_table()
+    if not marker:
+        marker = SchemaInfo(id=MARKER_ID)
+    if force:
+        version = 0
+
+    with listeners_paused():
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            app_logger().warning("Migrating database schema to version %d", target)
+            MIGRATIONS[target]()
+            marker.version = target
+            marker.save()
+
+    if force or seeded != _seed_names():
+        app_logger().info("Seeding attendees: %s", _seed_names())
+        Attendee.ensure_attendees()
+        marker.seeded = _seed_names()
+        marker.save()
+
+    return True
+
+
+@migration(1)
+def initial_tables():
+    """Original tables."""
+    for cls in (User, Movie, MovieOverride, Night, Attendee):
+        ensure_table(cls)
+
+
+@migration(2)
+def movie_name_index():
+    """Movies are paged by name."""
+    add_index(Movie, 'index_name')
+    add_index(MovieOverride, 'index_name')
+
+
+@migration(3)
+def night_dates():
+    """Nights store their parsed and formatted dates."""
+    count = Night.backfill_dates()
+    app_logger().info("Stored dates for %d nights", count)
+
+
+@migration(4)
+def movie_catalog():
+    """Typed movie catalog tables (SQL backends only)."""
+    if not catalog.available():
+        app_logger().info("No movie catalog for this database backend")
+        return
+    count = catalog.rebuild()
+    app_logger().info("Cataloged %d movies", count)
+
+
+@migration(5)
+def night_imdbid_index():
+    """Nights are found by movie for the movie filters."""
+    add_index(Night, 'index_imdbid')
+
+
+@migration(6)
+def night_attendance():
+    """Attendance table for the people list (SQL backends only)."""
+    if not attendance.available():
+        app_logger().info("No attendance table for this database backend")
+        return
+    count = attendance.rebuild()
+    app_logger().info("Stored attendance for %d nights", count)
+
+
+@migration(7)
+def refresh_state():
+    """The movie refresh keeps its daily budget in the database."""
+    ensure_table(RefreshState)
@@ -7,10 +7,10 @@ with the variable `SLACK_HOOK`
 
 # pylama:ignore=D213,E501
 
-import requests
 from flask import current_app
 
 from .log import app_logger
+from .remote import http
 
 
 def notify(msg, *args):
@@ -28,6 +28,7 @@ def notify(msg, *args):
         log.warn("Slack NOT notified: no message specified")
         return
 
+    requests = http()
     r = requests.post(hook, json={
         "channel": "#general",
         "username": "Movie Night Monkey",
@@ -0,0 +1,144 @@
+"""synth - seeded synthetic data for benchmarks and offline testing.
+
+Everything here is driven by a random.Random instance, so the same seed always
+produces the same movies, nights, and attendees. Movie data is generated in the
+raw OMDB response format (see remote.py) and then run through the same
+normalization we use for real responses, so the extdata we save looks like
+what Movie.find_by_imdb would have stored.
+"""
+
+# pylama:ignore=E501,D213
+
+import random
+from datetime import datetime, timedelta
+
+from .imdb import norm_imdbid
+from .remote import _norm_omdb_resp
+
+WORDS = [
+    'Night', 'Return', 'Dark', 'Last', 'Blood', 'City', 'Love', 'Dead', 'Man',
+    'Star', 'Secret', 'Big', 'Lost', 'House', 'War', 'Time', 'King', 'Final',
+    'Summer', 'Shadow', 'Fire', 'Ghost', 'Killer', 'Road', 'Island', 'Moon',
+    'Empire', 'Storm', 'Iron', 'Silent', 'Wild', 'Golden', 'Red', 'Hunter',
+]
+
+FIRST_NAMES = [
+    'Alex', 'Beth', 'Carl', 'Dana', 'Eric', 'Faye', 'Gus', 'Hana', 'Ivan',
+    'Jill', 'Kurt', 'Lena', 'Milo', 'Nora', 'Otto', 'Pam', 'Quin', 'Rosa',
+    'Sam', 'Tess', 'Umar', 'Vera', 'Walt', 'Xena', 'Yuri', 'Zoe',
+]
+
+LAST_NAMES = [
+    'Abbott', 'Baker', 'Carver', 'Dunn', 'Ellis', 'Frost', 'Grant', 'Hale',
+    'Irwin', 'Jones', 'Keller', 'Lowe', 'Mercer', 'Nash', 'Owens', 'Pike',
+    'Reyes', 'Stone', 'Tate', 'Vance', 'Webb', 'York',
+]
+
+GENRES = [
+    'Action', 'Adventure', 'Comedy', 'Crime', 'Drama', 'Fantasy', 'Horror',
+    'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'Western',
+]
+
+RATINGS = ['G', 'PG', 'PG-13', 'R', 'N/A']
+
+MEALS = [
+    'Tacos', 'Chili', 'Pizza', 'Gumbo', 'Ribs', 'Curry', 'Lasagna', 'Pho',
+    'Brisket', 'Burgers', 'Jambalaya', 'Ramen', 'Pot Roast', 'Enchiladas',
+]
+
+
+def _person(rng):
+    return '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+
+
+def _people(rng, lo, hi):
+    return ', '.join(_person(rng) for _ in range(rng.randint(lo, hi)))
+
+
+def imdbid_for(num):
+    """Return the synthetic IMDB ID for the given movie number."""
+    return norm_imdbid(9000000 + num)
+
+
+def omdb_record(rng, imdbid):
+    """Return a raw (un-normalized) OMDB response for a made-up movie."""
+    year = rng.randint(1950, 2020)
+    released = datetime(year, rng.randint(1, 12), rng.randint(1, 28))
+    title = ' '.join(rng.sample(WORDS, rng.randint(1, 4)))
+    return {
+        'Title': title,
+        'Year': str(year),
+        'Rated': rng.choice(RATINGS),
+        'Released': released.strftime('%d %b %Y'),
+        'Runtime': '%d min' % rng.randint(75, 180),
+        'Genre': ', '.join(rng.sample(GENRES, rng.randint(1, 3))),
+        'Director': _people(rng, 1, 2),
+        'Writer': _people(rng, 1, 3),
+        'Actors': _people(rng, 3, 4),
+        'Plot': ' '.join(rng.choice(WORDS).lower() for _ in range(rng.randint(12, 30))) + '.',
+        'Language': 'English',
+        'Country': rng.choice(['USA', 'UK', 'France', 'Japan']),
+        'Awards': '%d wins & %d nominations.' % (rng.randint(0, 20), rng.randint(0, 40)),
+        'Poster': 'N/A',
+        'Metascore': str(rng.randint(20, 99)),
+        'imdbRating': '%.1f' % rng.uniform(2.0, 9.5),
+        'imdbVotes': str(rng.randint(100, 900000)),
+        'imdbID': imdbid,
+        'Type': 'movie',
+        'DVD': (released + timedelta(days=rng.randint(90, 400))).strftime('%d %b %Y'),
+        'BoxOffice': 'N/A',
+        'Production': 'N/A',
+        'Website': 'N/A',
+        'Response': 'True',
+    }
+
+
+def movie_extdata(rng, imdbid):
+    """Return extdata for a Movie exactly as get_movie_data would."""
+    return {
+        'update_time': str(datetime.now() - timedelta(days=rng.randint(0, 720))),
+        'omdb': _norm_omdb_resp(omdb_record(rng, imdbid)),
+    }
+
+
+def populate(nights, movies, attendees, seed=42, end=None):
+    """Create and save a complete synthetic data set.
+
+    nights are weekly, ending on `end` (default today) and going backwards.
+    Every night is attended by the oligarchs plus a few of the attendees, and
+    shows one of the movies. Returns a dict of the counts actually saved.
+    """
+    from .model import Attendee, Movie, Night
+
+    rng = random.Random(seed)
+
+    names = sorted(Attendee.OLIGARCHS)
+    while len(names) < attendees:
+        name = _person(rng)
+        if name not in names:
+            names.append(name)
+    Attendee.ensure_attendees(names)
+
+    titles = dict()
+    movie_ids = [imdbid_for(i + 1) for i in range(movies)]
+    for imdbid in movie_ids:
+        extdata = movie_extdata(rng, imdbid)
+        titles[imdbid] = extdata['omdb']['Title']
+        Movie(imdbid=imdbid, name=titles[imdbid], extdata=extdata).save()
+
+    end = end or datetime.now()
+    guests = names[len(Attendee.OLIGARCHS):]
+    for i in range(nights):
+        imdbid = rng.choice(movie_ids) if movie_ids else ''
+        extra = rng.sample(guests, min(len(guests), rng.randint(0, 5)))
+        Night(
+            datestr=end - timedelta(weeks=i),
+            imdbid=imdbid,
+            moviename=titles.get(imdbid, ''),
+            dinner=rng.choice(MEALS),
+            comments='<p>%s</p>' % ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 40))),
+            attendees=sorted(Attendee.OLIGARCHS) + sorted(extra),
+            ccsi=rng.randint(0, 3),
+        ).save()
+
+    return {'nights': nights, 'movies': len(movie_ids), 'attendees': len(names)}
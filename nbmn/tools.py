@@ -39,6 +39,11 @@ def env_var(key, value):
         os.environ[key] = old_val
 
 
+def _config_file():
+    """The config file used by commands that need the app."""
+    return os.path.abspath('./current.config')
+
+
 def command(need_db=False):
     """Decorator for capturing commands."""
     def dec(f):
@@ -110,7 +115,133 @@ def testrun(opts):
         return subprocess.run(['./run'] + opts).returncode
 
 
-@command(need_db=True)
+@command(need_db=False)
+def bench(opts):
+    """Benchmark routes against synthetic data (try --help)."""
+    from .bench import main as bench_main
+    return bench_main(opts)
+
+
+@command(need_db=False)
+def loadtest(opts):
+    """Drive a running instance with a mix of routes (try --help)."""
+    from .loadtest import main as loadtest_main
+    return loadtest_main(opts)
+
+
+@command(need_db=False)
+def importtime(opts):
+    """Report import times for app startup (--tools for the tools path)."""
+    parser = argparse.ArgumentParser(description=importtime.__doc__)
+    parser.add_argument('--tools', default=False, action='store_true', help='Time the tools (no blueprints) startup instead')
+    parser.add_argument('--top', default=25, type=int, help='Number of modules to list')
+    args = parser.parse_args(opts)
+
+    code = 'import time; t = time.perf_counter(); import main; main.create_app(blueprints=%s); print("STARTUP %%f" %% (time.perf_counter() - t))' % (not args.tools)
+    with env_var('NBMN_CONFIG', _config_file()):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        return proc.returncode
+
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            self_us, cumul_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # The header line
+        times.append((cumul_us, self_us, parts[2].rstrip()))
+
+    startup = [line for line in proc.stdout.splitlines() if line.startswith('STARTUP ')]
+    print('Startup (%s): %.1f ms in create_app, %d modules imported' % (
+        'tools' if args.tools else 'web',
+        float(startup[-1].split()[1]) * 1000.0 if startup else -1.0,
+        len(times)
+    ))
+    print('%10s %10s   %s' % ('Cumul ms', 'Self ms', 'Module'))
+    for cumul_us, self_us, name in sorted(times, reverse=True)[:args.top]:
+        print('%10.1f %10.1f   %s' % (cumul_us / 1000.0, self_us / 1000.0, name))
+    return 0
+
+
+@command(need_db=False)
+def omdbstub(opts):
+    """Serve a local stand-in for the OMDB API (try --help)."""
+    from waitress import serve
+    from .omdbstub import OMDBStub
+
+    parser = argparse.ArgumentParser(description=omdbstub.__doc__)
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', default=8089, type=int, help='Port to listen on')
+    parser.add_argument('--fixtures', default='test/omdb', help='Directory of recorded <imdbid>.json responses')
+    parser.add_argument('--movies', default=500, type=int, help='Number of synthetic movies (see nbmn/synth.py)')
+    parser.add_argument('--seed', default=42, type=int, help='Seed for the synthetic movies and the dice')
+    parser.add_argument('--latency', default=0.0, type=float, help='Seconds added to every response')
+    parser.add_argument('--jitter', default=0.0, type=float, help='Up to this many more seconds at random')
+    parser.add_argument('--error-rate', default=0.0, type=float, help='Fraction of requests failing with a 503')
+    parser.add_argument('--false-rate', default=0.0, type=float, help='Fraction of requests answered with Response: False')
+    parser.add_argument('--apikey', default='', help='Only accept this API key (default: any non-empty key)')
+    parser.add_argument('--threads', default=8, type=int, help='Server threads')
+    args = parser.parse_args(opts)
+
+    stub = OMDBStub(
+        fixture_dir=args.fixtures, movies=args.movies, seed=args.seed,
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, false_rate=args.false_rate,
+        apikey=args.apikey,
+    )
+    print('OMDB stub: %d recorded and %d synthetic movies' % (len(stub.fixtures), len(stub.synthetic)))
+    print('Set OMDB_BASE_URL="http://%s:%d/" and OMDB_POSTER_URL="http://%s:%d/img/"' % (args.host, args.port, args.host, args.port))
+    serve(stub.create_app(), host=args.host, port=args.port, threads=args.threads)
+
+
+@command(need_db=False)
+def assets(opts):
+    """Build fingerprinted, precompressed static assets (try --help)."""
+    from .assets import Builder, fetch_vendor, DEFAULT_ASSET_DIR, STATIC_DIR
+    from .remote import http
+
+    parser = argparse.ArgumentParser(description=assets.__doc__)
+    parser.add_argument('--out', default=DEFAULT_ASSET_DIR, help='Output directory (should match ASSET_DIR)')
+    parser.add_argument('--fetch', default=False, action='store_true', help='First download any missing static/vendor files')
+    parser.add_argument('--no-minify', default=False, action='store_true', help="Bundle our JS and CSS as-is")
+    parser.add_argument('--clean', default=False, action='store_true', help='Remove old files not in the new build')
+    args = parser.parse_args(opts)
+
+    if args.fetch:
+        try:
+            for rel in fetch_vendor(STATIC_DIR, http()):
+                print('Fetched vendor/%s' % rel)
+        except Exception as e:
+            print('Could not fetch the vendor files: %s' % e)
+            return 1
+
+    builder = Builder(STATIC_DIR, args.out, minify=not args.no_minify)
+    try:
+        manifest = builder.build()
+    except FileNotFoundError as e:
+        print('Missing %s - try --fetch' % e.filename)
+        return 1
+
+    for warning in builder.warnings:
+        print('WARNING: %s' % warning)
+    for name, built in sorted(manifest['files'].items()):
+        print('%-12s -> %s' % (name, built))
+    if args.clean:
+        for name in builder.clean():
+            print('Removed %s' % name)
+    print('Wrote %s - restart the app to use it' % os.path.join(args.out, 'manifest.json'))
+    return 0
+
+
+@command(need_db=False)
 def list_routes(opts):
     """Attempt to list all routes in the app."""
     data = sorted(_find_routes())
@@ -136,7 +267,9 @@ def list_routes(opts):
 
 
 def _find_routes():
-    from main import app
+    with env_var('NBMN_CONFIG', _config_file()):
+        from main import create_app
+        app = create_app()
     SKIPS = {'HEAD', 'OPTIONS'}
     print('METHODS SKIPPED: {}'.format(SKIPS))
     for rule in app.url_map.iter_rules():
@@ -167,6 +300,34 @@ def fixmovies(opts):
     print('Finished.')
 
 
+@command(need_db=True)
+def refresh(opts):
+    """One budgeted pass of the stale movie refresh (see nbmn/refresh.py)."""
+    from flask import current_app
+    from .refresh import Refresher
+
+    parser = argparse.ArgumentParser(description=refresh.__doc__)
+    parser.add_argument('--dry-run', default=False, action='store_true', help='Only list the movies we would refresh')
+    parser.add_argument('--budget', default=None, type=int, help='Override REFRESH_DAILY_BUDGET')
+    args = parser.parse_args(opts)
+
+    if args.budget is not None:
+        current_app.config['REFRESH_DAILY_BUDGET'] = args.budget
+    refresher = Refresher(current_app._get_current_object())
+
+    todo = refresher.candidates()
+    print('Found %d stale movies (%d of %d requests left today)' % (len(todo), refresher.remaining(), refresher.budget))
+    if args.dry_run:
+        for movie in todo[:refresher.remaining()]:
+            print('Would refresh %s %s' % (movie.imdbid, movie.name))
+        return
+
+    refresher.run_once()
+    for item in reversed(refresher.history):
+        print('%s %s => %s' % (item['imdbid'], item['result'], item['name']))
+    print('Finished.')
+
+
 @command(need_db=True)
 def fixpeeps(opts):
     """Create any necessary Attendee records using current.config."""
@@ -234,6 +395,117 @@ def orphanmovies(opts):
     print('Finished.')
 
 
+@command(need_db=True)
+def integrity(opts):
+    """One pass data check: dup movies/nights, orphans, missing people/movies."""
+    import json
+    from . import integrity as checks
+
+    parser = argparse.ArgumentParser(description=integrity.__doc__)
+    parser.add_argument('--fix', default=False, action='store_true', help='Delete dup movies, create missing attendees, fetch missing movies')
+    parser.add_argument('--delete-orphans', default=False, action='store_true', help='With --fix, also delete orphan movies')
+    parser.add_argument('--no-fetch', default=False, action='store_true', help='With --fix, skip fetching missing movies from OMDB')
+    parser.add_argument('--output', default=None, help='Write the JSON report here ("-" for stdout)')
+    parser.add_argument('--chunk', default=checks.DEFAULT_CHUNK, type=int, help='Rows read per query')
+    args = parser.parse_args(opts)
+
+    # With a JSON report on stdout, the text goes to stderr
+    out = sys.stderr if args.output == '-' else sys.stdout
+
+    def say(msg):
+        print(msg, file=out)
+
+    say('Scanning Nights, Movies and Attendees...')
+    report = checks.scan(chunk=args.chunk)
+    say('...Read %(nights)d nights, %(movies)d movies, %(attendees)d attendees' % report['counts'])
+
+    for imdbid, ids in report['duplicate_movies'].items():
+        say('DUP MOVIE: %s x%d' % (imdbid, len(ids)))
+    for datestr, ids in report['duplicate_nights'].items():
+        say('DUP NIGHT: %s x%d (fix by hand)' % (datestr, len(ids)))
+    for orphan in report['orphan_movies']:
+        say('ORPHAN: [%s]:%s' % (orphan['imdbid'], orphan['name']))
+    for name in report['missing_attendees']:
+        say('MISSING ATTENDEE: %s' % name)
+    for imdbid, dates in report['missing_movies'].items():
+        say('MISSING MOVIE: %s (%s)' % (imdbid, ', '.join(dates)))
+    for movie in report['unkeyed_movies']:
+        say('BAD IMDB ID: movie %s %r:%s (fix by hand)' % (movie['id'], movie['imdbid'], movie['name']))
+    for night in report['unkeyed_nights']:
+        say('BAD IMDB ID: night %s %r (fix by hand)' % (night['datestr'], night['imdbid']))
+    count = checks.problems(report)
+    say('...Found %d problems' % count)
+
+    if args.fix:
+        report['fixed'] = checks.fix(report, delete_orphans=args.delete_orphans, fetch_missing=not args.no_fetch)
+        say('Deleted %d movies, created %d attendees, fetched %d movies' % tuple(
+            len(report['fixed'][k]) for k in ('deleted_movies', 'created_attendees', 'fetched_movies')
+        ))
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        say('Report written to %s' % args.output)
+
+    say('Finished.')
+    return 1 if count and not args.fix else 0
+
+
+@command(need_db=True)
+def fixdates(opts):
+    """Store parsed/display dates for any nights missing them."""
+    print('Scanning Nights...')
+    count = Night.backfill_dates()
+    print('...Saved %d nights' % count)
+    print('Finished.')
+
+
+@command(need_db=True)
+def migrate(opts):
+    """Show the DB schema version (--force re-runs all migrations)."""
+    from .schema import SCHEMA_VERSION, ensure_schema, read_marker
+
+    parser = argparse.ArgumentParser(description=migrate.__doc__)
+    parser.add_argument('--force', default=False, action='store_true', help='Re-run every migration')
+    args = parser.parse_args(opts)
+
+    # Normal migrations already ran when we set up the database
+    if args.force:
+        print('Re-running all migrations...')
+        ensure_schema(force=True)
+
+    marker = read_marker()
+    print('Code schema version: %d' % SCHEMA_VERSION)
+    print('DB schema version:   %d' % (marker.version if marker else 0))
+    print('Seeded attendees:    %s' % (', '.join(marker.seeded) if marker else ''))
+
+
+@command(need_db=True)
+def catalog(opts):
+    """Show the movie catalog size (--rebuild recreates it from the movies)."""
+    from . import catalog as movie_catalog
+    from . import rawsql
+
+    parser = argparse.ArgumentParser(description=catalog.__doc__)
+    parser.add_argument('--rebuild', default=False, action='store_true', help='Rebuild the whole catalog')
+    args = parser.parse_args(opts)
+
+    if not movie_catalog.available():
+        print('No movie catalog for this database backend')
+        return
+
+    if args.rebuild:
+        print('Rebuilding catalog...')
+        print('...Cataloged %d movies' % movie_catalog.rebuild())
+
+    for table in [movie_catalog.TABLE] + sorted(t for t, _ in movie_catalog.CHILDREN.values()):
+        count = rawsql.query(Movie, 'select count(*) from %s' % table)[0][0]
+        print('%-16s %d rows' % (table + ':', count))
+
+
 # IMPORTANT: handlers calling this function must have need_db=True in their
 # command decorator
 def alternate_copy(glu_database, log_file):
@@ -331,11 +603,13 @@ def main():
     if not need_db:
         return cmd_func(opts)
 
-    # Set up main db and app context with a set config
-    with env_var('NBMN_CONFIG', os.path.abspath('./current.config')):
+    # Set up main db and app context with a set config - note that we don't
+    # need (or load) any of the web blueprints
+    with env_var('NBMN_CONFIG', _config_file()):
         import main
-        main.database_config()
-        with main.app.app_context():
+        app = main.create_app(blueprints=False)
+        main.database_config(app)
+        with app.app_context():
             return cmd_func(opts)
 
 
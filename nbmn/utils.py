@@ -1,12 +1,18 @@
 """utils - a module providing utilities for the rest of nbnm."""
 
 import sys
+import time
+import hashlib
 import traceback
 import os.path as pth
+from datetime import date
 from functools import wraps
 
-from flask import abort, render_template, current_app
+from flask import abort, g, make_response, render_template, current_app, request, session
+from gludb.utils import parse_now_field
+from werkzeug.http import is_resource_modified
 
+from .dbhook import current_trace, tracing
 from .log import app_logger
 from .model import User
 
@@ -36,14 +42,69 @@ def template_context(**kwrds):
     return default
 
 
+# Changes on every restart, so new templates (a deploy) mean new ETags
+_BOOT = str(time.time())
+
+
+def page_validators(template_name):
+    """Return (etag, last_modified) for the page we're about to render.
+
+    These come from the database reads this request made (see dbhook): the
+    newest stamp and a digest of the ids read, so an edit, add, or delete
+    changes them (even one that just moves a row on to or off of a page).
+    We also mix in who is asking, the template, and today's date. Returns
+    None if the page shouldn't be validated: not a GET, no database trace,
+    a write during the request, or flash messages waiting to be shown.
+    """
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        return None
+    # A page that didn't touch the database has no trace yet
+    trace = current_trace(create=tracing())
+    if trace is None or trace.writes:
+        return None
+
+    parts = [
+        _BOOT, template_name, session.get('user_id', ''),
+        date.today().isoformat(), trace.newest, str(trace.rows), str(trace.ids),
+    ]
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    last_modified = parse_now_field(trace.newest) if trace.newest else None
+    return etag, last_modified
+
+
+def _set_validators(response, etag, last_modified):
+    # Pages include some per-request bits (like g.timestamp) so the ETag
+    # is weak. no-cache means "always check with us first", not "don't store"
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if session.get('user_id', ''):
+        response.cache_control.private = True
+    return response
+
+
 def template(template_name, **props):
     """Render the given template.
 
     The template context is from the given keyword arguments using
     template_context above. Note that flask will inject request, session,
     and g.  We inject usr.
+
+    GETs get ETag/Last-Modified validators (see page_validators), and if the
+    browser already has the current page we answer 304 without rendering.
     """
-    return render_template(template_name, **template_context(**props))
+    ctx = template_context(**props)
+
+    validators = page_validators(template_name)
+    if not validators:
+        return render_template(template_name, **ctx)
+
+    etag, last_modified = validators
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return _set_validators(current_app.response_class(status=304), etag, last_modified)
+
+    return _set_validators(make_response(render_template(template_name, **ctx)), etag, last_modified)
 
 
 def use_error_page(func):
@@ -58,7 +119,8 @@ def use_error_page(func):
                 app_logger().error("ERROR HANDLER => %s: %s\n%s\n", etype, evalue, etrace)
                 errfmt = traceback.format_exception(etype, evalue, etrace)
                 txtpre = "Unexpected error:"
-                txtpost = '\n'.join(errfmt) if current_app.debug else evalue
+                txtpost = '\n'.join(errfmt) if current_app.debug else str(evalue)
+                setattr(g, 'error_page', True)  # It's a 200, but don't cache it
                 return template("error.html", errortext=txtpre+txtpost)
             except:
                 app_logger().error("ERROR IN ERROR HANDLER - PUNTING - %s: %s\n%s\n" % sys.exc_info())
@@ -0,0 +1,163 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, render_template_string
+
+from nbmn import assets
+
+
+class AssetsTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='nbmn-assets-')
+        self.static = os.path.join(self.workdir, 'static')
+        self.out = os.path.join(self.workdir, 'assets')
+        self.put('site.js', '/* header\n   comment */\nvar x = 1;  // trailing\n\n    // whole line\nfunction f() { return x; }\n')
+        self.put('site.css', '/* ours */\nbody {\n    color : red;\n}\n')
+        self.put('vendor/lib/css/lib.min.css', '.a{background:url(../img/a.png)}.b{background:url("data:image/png;base64,xx")}.c{src:url(\'../img/f.eot?#iefix\')}')
+        self.put('vendor/lib/img/a.png', 'PNG')
+        self.put('vendor/lib/img/f.eot', 'EOT')
+        self.put('vendor/font/font.css', '@charset "UTF-8";@import url("https://fonts.example.com/css?family=X");.d{color:blue}')
+        self.put('vendor/lib/lib.min.js', 'var lib=1')
+        self.put('logo.png', 'LOGO')
+        self.put('editor/editor.js', 'var editor = "x";' * 50)
+        self.put('editor/plugins/p.js', 'plugin')
+        self.put('editor/samples/index.html', 'sample')
+
+        self.bundles = {
+            'vendor.css': ['vendor/lib/css/lib.min.css', 'vendor/font/font.css'],
+            'site.css': ['site.css'],
+            'vendor.js': ['vendor/lib/lib.min.js', 'site.js'],
+        }
+
+        self.app = Flask(__name__, static_folder=self.static)
+        self.app.config['ASSET_DIR'] = self.out
+        self.app.register_blueprint(assets.assets)
+
+    def tearDown(self):
+        assets._manifest = None
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def put(self, name, text):
+        path = os.path.join(self.static, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            fh.write(text)
+
+    def built(self, name):
+        with open(os.path.join(self.out, name)) as fh:
+            return fh.read()
+
+    def build(self):
+        builder = assets.Builder(self.static, self.out, bundles=self.bundles, files=['logo.png'], directories={'editor': {'samples'}})
+        return builder, builder.build()['files']
+
+    def testMinify(self):
+        self.assertEqual('body{color:red}a:hover,b>c{margin:0 auto}', assets.minify_css('/* x */ body {\n color : red;\n}\n a:hover , b > c { margin : 0  auto ; }'))
+        self.assertEqual('.a{content:"/* not a comment */"}', assets.minify_css('.a { content: "/* not a comment */" }'))
+        self.assertIn('/*! license */', assets.minify_css('/*! license */ .a { }'))
+
+    def testBuild(self):
+        builder, files = self.build()
+        self.assertEqual([], builder.warnings)
+        self.assertEqual({'vendor.css', 'site.css', 'vendor.js', 'logo.png', 'editor/'}, set(files))
+        for name in ('vendor.css', 'site.css', 'vendor.js', 'logo.png'):
+            self.assertRegex(files[name], r'^\w+\.[0-9a-f]{10}\.\w+$')
+
+        css = self.built(files['vendor.css'])
+        # @import moves to the top, @charset goes, and CSS files are rebased
+        self.assertTrue(css.startswith('@import url("https://fonts.example.com/css?family=X");'))
+        self.assertNotIn('@charset', css)
+        self.assertRegex(css, r'url\(a\.[0-9a-f]{10}\.png\)')
+        self.assertRegex(css, r"url\('f\.[0-9a-f]{10}\.eot\?#iefix'\)")
+        self.assertIn('data:image/png;base64,xx', css)
+
+        self.assertEqual('body{color:red}', self.built(files['site.css']))
+        self.assertEqual('var lib=1\n;\nvar x = 1;  // trailing\nfunction f() { return x; }', self.built(files['vendor.js']))
+
+        # Precompressed when it helps
+        with gzip.open(os.path.join(self.out, files['vendor.css'] + '.gz'), 'rt') as fh:
+            self.assertEqual(css, fh.read())
+        self.assertFalse(os.path.exists(os.path.join(self.out, files['logo.png'] + '.gz')))
+
+        # The tree is copied whole, minus what we skip
+        tree = os.path.join(self.out, files['editor/'])
+        self.assertTrue(os.path.isfile(os.path.join(tree, 'plugins', 'p.js')))
+        self.assertTrue(os.path.isfile(os.path.join(tree, 'editor.js.gz')))
+        self.assertFalse(os.path.exists(os.path.join(tree, 'samples')))
+
+        with open(os.path.join(self.out, assets.MANIFEST)) as fh:
+            self.assertEqual(files, json.load(fh)['files'])
+
+        # Same input, same names
+        self.assertEqual(files, self.build()[1])
+
+    def testClean(self):
+        _, old = self.build()
+        self.put('site.css', 'body { color: blue; }')
+        builder, files = self.build()
+        self.assertNotEqual(old['site.css'], files['site.css'])
+        self.assertTrue(os.path.exists(os.path.join(self.out, old['site.css'])))
+
+        removed = builder.clean()
+        self.assertEqual([old['site.css']], removed)  # Too small for a .gz
+        self.assertTrue(os.path.exists(os.path.join(self.out, files['site.css'])))
+        self.assertTrue(os.path.isdir(os.path.join(self.out, files['editor/'])))
+
+    def testMissingReference(self):
+        self.put('site.css', '.x { background: url(nope.png); }')
+        builder, _ = self.build()
+        self.assertEqual(['site.css refers to missing nope.png'], builder.warnings)
+
+    def testMissingVendor(self):
+        os.remove(os.path.join(self.static, 'vendor/lib/lib.min.js'))
+        builder, files = self.build()
+        self.assertNotIn('vendor.js', files)
+        self.assertIn('vendor.css', files)
+        self.assertEqual(['Skipped vendor.js: missing vendor/lib/lib.min.js (try --fetch)'], builder.warnings)
+
+    def testUnbuiltUrls(self):
+        assets.init_app(self.app)
+        mtime = int(os.path.getmtime(os.path.join(self.static, 'logo.png')))
+        with self.app.test_request_context():
+            self.assertEqual('/static/logo.png?v=%d' % mtime, assets.asset_url('logo.png'))
+            self.assertEqual('/static/ckeditor/', assets.asset_url('ckeditor/'))
+            # Vendor files we don't have come from their CDN
+            self.assertEqual(assets.VENDOR['jquery/jquery.min.js'], assets.asset_urls('vendor.js')[1])
+            self.assertEqual(['/static/nutbush.js'], assets.asset_urls('site.js'))
+
+    def testServing(self):
+        _, files = self.build()
+        assets.init_app(self.app)
+        with self.app.test_request_context():
+            html = render_template_string("{{ asset_url('logo.png') }} {{ asset_url('editor/plugins/p.js') }} {{ asset_urls('site.css')|join(',') }}")
+        self.assertEqual('/assets/%s /assets/%splugins/p.js /assets/%s' % (files['logo.png'], files['editor/'], files['site.css']), html)
+
+        client = self.app.test_client()
+        resp = client.get('/assets/' + files['vendor.css'], headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertEqual('text/css; charset=utf-8', resp.headers['Content-Type'])
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', resp.headers['Cache-Control'])
+        self.assertEqual(self.built(files['vendor.css']), gzip.decompress(resp.data).decode('utf-8'))
+        resp.close()
+
+        resp = client.get('/assets/' + files['vendor.css'])
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(self.built(files['vendor.css']), resp.data.decode('utf-8'))
+        resp.close()
+
+        resp = client.get('/assets/%splugins/p.js' % files['editor/'])
+        self.assertEqual(b'plugin', resp.data)
+        resp.close()
+
+        self.assertEqual(404, client.get('/assets/manifest.json').status_code)
+        self.assertEqual(404, client.get('/assets/../static/site.css').status_code)
+        self.assertEqual(404, client.get('/assets/nope.js').status_code)
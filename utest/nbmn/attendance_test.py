@@ -0,0 +1,53 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn import attendance
+from nbmn.model import Night
+from nbmn.schema import ensure_schema
+
+
+class AttendanceTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'attendance.sqlite')))
+        ensure_schema()
+        self.first = Night(datestr='20160101', attendees=['Adam', 'Ann'])
+        self.first.save()
+        self.last = Night(datestr='20160108', attendees=['Adam', ' ann '])
+        self.last.save()
+        Night(datestr='20160115', attendees=['Marty']).save()
+        attendance.rebuild()  # The write listener needs dbhook.install
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def summary(self, found):
+        return dict((name, (a.count, a.last.id if a.last else None)) for name, a in found.items())
+
+    def testAttended(self):
+        expected = {'Ann': (2, self.last.id), 'Adam': (2, self.last.id), 'Zed': (0, None)}
+        self.assertEqual(expected, self.summary(attendance.attended(['Ann', 'Adam', 'Zed'])))
+        # The scan fallback agrees
+        self.assertEqual((2, self.last.id), self.summary({'ann': attendance._scan({'ann'})['ann']})['ann'])
+        self.assertEqual({}, attendance.attended([]))
+
+    def testWrites(self):
+        self.last.attendees = ['Adam']
+        self.last.save()
+        attendance.night_written('save', self.last)
+        self.assertEqual({'Ann': (1, self.first.id)}, self.summary(attendance.attended(['Ann'])))
+
+        self.first.delete()
+        attendance.night_written('delete', self.first)
+        self.assertEqual({'Ann': (0, None)}, self.summary(attendance.attended(['Ann'])))
+
+        # Rebuilding gives the same answer
+        attendance.rebuild()
+        self.assertEqual({'Adam': (1, self.last.id)}, self.summary(attendance.attended(['Adam'])))
@@ -0,0 +1,48 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from gludb.config import default_database, clear_database_config, Database
+
+import main
+from nbmn.schema import ensure_schema
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+class NoLoginTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'auth.sqlite')))
+        ensure_schema()
+
+        app = Flask('main', root_path=ROOT)
+        app.config.from_pyfile(os.path.join(ROOT, 'default.config'))
+        app.config['GOOGLE_AUTH'] = False
+        app.config['ASSET_DIR'] = ''
+        app.secret_key = 'testing'
+        main.register_blueprints(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def testAdminRoute(self):
+        # Anonymous: the usual error page, not a 500
+        resp = self.client.get('/override/tt0000001')
+        self.assertEqual(200, resp.status_code)
+        self.assertIn(b'requisite coolness', resp.data)
+
+    def testAdminSearch(self):
+        self.assertEqual(403, self.client.get('/search/movie?q=x').status_code)
+
+    def testLoginLogout(self):
+        self.assertEqual(403, self.client.get('/login').status_code)
+        resp = self.client.get('/logout?redir=/nights')
+        self.assertEqual(302, resp.status_code)
+        self.assertTrue(resp.headers['Location'].endswith('/nights'))
@@ -0,0 +1,47 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import threading
+import unittest
+
+from flask import Flask, current_app
+
+from nbmn import background
+
+
+class BackgroundTesting(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['BACKGROUND_WORKERS'] = 0
+
+    def tearDown(self):
+        pass
+
+    def testInline(self):
+        ran = []
+        with self.app.app_context():
+            self.assertTrue(background.submit(lambda x: ran.append((x, current_app.name)), 1))
+        self.assertEqual([(1, self.app.name)], ran)
+
+    def testErrorsLogged(self):
+        def broken():
+            raise ValueError('oops')
+        with self.app.app_context():
+            self.assertTrue(background.submit(broken, key='broken'))
+            # The key is released even though the task failed
+            self.assertTrue(background.submit(broken, key='broken'))
+
+    def testPool(self):
+        self.app.config['BACKGROUND_WORKERS'] = 2
+        started, release, done = threading.Event(), threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            done.set()
+
+        with self.app.app_context():
+            self.assertTrue(background.submit(slow, key='slow'))
+            started.wait(5)
+            self.assertFalse(background.submit(slow, key='slow'))  # Already running
+            release.set()
+        self.assertTrue(done.wait(5))
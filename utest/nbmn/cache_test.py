@@ -0,0 +1,84 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import threading
+import unittest
+
+from nbmn.cache import LRUCache, SingleFlight
+
+
+class LRUCacheTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testEviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))  # a is now most recent
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def testDisabled(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(0, len(cache))
+        self.assertEqual('x', cache.get('a', 'x'))
+
+    def testResize(self):
+        cache = LRUCache(3)
+        for k in 'abc':
+            cache.set(k, k)
+        cache.resize(1)
+        self.assertEqual(1, len(cache))
+        self.assertEqual('c', cache.get('c'))
+
+
+class SingleFlightTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testCoalesce(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        while flight.shared < 3:
+            pass
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['done'] * 4, results)
+        self.assertEqual({}, flight.calls)
+        self.assertEqual('again', flight.do('k', lambda: 'again'))
+
+    def testError(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do('k', lambda: int('x'))
+        self.assertEqual({}, flight.calls)
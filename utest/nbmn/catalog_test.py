@@ -0,0 +1,104 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn import catalog, rawsql
+from nbmn.model import Movie, Night
+from nbmn.remote import _norm_omdb_resp
+from nbmn.schema import ensure_schema
+
+OMDB = {
+    'Title': 'The Dark Knight',
+    'Year': '2008',
+    'imdbRating': '9.0',
+    'imdbVotes': 'N/A',
+    'Metascore': '84',
+    'Runtime': '152 min',
+    'Rated': 'PG-13',
+    'Genre': 'Action, Crime, Drama',
+    'Director': 'Christopher Nolan',
+    'Actors': 'Christian Bale, Heath Ledger',
+    'Writer': 'Jonathan Nolan (screenplay), Christopher Nolan (screenplay), Christopher Nolan (story)',
+}
+
+
+class CatalogTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'catalog.sqlite')))
+        ensure_schema()
+        self.movie = Movie(name='The Dark Knight', imdbid='tt0468569', extdata={'omdb': _norm_omdb_resp(OMDB)})
+        self.movie.save()
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def keys(self, table):
+        return [r[0] for r in rawsql.query(Movie, 'select key from %s where movie_id = ? order by position' % table, (self.movie.id,))]
+
+    def testRow(self):
+        row = catalog.row(self.movie, 'stamp')
+        self.assertEqual(2008, row['year'])
+        self.assertEqual(9.0, row['rating'])
+        self.assertIsNone(row['votes'])
+        self.assertEqual(84, row['metascore'])
+        self.assertEqual(152, row['runtime'])
+        self.assertEqual('PG-13', row['rated'])
+
+    def testProject(self):
+        catalog.project(self.movie)
+        rows = rawsql.query(Movie, 'select title, year, rating from MovieCatalog where imdbid = ?', ('tt0468569',))
+        self.assertEqual([('The Dark Knight', 2008, 9.0)], [tuple(r) for r in rows])
+        self.assertEqual(['action', 'crime', 'drama'], self.keys('MovieGenres'))
+        self.assertEqual(['jonathan nolan', 'christopher nolan'], self.keys('MovieWriters'))
+
+        # Projecting again replaces the old rows
+        self.movie.extdata['omdb']['Genre'] = ['Drama']
+        catalog.project(self.movie)
+        self.assertEqual(['drama'], self.keys('MovieGenres'))
+        self.assertEqual(1, rawsql.query(Movie, 'select count(*) from MovieCatalog')[0][0])
+
+    def testListener(self):
+        catalog.movie_written('save', self.movie)
+        self.assertEqual(['christopher nolan'], self.keys('MovieDirectors'))
+        catalog.movie_written('delete', self.movie)
+        self.assertEqual([], self.keys('MovieDirectors'))
+        self.assertEqual(0, rawsql.query(Movie, 'select count(*) from MovieCatalog')[0][0])
+
+    def testRebuild(self):
+        Movie(name='No Data', imdbid='tt0000001').save()
+        self.assertEqual(2, catalog.rebuild())
+        rows = rawsql.query(Movie, 'select title, year from MovieCatalog order by title')
+        self.assertEqual([('No Data', None), ('The Dark Knight', 2008)], [tuple(r) for r in rows])
+
+    def find(self, **filters):
+        return [m.name for m in catalog.find_movies(filters)]
+
+    def testFindMovies(self):
+        other = Movie(name='Memento', imdbid='tt0209144', extdata={'omdb': _norm_omdb_resp(dict(OMDB, Title='Memento', Year='2000', Genre='Mystery, Thriller'))})
+        other.save()
+        catalog.rebuild()
+        Night(datestr='20170105', imdbid='tt0209144').save()
+        Night(datestr='20170112', imdbid='tt0209144').save()
+
+        for sql in (True, False):
+            with mock.patch.object(catalog, 'available', lambda: sql):
+                self.assertEqual(['Memento', 'The Dark Knight'], self.find(director='christopher nolan'))
+                self.assertEqual(['Memento'], self.find(director='Christopher Nolan', year='2000'))
+                self.assertEqual(['The Dark Knight'], self.find(genre='Drama', writer='Jonathan Nolan'))
+                self.assertEqual([], self.find(genre='Drama', year='2000'))
+                self.assertEqual([], self.find(year='not a year'))
+
+                shown = catalog.nights_for([self.movie, other])
+                self.assertEqual([], shown['tt0468569'])
+                self.assertEqual(['20170112', '20170105'], [n.datestr for n in shown['tt0209144']])
+
+    def testParseFilters(self):
+        self.assertEqual({'genre': 'Drama', 'year': '2000'}, catalog.parse_filters({'genre': ' Drama ', 'year': '2000', 'actor': '', 'other': 'x'}))
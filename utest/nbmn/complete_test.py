@@ -0,0 +1,49 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import unittest
+
+from nbmn.complete import PrefixIndex, normalize, title_keys
+
+
+class CompleteTesting(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.load([
+            ('1', 'The Dark Knight', 'tt0468569'),
+            ('2', 'Dark City', 'tt0118929'),
+            ('3', 'Amélie', 'tt0211915'),
+            ('4', 'A Knight\'s Tale', 'tt0183790'),
+        ])
+
+    def tearDown(self):
+        pass
+
+    def names(self, prefix, limit=10):
+        return [name for name, _ in self.index.search(prefix, limit)]
+
+    def testNormalize(self):
+        self.assertEqual('amelie', normalize('Amélie'))
+        self.assertEqual('a knight s tale', normalize("A Knight's  Tale!"))
+        self.assertEqual('', normalize(None))
+        self.assertEqual([('dark knight', 0), ('knight', 1), ('the dark knight', 0)], title_keys('The Dark Knight'))
+
+    def testSearch(self):
+        self.assertEqual(['Dark City', 'The Dark Knight'], self.names('dark'))
+        self.assertEqual(['The Dark Knight'], self.names('THE D'))
+        self.assertEqual(['Amélie'], self.names('ame'))
+        # Title matches beat later word matches
+        self.assertEqual(["A Knight's Tale", 'The Dark Knight'], self.names('knight'))
+        self.assertEqual(['Dark City'], self.names('dark', 1))
+        self.assertEqual([], self.names(''))
+        self.assertEqual([], self.names('zzz'))
+
+    def testIncremental(self):
+        self.index.add('5', 'Darkman', 'tt0099365')
+        self.assertEqual(['Dark City', 'The Dark Knight', 'Darkman'], self.names('dark'))
+        self.index.add('2', 'Bright City', 'tt0118929')
+        self.assertEqual(['The Dark Knight', 'Darkman'], self.names('dark'))
+        self.assertEqual(['Bright City'], self.names('city'))
+        self.index.remove('1')
+        self.index.remove('missing')
+        self.assertEqual(['Darkman'], self.names('dark'))
+        self.assertEqual(4, len(self.index))
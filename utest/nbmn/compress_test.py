@@ -0,0 +1,131 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import gzip
+import unittest
+
+from flask import Flask, Response, jsonify, make_response, stream_with_context
+from werkzeug.datastructures import MIMEAccept, Accept
+
+import nbmn.compress as compress
+import nbmn.pagecache as pagecache
+
+PAGE = '<html>' + 'Movie night! ' * 200 + '</html>'
+
+
+class CompressTesting(unittest.TestCase):
+    def setUp(self):
+        self.renders = 0
+
+        app = Flask(__name__)
+        app.config['COMPRESS_MIN_SIZE'] = 500
+        app.config['PAGE_CACHE_SIZE'] = 10
+        pagecache.init_app(app)
+        pagecache.invalidate()
+        # Same order as main.register_blueprints
+        app.after_request(compress.after_request)
+        app.before_request(pagecache.before_request)
+        app.after_request(pagecache.after_request)
+
+        @app.route('/page')
+        def page():
+            self.renders += 1
+            resp = make_response(PAGE)
+            resp.set_etag('abc')
+            return resp
+
+        @app.route('/small')
+        def small():
+            return '<p>hi</p>'
+
+        @app.route('/json')
+        def data():
+            return jsonify(words=['movie'] * 500)
+
+        @app.route('/image')
+        def image():
+            return Response(b'\0' * 5000, mimetype='image/png')
+
+        @app.route('/encoded')
+        def encoded():
+            return Response(gzip.compress(PAGE.encode()), headers={'Content-Encoding': 'gzip'})
+
+        @app.route('/stream')
+        def stream():
+            return Response(stream_with_context(iter([PAGE, PAGE])), mimetype='text/html')
+
+        @app.route('/notransform')
+        def notransform():
+            resp = make_response(PAGE)
+            resp.headers['Cache-Control'] = 'no-transform'
+            return resp
+
+        self.app = app
+        self.client = app.test_client()
+
+    def tearDown(self):
+        pagecache.invalidate()
+
+    def get(self, path, encoding='gzip, deflate'):
+        return self.client.get(path, headers={'Accept-Encoding': encoding} if encoding else {})
+
+    def testChooseEncoding(self):
+        self.assertEqual('gzip', compress.choose_encoding(Accept([('gzip', 1), ('deflate', 1)])))
+        self.assertIsNone(compress.choose_encoding(Accept([('deflate', 1)])))
+        self.assertIsNone(compress.choose_encoding(Accept([('gzip', 0)])))
+        self.assertEqual('br' if compress.brotli else 'gzip', compress.choose_encoding(Accept([('*', 1)])))
+        self.assertIsNone(compress.choose_encoding(MIMEAccept()))
+
+    def testGzip(self):
+        resp = self.get('/page')
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(PAGE, gzip.decompress(resp.data).decode('utf-8'))
+        self.assertEqual(str(len(resp.data)), resp.headers['Content-Length'])
+        self.assertEqual(('abc', True), resp.get_etag())
+
+        resp = self.get('/json')
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertIn(b'movie', gzip.decompress(resp.data))
+
+    def testNotAsked(self):
+        resp = self.get('/page', encoding=None)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(PAGE, resp.data.decode('utf-8'))
+        # Still varies: another browser would get gzip
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(('abc', False), resp.get_etag())
+
+    def testSkipped(self):
+        for path in ('/small', '/image', '/stream', '/notransform'):
+            resp = self.get(path)
+            self.assertNotIn('Content-Encoding', resp.headers, path)
+            self.assertNotIn('Accept-Encoding', resp.headers.get('Vary', ''), path)
+
+        resp = self.get('/encoded')
+        self.assertEqual(PAGE, gzip.decompress(resp.data).decode('utf-8'))
+
+    def testLevelZeroTurnsOff(self):
+        self.app.config['COMPRESS_LEVEL'] = 0
+        self.assertNotIn('Content-Encoding', self.get('/page').headers)
+
+    def testPageCacheKeepsPlainBody(self):
+        first = self.get('/page')
+        self.assertEqual('miss', first.headers[pagecache.CACHE_HEADER])
+
+        # A browser without gzip gets the cached page as is...
+        plain = self.get('/page', encoding=None)
+        self.assertEqual('hit', plain.headers[pagecache.CACHE_HEADER])
+        self.assertEqual(PAGE, plain.data.decode('utf-8'))
+
+        # ...and one with gzip gets it compressed
+        packed = self.get('/page')
+        self.assertEqual('hit', packed.headers[pagecache.CACHE_HEADER])
+        self.assertEqual(PAGE, gzip.decompress(packed.data).decode('utf-8'))
+        self.assertEqual(1, self.renders)
+
+    def testBrotli(self):
+        if compress.brotli is None:
+            self.skipTest('brotli is not installed')
+        resp = self.get('/page', encoding='gzip, br')
+        self.assertEqual('br', resp.headers['Content-Encoding'])
+        self.assertEqual(PAGE, compress.brotli.decompress(resp.data).decode('utf-8'))
@@ -0,0 +1,54 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import unittest
+
+from nbmn.dbhook import RequestTrace
+
+
+class DBHookTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testRecord(self):
+        trace = RequestTrace()
+        trace.record('find_all', 'Nights', '', [1, 2, 3], 0.002)
+        trace.record('find_one', 'Users', 'id', object(), 0.001)
+        trace.record('find_one', 'Users', 'id', None, 0.001)
+        trace.record('save', 'Nights', '', None, 0.004)
+
+        self.assertEqual(4, trace.calls)
+        self.assertEqual(4, trace.rows)
+        self.assertEqual(3, trace.table_rows['Nights'])
+        self.assertEqual('calls=4 rows=4 ms=8.000', trace.header())
+
+    def testNewest(self):
+        class Obj(object):
+            def __init__(self, stamp):
+                self.stamp = stamp
+
+        trace = RequestTrace()
+        trace.record('find_all', 'Nights', '', [Obj('UTC:2017-01-02T00:00:00'), Obj(None)], 0.0)
+        trace.record('find_one', 'Movies', 'id', Obj('UTC:2017-03-01T00:00:00'), 0.0)
+        trace.record('find_one', 'Movies', 'id', Obj('UTC:2016-12-01T00:00:00'), 0.0)
+        self.assertEqual('UTC:2017-03-01T00:00:00', trace.newest)
+        self.assertEqual(0, trace.writes)
+
+        trace.record('save', 'Movies', '', Obj('UTC:2018-01-01T00:00:00'), 0.0)
+        self.assertEqual('UTC:2017-03-01T00:00:00', trace.newest)
+        self.assertEqual(1, trace.writes)
+
+    def testRepeated(self):
+        trace = RequestTrace()
+        for _ in range(5):
+            trace.record('find_by_index', 'Movies', 'index_imdbid', [], 0.0)
+            trace.record('save', 'Movies', '', None, 0.0)
+        trace.record('find_by_index', 'Nights', 'index_year', [], 0.0)
+
+        self.assertEqual([], list(trace.repeated(5)))
+        self.assertEqual(
+            [(('find_by_index', 'Movies', 'index_imdbid'), 5)],
+            list(trace.repeated(4))
+        )
@@ -0,0 +1,86 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from flask import Flask
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn.data import data
+from nbmn.main_app import main
+from nbmn.model import Night
+from nbmn.schema import ensure_schema
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+TEMPLATES = os.path.join(os.path.dirname(__file__), '..', '..', 'templates')
+
+
+class FeedTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'feed.sqlite')))
+        ensure_schema()
+        for night in Night.find_all():
+            night.delete()
+        for day in range(1, 8):
+            Night(datestr='201601%02d' % day, moviename='Movie %d' % day, attendees=['Ann']).save()
+
+        app = Flask(__name__, template_folder=TEMPLATES)
+        app.config['FEED_PAGE_SIZE'] = 3
+        app.register_blueprint(main)
+        app.register_blueprint(data)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def get(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('application/atom+xml', resp.mimetype)
+        self.assertTrue(resp.is_streamed)
+        root = ET.fromstring(resp.data)
+        links = {}
+        for link in root.findall(ATOM + 'link'):
+            links[link.get('rel', 'alternate')] = link.get('href')
+        titles = [e.find(ATOM + 'title').text for e in root.findall(ATOM + 'entry')]
+        return root, links, titles
+
+    def movies(self, titles):
+        return [t.split('(')[1][:-1] for t in titles]
+
+    def testPages(self):
+        root, links, titles = self.get('/nights.atom')
+        self.assertEqual('Movie Night Thursday, January 07, 2016 (Movie 7)', titles[0])
+        self.assertEqual(['Movie 7', 'Movie 6', 'Movie 5'], self.movies(titles))
+        self.assertEqual('http://localhost/nights.atom', root.find(ATOM + 'id').text)
+        self.assertTrue(root.find(ATOM + 'updated').text.startswith('2016-01-07'))
+        self.assertEqual(links['next'], links['prev-archive'])
+        self.assertEqual('http://localhost/nights.atom', links['first'])
+        self.assertNotIn('previous', links)
+
+        root, links, titles = self.get(links['next'])
+        self.assertEqual(['Movie 4', 'Movie 3', 'Movie 2'], self.movies(titles))
+        # Every page is the same feed
+        self.assertEqual('http://localhost/nights.atom', root.find(ATOM + 'id').text)
+        self.assertIn('previous', links)
+
+        older = links['next']
+        _, links, titles = self.get(older)
+        self.assertEqual(1, len(titles))
+        self.assertNotIn('next', links)
+        self.assertNotIn('prev-archive', links)
+
+        _, links, titles = self.get(links['previous'])
+        self.assertEqual(['Movie 4', 'Movie 3', 'Movie 2'], self.movies(titles))
+
+    def testEmpty(self):
+        for night in Night.find_all():
+            night.delete()
+        _, links, titles = self.get('/nights.atom')
+        self.assertEqual([], titles)
+        self.assertNotIn('next', links)
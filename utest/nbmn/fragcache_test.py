@@ -0,0 +1,45 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import unittest
+
+from jinja2 import DictLoader, Environment
+
+from nbmn.fragcache import FragmentCacheExtension
+
+ROWS = '{% for r in rows %}{% cache r.id, r.stamp %}[{{r.text}}]{% endcache %}{% endfor %}'
+
+
+class FragmentCacheTesting(unittest.TestCase):
+    def setUp(self):
+        self.env = Environment(
+            loader=DictLoader({'rows.html': ROWS}),
+            extensions=[FragmentCacheExtension],
+            autoescape=True
+        )
+
+    def tearDown(self):
+        pass
+
+    def render(self, *rows):
+        return self.env.get_template('rows.html').render(rows=rows)
+
+    def testCached(self):
+        self.assertEqual('[one][&lt;b&gt;]', self.render(
+            dict(id=1, stamp='s1', text='one'),
+            dict(id=2, stamp='s1', text='<b>'),
+        ))
+
+        # Same key: still the old text, and still escaped
+        self.assertEqual('[one][&lt;b&gt;]', self.render(
+            dict(id=1, stamp='s1', text='changed'),
+            dict(id=2, stamp='s1', text='<b>'),
+        ))
+
+        # New stamp: re-rendered
+        self.assertEqual('[changed]', self.render(dict(id=1, stamp='s2', text='changed')))
+
+    def testUncacheable(self):
+        self.assertEqual('[one]', self.render(dict(id=1, stamp=None, text='one')))
+        self.assertEqual('[two]', self.render(dict(id=1, stamp=None, text='two')))
+        self.assertEqual('[three]', self.render(dict(id=1, text='three')))
+        self.assertEqual(0, len(self.env.fragment_cache))
@@ -0,0 +1,100 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn import integrity, rawsql
+from nbmn.model import Attendee, Movie, Night
+from nbmn.schema import ensure_schema
+
+
+class IntegrityTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'integrity.sqlite')))
+        ensure_schema()
+        for cls in (Night, Movie, Attendee):
+            for obj in cls.find_all():
+                obj.delete()
+
+        for name in ('Adam', 'Marty'):
+            Attendee(name=name).save()
+        Night(datestr='20160101', imdbid='tt0000001', attendees=['Adam']).save()
+        Night(datestr='20160108', imdbid='tt0000002', attendees=['Adam', 'Zed']).save()
+        Night(datestr='20160108', imdbid='tt0000001', attendees=['Marty']).save()
+        Night(datestr='20160115', imdbid='tt0000003', attendees=['Marty', 'Yul']).save()
+
+        self.keep = Movie(imdbid='tt0000001', name='One', extdata={'omdb': {'Title': 'One'}})
+        self.extra = Movie(imdbid='tt0000001', name='One')
+        self.extra.save()
+        self.keep.save()
+        Movie(imdbid='tt0000002', name='Two').save()
+        self.orphan = Movie(imdbid='tt0000009', name='Nine')
+        self.orphan.save()
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def testStream(self):
+        ids = sorted(n.id for n in Night.find_all())
+        self.assertEqual(ids, [n.id for n in integrity.stream(Night, chunk=2)])
+        self.assertEqual(ids, [n.id for n in integrity.stream(Night, chunk=4)])
+
+    def testScan(self):
+        report = integrity.scan(chunk=2)
+        self.assertEqual({'nights': 4, 'movies': 4, 'attendees': 2}, report['counts'])
+        # The copy with OMDB data comes first
+        self.assertEqual({'tt0000001': [self.keep.id, self.extra.id]}, report['duplicate_movies'])
+        self.assertEqual(['20160108'], list(report['duplicate_nights']))
+        self.assertEqual([{'id': self.orphan.id, 'imdbid': 'tt0000009', 'name': 'Nine'}], report['orphan_movies'])
+        self.assertEqual(['Yul', 'Zed'], report['missing_attendees'])
+        self.assertEqual({'tt0000003': ['20160115']}, report['missing_movies'])
+        self.assertEqual(6, integrity.problems(report))
+
+    def testFix(self):
+        fixed = integrity.fix(integrity.scan(), fetch_missing=False)
+        self.assertEqual([self.extra.id], fixed['deleted_movies'])
+        self.assertEqual([], fixed['fetched_movies'])
+
+        report = integrity.scan()
+        self.assertEqual({}, report['duplicate_movies'])
+        self.assertEqual([], report['missing_attendees'])
+        self.assertIsNotNone(Movie.find_one(self.keep.id))
+        # Orphans stay unless asked, dup nights are left for a person
+        self.assertEqual(1, len(report['orphan_movies']))
+        self.assertEqual(1, len(report['duplicate_nights']))
+
+        fixed = integrity.fix(report, delete_orphans=True, fetch_missing=False)
+        self.assertEqual([self.orphan.id], fixed['deleted_movies'])
+        self.assertEqual([], integrity.scan()['orphan_movies'])
+
+    def testUnkeyed(self):
+        blank = [Movie(imdbid='', name='Blank %d' % i) for i in range(2)]
+        for movie in blank:
+            movie.save()
+        # Movie and Night won't save these ids any more, but old data has them
+        junk = Movie(imdbid='tt0000010', name='Junk')
+        junk.save()
+        night = Night(datestr='20160122', imdbid='tt0000011')
+        night.save()
+        for obj, bad in ((junk, 'not an id'), (night, 'ttjunk')):
+            data = obj.to_data().replace(obj.imdbid, bad)
+            rawsql.execute(type(obj), 'update %s set value = ? where id = ?' % obj.get_table_name(), (data, obj.id))
+
+        report = integrity.scan(chunk=2)
+        self.assertEqual(sorted(m.id for m in blank + [junk]), sorted(m['id'] for m in report['unkeyed_movies']))
+        self.assertEqual([('20160122', 'ttjunk')], [(n['datestr'], n['imdbid']) for n in report['unkeyed_nights']])
+        # Not duplicates or orphans of each other
+        self.assertEqual(['tt0000001'], list(report['duplicate_movies']))
+        self.assertEqual([self.orphan.id], [m['id'] for m in report['orphan_movies']])
+
+        fixed = integrity.fix(report, delete_orphans=True, fetch_missing=False)
+        self.assertEqual(sorted([self.extra.id, self.orphan.id]), fixed['deleted_movies'])
+        ids = [m.id for m in blank + [junk]]
+        kept = rawsql.query(Movie, 'select count(*) from %s where id in (?, ?, ?)' % Movie.get_table_name(), ids)
+        self.assertEqual(3, kept[0][0])
@@ -0,0 +1,100 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import random
+import threading
+import unittest
+
+from nbmn.bench import percentile
+from nbmn.loadtest import DEFAULT_URL, LoadTest, Recorder, arrivals, parse_mix
+
+
+class LoadTestTesting(unittest.TestCase):
+    def setUp(self):
+        self.pool = {'nights': ['2016-01-01', '2016-02-01'], 'movies': ['tt0468569']}
+        self.seen = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        pass
+
+    def fetch(self, url):
+        with self.lock:
+            self.seen.append(url)
+        if url.endswith('/calendar'):
+            return 500, 10
+        if url.endswith('/gimme'):
+            raise ConnectionResetError('connection reset')
+        return 200, 100
+
+    def testParseMix(self):
+        self.assertEqual({'main': 3.0, 'atom': 1.0}, parse_mix('main=3, atom'))
+        self.assertRaises(ValueError, parse_mix, 'main=1,nope=2')
+        self.assertRaises(ValueError, parse_mix, '')
+        self.assertRaises(ValueError, parse_mix, 'main=0')
+
+    def testArrivals(self):
+        times = arrivals(100.0, 10.0, random.Random(1))
+        self.assertTrue(800 < len(times) < 1200)
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(times[-1] < 10.0)
+        self.assertEqual(times, arrivals(100.0, 10.0, random.Random(1)))
+
+    def testRecorder(self):
+        rec = Recorder()
+        for ms in range(1, 101):
+            rec.record('main', float(ms), 200, 10)
+        rec.record('atom', 5.0, 503, 0)
+        rec.record('atom', 7.0, 'Timeout', 0)
+
+        results = rec.summary(10.0)
+        self.assertEqual(100, results['main']['requests'])
+        self.assertEqual(0, results['main']['errors'])
+        self.assertEqual(10.0, results['main']['rps'])
+        self.assertEqual(1000, results['main']['bytes'])
+        self.assertTrue(50 <= results['main']['ms_p50'] <= 51)
+        self.assertTrue(99 <= results['main']['ms_p99'] <= 100)
+        self.assertEqual(100.0, results['main']['ms_max'])
+        self.assertEqual({'503': 1, 'Timeout': 1}, results['atom']['statuses'])
+        self.assertEqual(2, results['atom']['errors'])
+        self.assertEqual(102, results['ALL']['requests'])
+        self.assertEqual(2, results['ALL']['errors'])
+
+    def testMixNeedsPool(self):
+        test = LoadTest('http://x/', {'main': 1, 'night': 1, 'moviedata': 1}, {'nights': [], 'movies': []}, fetch=self.fetch)
+        self.assertEqual({'main': 1}, test.mix)
+        self.assertRaises(ValueError, LoadTest, 'http://x', {'night': 1}, {'nights': []}, fetch=self.fetch)
+
+    def testClosed(self):
+        mix = parse_mix('main,night,moviedata,gimme,atom,calendar')
+        test = LoadTest('http://x/', mix, self.pool, fetch=self.fetch)
+        secs = test.closed(concurrency=3, duration=0.2)
+        self.assertTrue(secs >= 0.2)
+
+        results = test.recorder.summary(secs)
+        self.assertEqual(set(mix) | {'ALL'}, set(results))
+        self.assertEqual(results['calendar']['requests'], results['calendar']['errors'])
+        self.assertEqual({'ConnectionResetError': results['gimme']['requests']}, results['gimme']['statuses'])
+        self.assertEqual(0, results['night']['errors'])
+        self.assertTrue(all(u.startswith('http://x/') and '//' not in u[len('http://'):] for u in self.seen))
+        self.assertIn('http://x/moviedata/tt0468569', self.seen)
+
+    def testOpen(self):
+        test = LoadTest('http://x', {'main': 1}, self.pool, fetch=self.fetch)
+        secs = test.open(rate=200.0, duration=0.25, warmup=0.05, max_inflight=4)
+        self.assertTrue(secs > 0)
+
+        results = test.recorder.summary(secs)
+        # Warmup requests were made but not recorded
+        self.assertTrue(0 < results['main']['requests'] < len(self.seen))
+        self.assertEqual(0, results['ALL']['errors'])
+        self.assertTrue(test.max_lag >= 0.0)
+
+    def testPercentile(self):
+        samples = list(range(100, -1, -1))
+        self.assertEqual((0, 50, 95, 100), tuple(percentile(samples, p) for p in (0, 50, 95, 100)))
+        self.assertEqual(7, percentile([7], 99))
+
+    def testDefaultUrlIsConfigPort(self):
+        with open('default.config') as fh:
+            port = [line.split('=')[1].strip() for line in fh if line.startswith('PORT=')][0]
+        self.assertTrue(DEFAULT_URL.endswith(':' + port))
@@ -0,0 +1,51 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import json
+import queue
+import logging
+import unittest
+
+from nbmn import log
+
+
+class LogTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testLazyNotFormattedOnEnqueue(self):
+        calls = []
+
+        def expensive():
+            calls.append(1)
+            return 'payload'
+
+        handler = log.DroppingQueueHandler(queue.Queue(maxsize=5))
+        record = logging.LogRecord('nbmn', logging.INFO, __file__, 1, 'Saved:%s', (log.lazy(expensive),), None)
+        handler.emit(record)
+        self.assertEqual([], calls)
+
+        queued = handler.queue.get_nowait()
+        self.assertEqual('Saved:payload', queued.getMessage())
+        self.assertEqual([1], calls)
+
+    def testDrops(self):
+        handler = log.DroppingQueueHandler(queue.Queue(maxsize=1))
+        before = log.dropped_count()
+        for i in range(3):
+            handler.emit(logging.LogRecord('nbmn', logging.INFO, __file__, 1, 'msg %d', (i,), None))
+        self.assertEqual(before + 2, log.dropped_count())
+        self.assertEqual('msg 0', handler.queue.get_nowait().getMessage())
+
+    def testSavedFieldsSnapshot(self):
+        import main
+        from nbmn.model import Night
+
+        night = Night(datestr='20160101', attendees=['Adam'])
+        snapshot = json.loads(main.saved_fields(night))
+        night.attendees.append('Marty')
+        night.dates['year'] = 1999
+        self.assertEqual(['Adam'], snapshot['attendees'])
+        self.assertNotEqual(1999, snapshot['dates'].get('year'))
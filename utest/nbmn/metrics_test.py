@@ -0,0 +1,86 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import threading
+import unittest
+
+from flask import Flask, Response
+
+from nbmn import metrics
+
+
+class MetricsTesting(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def testHistogram(self):
+        labels = (('endpoint', 'x'),)
+        metrics.observe('nbmn_http_request_duration_seconds', labels, 0.003)
+        metrics.observe('nbmn_http_request_duration_seconds', labels, 0.2)
+        metrics.observe('nbmn_http_request_duration_seconds', labels, 99.0)
+
+        text = metrics.exposition()
+        self.assertIn('nbmn_http_request_duration_seconds_bucket{endpoint="x",le="0.005"} 1', text)
+        self.assertIn('nbmn_http_request_duration_seconds_bucket{endpoint="x",le="0.25"} 2', text)
+        self.assertIn('nbmn_http_request_duration_seconds_bucket{endpoint="x",le="10.0"} 2', text)
+        self.assertIn('nbmn_http_request_duration_seconds_bucket{endpoint="x",le="+Inf"} 3', text)
+        self.assertIn('nbmn_http_request_duration_seconds_count{endpoint="x"} 3', text)
+
+    def testShardsMerge(self):
+        labels = (('endpoint', 'y'), ('method', 'GET'), ('status', '200'))
+
+        def work():
+            for _ in range(100):
+                metrics.inc('nbmn_http_requests_total', labels)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertIn('nbmn_http_requests_total{endpoint="y",method="GET",status="200"} 400', metrics.exposition())
+
+    def testLabelEscape(self):
+        self.assertEqual('{a="x\\"y"}', metrics.label_str((('a', 'x"y'),)))
+        self.assertEqual('', metrics.label_str(()))
+
+    def testStreamedResponse(self):
+        app = Flask(__name__)
+        seen = []
+
+        @app.after_request
+        def check(response):  # Registered first, so runs after metrics
+            seen.append(response.is_streamed)
+            return response
+
+        app.before_request(metrics.before_request)
+        app.after_request(metrics.after_request)
+        app.teardown_request(metrics.teardown_request)
+
+        @app.route('/stream')
+        def stream():
+            return Response(iter(['a', 'b']))
+
+        self.assertEqual(b'ab', app.test_client().get('/stream').data)
+        # Still streamed after metrics had a look, and no size was recorded
+        self.assertEqual([True], seen)
+        self.assertIn('nbmn_http_requests_total{endpoint="stream",method="GET",status="200"} 1', metrics.exposition())
+        self.assertNotIn('nbmn_http_response_size_bytes_count{endpoint="stream"}', metrics.exposition())
+
+    def testInternalRequestsSkipped(self):
+        app = Flask(__name__)
+        app.before_request(metrics.before_request)
+        app.after_request(metrics.after_request)
+        app.teardown_request(metrics.teardown_request)
+        app.add_url_rule('/page', 'page', lambda: 'hi')
+
+        client = app.test_client()
+        client.get('/page', environ_overrides={metrics.INTERNAL_ENVIRON: True})
+        self.assertNotIn('endpoint="page"', metrics.exposition())
+        self.assertNotIn('\nnbmn_http_requests_in_flight', metrics.exposition())
+
+        client.get('/page')
+        self.assertIn('nbmn_http_requests_total{endpoint="page",method="GET",status="200"} 1', metrics.exposition())
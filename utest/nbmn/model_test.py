@@ -1,8 +1,9 @@
 # pylama:ignore=D100,D101,D102,E501,E128
 
 import unittest
+from datetime import datetime
 
-from nbmn.model import Attendee
+from nbmn.model import Attendee, Night
 
 
 class AttendeeTesting(unittest.TestCase):
@@ -26,6 +27,20 @@ class AttendeeTesting(unittest.TestCase):
         self.assertSort(["Marty"], ["Marty"])
         self.assertSort(["Adam", "Marty", "Aa"], ["Aa", "Marty", 'Adam'])
 
+    def testAttendeeSortSeeded(self):
+        def sorted_with(seed):
+            atts = ["Zed", "Marty", "Adam"]
+            Attendee.sort(atts, seed=seed)
+            return atts
+
+        for seed in ["20170101", "20170108", "20170115"]:
+            first = sorted_with(seed)
+            self.assertEqual(first, sorted_with(seed))
+            self.assertEqual("Zed", first[2])
+        # Both orders show up over enough nights
+        orders = set(tuple(sorted_with("2017%04d" % i)) for i in range(1, 40))
+        self.assertEqual(2, len(orders))
+
     def testOligarch(self):
         self.assertTrue(Attendee.olis(["Marty"]))
         self.assertTrue(Attendee.olis(["Adam"]))
@@ -36,3 +51,38 @@ class AttendeeTesting(unittest.TestCase):
         self.assertFalse(Attendee.olis(["Etam"]))
         self.assertFalse(Attendee.olis(["Adam", "Other"]))
         self.assertFalse(Attendee.olis(["Other", "Marty"]))
+
+
+class NightTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testStoredDates(self):
+        night = Night(datestr='20170104')
+        self.assertEqual(datetime(2017, 1, 4).toordinal(), night.dateord)
+        self.assertEqual(datetime(2017, 1, 4), night.date)
+        self.assertEqual('Wednesday, January 04, 2017', night.listdate)
+        self.assertEqual('Jan 04, 2017', night.listdate_short)
+        self.assertEqual('2017-01-04 (Wed, Jan 04)', night.listdate_js)
+        self.assertEqual('20170104T233000Z', night.listdate_ical)
+        self.assertEqual(2017, night.index_year())
+        self.assertTrue(night.dates_changed)
+
+        # Loaded with current dates: no parsing needed
+        loaded = Night(datestr='20170104', dateord=night.dateord, dates=night.dates)
+        self.assertFalse(loaded.dates_changed)
+
+        # Changed date: re-parsed by insure_data
+        loaded.datestr = '20180105'
+        loaded.insure_data()
+        self.assertTrue(loaded.dates_changed)
+        self.assertEqual('Jan 05, 2018', loaded.listdate_short)
+
+    def testBadDate(self):
+        night = Night(datestr='not a date')
+        self.assertEqual(0, night.dateord)
+        self.assertIsNone(night.date)
+        self.assertEqual('', night.listdate)
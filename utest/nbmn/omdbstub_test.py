@@ -0,0 +1,74 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from nbmn import remote
+from nbmn.omdbstub import OMDBStub
+from nbmn.synth import imdbid_for
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', '..', 'test', 'omdb')
+
+
+class OMDBStubTesting(unittest.TestCase):
+    def setUp(self):
+        self.stub = OMDBStub(fixture_dir=FIXTURES, movies=30)
+        self.client = self.stub.create_app().test_client()
+
+    def tearDown(self):
+        pass
+
+    def get(self, **params):
+        params.setdefault('apikey', 'testing')
+        return self.client.get('/', query_string=params)
+
+    def testLookup(self):
+        resp = self.get(i='tt0468569').get_json()
+        self.assertEqual('The Dark Knight', resp['Title'])
+        self.assertEqual('True', resp['Response'])
+
+        synthetic = self.get(i=imdbid_for(3)).get_json()
+        self.assertEqual(imdbid_for(3), synthetic['imdbID'])
+        self.assertEqual(synthetic, OMDBStub(movies=30).lookup(imdbid_for(3)))  # Same seed, same movie
+
+        self.assertEqual('False', self.get(i='tt0000001').get_json()['Response'])
+        self.assertEqual(401, self.get(i='tt0468569', apikey='').status_code)
+
+    def testSearch(self):
+        resp = self.get(s='the').get_json()
+        self.assertEqual(['The Matrix', 'The Dark Knight'], [r['Title'] for r in resp['Search']])
+        self.assertEqual('2', resp['totalResults'])
+        self.assertEqual('Movie not found!', self.get(s='no such movie').get_json()['Error'])
+
+        total = int(self.get(s='a').get_json()['totalResults'])
+        page2 = self.get(s='a', page=2).get_json()
+        self.assertEqual(min(max(total - 10, 0), 10), len(page2.get('Search', [])))
+
+    def testMisbehave(self):
+        self.stub.error_rate = 1.0
+        self.assertEqual(503, self.get(i='tt0468569').status_code)
+        self.stub.error_rate, self.stub.false_rate = 0.0, 1.0
+        self.assertEqual('Error getting data.', self.get(i='tt0468569').get_json()['Error'])
+        stats = self.client.get('/_stats').get_json()
+        self.assertEqual((2, 1, 1), (stats['requests'], stats['errors'], stats['false']))
+
+    def testPoster(self):
+        resp = self.client.get('/img/', query_string={'i': 'tt0133093', 'apikey': 'x'})
+        self.assertEqual('image/png', resp.mimetype)
+        self.assertEqual(404, self.client.get('/img/', query_string={'i': 'tt0000001', 'apikey': 'x'}).status_code)
+
+    def testRemoteUsesBaseUrl(self):
+        app = Flask(__name__)
+        app.config['OMDB_API_KEY'] = 'testing'
+        app.config['OMDB_BASE_URL'] = 'http://127.0.0.1:8089/'
+        calls = []
+        fake = mock.Mock(get=lambda url, **kw: calls.append((url, kw['params'])))
+        with app.app_context(), mock.patch.object(remote, 'http', lambda: fake):
+            remote.create_omdb_get('tt0468569')
+            remote.create_omdb_poster_get('tt0468569')
+        self.assertEqual('http://127.0.0.1:8089/', calls[0][0])
+        self.assertEqual('tt0468569', calls[0][1]['i'])
+        self.assertEqual(remote.DEFAULT_OMDB_POSTER_URL, calls[1][0])
@@ -0,0 +1,79 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import unittest
+from unittest import mock
+
+from flask import Flask, flash
+
+import nbmn.pagecache as pagecache
+from nbmn import utils
+
+
+class PageCacheTesting(unittest.TestCase):
+    def setUp(self):
+        self.renders = 0
+
+        app = Flask(__name__)
+        app.secret_key = 'testing'
+        app.config['PAGE_CACHE_SIZE'] = 10
+        pagecache.init_app(app)
+        pagecache.invalidate()
+        app.before_request(pagecache.before_request)
+        app.after_request(pagecache.after_request)
+
+        @app.route('/page')
+        def page():
+            self.renders += 1
+            return 'render %d' % self.renders
+
+        @app.route('/flasher')
+        def flasher():
+            flash('hello')
+            return 'flashed'
+
+        @app.route('/flaky')
+        @utils.use_error_page
+        def flaky():
+            self.renders += 1
+            if self.renders == 1:
+                raise IOError('OMDB is down')
+            return 'render %d' % self.renders
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        pagecache.invalidate()
+
+    def testHitAndInvalidate(self):
+        self.assertEqual(b'render 1', self.client.get('/page').data)
+        resp = self.client.get('/page')
+        self.assertEqual(b'render 1', resp.data)
+        self.assertEqual('hit', resp.headers[pagecache.CACHE_HEADER])
+
+        # Query string is part of the key
+        self.assertEqual(b'render 2', self.client.get('/page?x=1').data)
+
+        pagecache.invalidate()
+        self.assertEqual(b'render 3', self.client.get('/page').data)
+
+    def testBypass(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 'someone'
+        self.assertEqual(b'render 1', self.client.get('/page').data)
+        self.assertEqual(b'render 2', self.client.get('/page').data)
+
+    def testSessionChanges(self):
+        # Changes the session, so never stored
+        self.client.get('/flasher')
+        self.assertNotIn(pagecache.CACHE_HEADER, self.client.get('/flasher').headers)
+
+        # Flash waiting: don't serve (or store) cached pages
+        self.assertEqual(b'render 1', self.client.get('/page').data)
+        self.assertEqual(b'render 2', self.client.get('/page').data)
+
+    def testErrorPageNotStored(self):
+        with mock.patch.object(utils, 'template', lambda name, **kwrds: 'error page'):
+            resp = self.client.get('/flaky')
+        self.assertEqual((200, b'error page'), (resp.status_code, resp.data))
+        self.assertNotIn(pagecache.CACHE_HEADER, resp.headers)
+        self.assertEqual(b'render 2', self.client.get('/flaky').data)
@@ -0,0 +1,70 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn.model import Attendee
+from nbmn.paging import _scan_rows, _sql_rows, decode_cursor, encode_cursor, fetch_page
+from nbmn.schema import ensure_schema
+
+NAMES = ['Ann', 'Bob', 'Cat', 'Dan', 'Eve', 'Fay', 'Gus']
+
+
+class PagingTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'paging.sqlite')))
+        ensure_schema()
+        for att in Attendee.find_all():
+            att.delete()
+        for name in NAMES:
+            Attendee(name=name).save()
+        Attendee(name='Cat').save()  # Ties are broken by id
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def names(self, page):
+        return [a.name for a in page.items]
+
+    def testCursor(self):
+        self.assertEqual(('20170101', 'abc'), decode_cursor(encode_cursor('20170101', 'abc')))
+        self.assertIsNone(decode_cursor(''))
+        self.assertIsNone(decode_cursor('not a cursor'))
+
+    def testForwardAndBack(self):
+        page1 = fetch_page(Attendee, 'index_name', 3)
+        self.assertEqual(['Ann', 'Bob', 'Cat'], self.names(page1))
+        self.assertIsNone(page1.prev_cursor)
+
+        page2 = fetch_page(Attendee, 'index_name', 3, after=page1.next_cursor)
+        self.assertEqual(['Cat', 'Dan', 'Eve'], self.names(page2))
+
+        page3 = fetch_page(Attendee, 'index_name', 3, after=page2.next_cursor)
+        self.assertEqual(['Fay', 'Gus'], self.names(page3))
+        self.assertIsNone(page3.next_cursor)
+
+        back = fetch_page(Attendee, 'index_name', 3, before=page3.prev_cursor)
+        self.assertEqual(self.names(page2), self.names(back))
+        back = fetch_page(Attendee, 'index_name', 3, before=back.prev_cursor)
+        self.assertEqual(self.names(page1), self.names(back))
+        self.assertIsNone(back.prev_cursor)
+
+    def testDescending(self):
+        page1 = fetch_page(Attendee, 'index_name', 4, descending=True)
+        self.assertEqual(['Gus', 'Fay', 'Eve', 'Dan'], self.names(page1))
+        page2 = fetch_page(Attendee, 'index_name', 4, after=page1.next_cursor, descending=True)
+        self.assertEqual(['Cat', 'Cat', 'Bob', 'Ann'], self.names(page2))
+        self.assertIsNone(page2.next_cursor)
+
+    def testScanMatchesSQL(self):
+        cursor = decode_cursor(encode_cursor('Cat', ''))
+        for forward in (True, False):
+            sql = [(k, i) for k, i, _ in _sql_rows(Attendee, 'index_name', cursor, forward, 10)]
+            scan = [(k, i) for k, i, _ in _scan_rows(Attendee, 'index_name', cursor, forward, 10)]
+            self.assertEqual(sql, scan)
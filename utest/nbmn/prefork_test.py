@@ -0,0 +1,140 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import signal
+import http.client
+import multiprocessing
+import unittest
+
+from flask import Flask
+
+from nbmn import complete, pagecache, prefork
+
+
+class PreforkTesting(unittest.TestCase):
+    def setUp(self):
+        self.counter = multiprocessing.Value('Q', 0)
+        prefork.share_writes(self.counter)
+
+    def tearDown(self):
+        prefork.share_writes(None)
+
+    def testOtherProcessWrites(self):
+        generation = pagecache._generation
+        prefork.before_request()
+        self.assertEqual(generation, pagecache._generation)
+
+        complete._index = complete.PrefixIndex()
+        self.counter.value += 1  # As if another worker saved something
+        prefork.before_request()
+        self.assertEqual(generation + 1, pagecache._generation)
+        self.assertIsNone(complete._index)
+
+        # Only once
+        prefork.before_request()
+        self.assertEqual(generation + 1, pagecache._generation)
+
+    def testOurWrites(self):
+        generation = pagecache._generation
+        prefork.note_write('save', None)
+        self.assertEqual(1, self.counter.value)
+        prefork.before_request()
+        self.assertEqual(generation, pagecache._generation)
+
+        # A write of ours after one we missed still drops our caches
+        self.counter.value += 1
+        prefork.note_write('save', None)
+        self.assertEqual(3, self.counter.value)
+        self.assertEqual(generation + 1, pagecache._generation)
+
+    def testSingleProcess(self):
+        prefork.share_writes(None)
+        generation = pagecache._generation
+        prefork.note_write('save', None)
+        prefork.before_request()
+        self.assertEqual(generation, pagecache._generation)
+
+    def testWorkerRetires(self):
+        app = Flask(__name__)
+        app.add_url_rule('/', 'index', lambda: 'hi')
+        worker = prefork.Worker(app, None, 0, 1, 10, 3, 5)
+
+        def request():
+            statuses = []
+            body = worker.wsgi({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'SERVER_NAME': 'x', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http'},
+                               lambda status, headers, exc_info=None: statuses.append(status))
+            return statuses[0], b''.join(body)
+
+        self.assertEqual(('200 OK', b'hi'), request())
+        self.assertEqual(('200 OK', b'hi'), request())
+        self.assertFalse(worker.retiring)
+        self.assertEqual(('200 OK', b'hi'), request())
+        self.assertTrue(worker.retiring)
+
+    def testMaxRequestsJitter(self):
+        master = prefork.Master(None, '127.0.0.1', 0, 2, max_requests=100)
+        for _ in range(50):
+            self.assertTrue(100 <= master.worker_max_requests() <= 110)
+        self.assertEqual(0, prefork.Master(None, '127.0.0.1', 0, 2).worker_max_requests())
+
+    def testBind(self):
+        sock = prefork.bind('127.0.0.1', 0)
+        try:
+            self.assertTrue(sock.get_inheritable())
+            self.assertNotEqual(0, sock.getsockname()[1])
+        finally:
+            sock.close()
+
+
+class LiveWorkerTesting(unittest.TestCase):
+    """A real waitress worker in a forked child: catches waitress changes under us."""
+
+    def setUp(self):
+        self.sock = prefork.bind('127.0.0.1', 0)
+        self.port = self.sock.getsockname()[1]
+        self.child = None
+
+    def tearDown(self):
+        if self.child is not None and self.child.is_alive():
+            self.child.kill()
+            self.child.join()
+        self.sock.close()
+
+    def start(self, max_requests):
+        app = Flask(__name__)
+        app.add_url_rule('/', 'index', lambda: 'hi')
+        sock = self.sock
+
+        def serve():
+            worker = prefork.Worker(app, sock, 0, 2, 10, max_requests, 5)
+            signal.signal(signal.SIGTERM, worker.retire)
+            worker.run()
+
+        self.child = multiprocessing.get_context('fork').Process(target=serve)
+        self.child.start()
+
+    def get(self, conn):
+        conn.request('GET', '/')
+        resp = conn.getresponse()
+        return resp.status, resp.read(), resp.getheader('Connection')
+
+    def testRetiresAfterMaxRequests(self):
+        self.start(max_requests=2)
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        self.assertEqual((200, b'hi', None), self.get(conn))
+        # The request that hits the limit is told to close, then we exit
+        self.assertEqual((200, b'hi', 'close'), self.get(conn))
+        conn.close()
+        self.child.join(10)
+        self.assertEqual(0, self.child.exitcode)
+
+    def testRetireClosesIdleKeepAlive(self):
+        self.start(max_requests=0)
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        self.assertEqual((200, b'hi', None), self.get(conn))
+
+        # The keep-alive connection is left open and idle: it's closed for us
+        os.kill(self.child.pid, signal.SIGTERM)
+        self.child.join(prefork.IDLE_CLOSE + 8)
+        self.assertEqual(0, self.child.exitcode)
+        conn.close()
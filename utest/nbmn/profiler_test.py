@@ -0,0 +1,52 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import sys
+import threading
+import unittest
+from collections import Counter
+from unittest import mock
+
+from flask import Flask
+
+from nbmn import profiler
+from nbmn.profiler import collapse, folded
+
+
+class ProfilerTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testCollapse(self):
+        def inner():
+            return collapse(sys._getframe(), root='myendpoint')
+        stack = inner()
+        self.assertTrue(stack.startswith('myendpoint;'))
+        self.assertTrue(stack.endswith('profiler_test.py:testCollapse;profiler_test.py:inner'))
+
+    def testFolded(self):
+        stacks = Counter({'a;b': 3, 'a;c': 5})
+        self.assertEqual('a;c 5\na;b 3\n', folded(stacks))
+
+    def testFailedRequestStopsProfile(self):
+        app = Flask(__name__)
+        app.config['PROPAGATE_EXCEPTIONS'] = True
+        app.before_request(profiler.before_request)
+        app.after_request(profiler.after_request)
+        app.teardown_request(profiler.teardown_request)
+
+        @app.route('/boom')
+        def boom():
+            raise RuntimeError('boom')
+
+        admin = mock.Mock(admin=True)
+        before = threading.active_count()
+        with mock.patch.object(profiler.User, 'get_user', lambda: admin):
+            with self.assertRaises(RuntimeError):
+                app.test_client().get('/boom?_profile=1')
+
+        # No profiler left on this thread and the sampler thread is gone
+        self.assertIsNone(sys.getprofile())
+        self.assertEqual(before, threading.active_count())
@@ -0,0 +1,121 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn import refresh, remote
+from nbmn.model import Movie, MovieOverride, Night
+from nbmn.refresh import Refresher, found, update_time
+from nbmn.schema import ensure_schema
+
+NOW = datetime(2017, 6, 1, 12, 0, 0)
+
+
+def extdata(days_old, title='Title'):
+    return {'update_time': str(NOW - timedelta(days=days_old)), 'omdb': {'Title': title}}
+
+
+class RefreshTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'refresh.sqlite')))
+        ensure_schema()
+
+        Movie(imdbid='tt0000001', name='Fresh', extdata=extdata(1)).save()
+        Movie(imdbid='tt0000002', name='Old', extdata=extdata(100)).save()
+        Movie(imdbid='tt0000003', name='Older', extdata=extdata(200)).save()
+        Movie(imdbid='tt0000004', name='Recent', extdata=extdata(40)).save()
+        Movie(imdbid='tt0000005', name='Overridden', extdata=extdata(300)).save()
+        Movie(imdbid='tt0000006', name='Never').save()
+        MovieOverride(imdbid='tt0000005', name='Overridden').save()
+        Night(datestr='20170520', imdbid='tt0000004').save()
+
+        self.app = Flask(__name__)
+        self.app.config['REFRESH_DAILY_BUDGET'] = 3
+        self.refresher = Refresher(self.app)
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def names(self, movies):
+        return [m.name for m in movies]
+
+    def testUpdateTime(self):
+        self.assertEqual(NOW, update_time(Movie(extdata={'update_time': str(NOW)})))
+        self.assertIsNone(update_time(Movie()))
+        self.assertIsNone(update_time(Movie(extdata={'update_time': 'whenever'})))
+
+    def testFound(self):
+        self.assertTrue(found({'omdb': {'Response': 'True'}}))
+        self.assertTrue(found(extdata(1)))
+        self.assertFalse(found({'omdb': remote._norm_omdb_resp(dict())}))
+        self.assertFalse(found(dict()))
+
+    def testCandidates(self):
+        # Recent nights first, then the oldest (never fetched is oldest)
+        self.assertEqual(['Recent', 'Never', 'Older', 'Old'], self.names(self.refresher.candidates(NOW)))
+
+    def testBudget(self):
+        # Through the real get_movie_data, so a failure looks like it does live
+        def reply(imdbid, base=None):
+            if imdbid == 'tt0000003':
+                data = {'Response': 'False', 'Error': 'Request limit reached!'}
+            else:
+                data = {'Response': 'True', 'Title': 'New ' + imdbid}
+            return mock.Mock(json=lambda: data)
+
+        with self.app.app_context(), mock.patch.object(remote, 'create_omdb_get', reply):
+            self.assertEqual(2, self.refresher.run_once(NOW))
+
+        status = self.refresher.status()
+        self.assertEqual((3, 0), (status['used'], status['remaining']))
+        self.assertEqual(['tt0000003'], status['failed_today'])
+        self.assertEqual(['refreshed', 'refreshed', 'failed'], [h['result'] for h in reversed(status['history'])])
+
+        # Failed lookups keep the old data
+        older = Movie.find_by_index('index_imdbid', 'tt0000003')[0]
+        self.assertEqual('Older', older.name)
+        self.assertEqual(extdata(200), older.extdata)
+        self.assertEqual('New tt0000004', Movie.find_by_index('index_imdbid', 'tt0000004')[0].name)
+        self.assertEqual('New tt0000006', Movie.find_by_index('index_imdbid', 'tt0000006')[0].name)
+
+        def fake(imdbid):
+            return {'update_time': str(NOW), 'omdb': {'Title': 'New ' + imdbid}}
+
+        # Out of budget for today
+        with mock.patch.object(refresh, 'get_movie_data', fake):
+            self.assertEqual(0, self.refresher.run_once(NOW))
+
+    def testBudgetSurvivesRecycle(self):
+        def fake(imdbid):
+            if imdbid == 'tt0000004':
+                return dict()
+            return {'update_time': str(NOW), 'omdb': {'Title': 'New ' + imdbid}}
+
+        self.app.config['REFRESH_DAILY_BUDGET'] = 2
+        self.app.config['REFRESH_INTERVAL'] = 600
+        # No pass yet at all: a whole interval
+        self.assertEqual(600, self.refresher.first_wait())
+
+        with self.app.app_context(), mock.patch.object(refresh, 'get_movie_data', fake):
+            self.assertEqual(1, self.refresher.run_once(NOW))
+
+        # Slot 0 recycled: the new worker starts a new Refresher
+        recycled = Refresher(self.app)
+        status = recycled.status()
+        self.assertEqual((2, 0), (status['used'], status['remaining']))
+        self.assertEqual(['tt0000004'], status['failed_today'])
+        self.assertNotIn('tt0000004', [m.imdbid for m in recycled.candidates(NOW)])
+
+        # ...and picks up the interval where the last pass left it
+        self.assertLess(recycled.first_wait(), 600)
+        later = datetime.now() + timedelta(seconds=700)
+        self.assertEqual(0, recycled.first_wait(later))
@@ -1,9 +1,23 @@
 # pylama:ignore=D100,D101,D102,E501,E128
 
 import unittest
+from unittest import mock
 
+from flask import Flask
+
+from nbmn import remote
 from nbmn.imdb import norm_imdbid
 
+SEARCH = {
+    'Response': 'True',
+    'totalResults': '12',
+    'Search': [
+        {'Title': 'The Dark Knight', 'Year': '2008', 'imdbID': 'tt0468569', 'Type': 'movie', 'Poster': 'http://example.com/p.jpg'},
+        {'Title': 'Batman: The Animated Series', 'Year': '1992–1995', 'imdbID': 'tt0103359', 'Type': 'series', 'Poster': 'N/A'},
+        {'Title': 'Broken', 'Year': '2000', 'imdbID': '', 'Type': 'movie', 'Poster': 'N/A'},
+    ],
+}
+
 
 class RemoteHelperTesting(unittest.TestCase):
     def setUp(self):
@@ -29,3 +43,77 @@ class RemoteHelperTesting(unittest.TestCase):
         self.assertEqual('tt1234567', norm_imdbid(1234567))
         self.assertEqual('tt1234567', norm_imdbid('1234567'))
         self.assertEqual('tt1234567', norm_imdbid('tt1234567'))
+
+
+class SearchTesting(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['OMDB_SEARCH_TTL'] = 60
+        remote._search_cache.clear()
+        self.calls = []
+        self.reply = (200, SEARCH)
+
+        def fake_search(query, page=1):
+            self.calls.append((query, page))
+            resp = mock.Mock()
+            resp.status_code, data = self.reply
+            resp.json.return_value = data
+            return resp
+        self.patch = mock.patch.object(remote, 'create_omdb_search', fake_search)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        remote._search_cache.clear()
+
+    def testNormalized(self):
+        with self.app.app_context():
+            found = remote.search_titles('  The DARK   knight ')
+        self.assertEqual('the dark knight', found['query'])
+        self.assertEqual((12, 2, 1), (found['total'], found['pages'], found['page']))
+        self.assertEqual(['tt0468569', 'tt0103359'], [r['imdbID'] for r in found['results']])
+        self.assertEqual(2008, found['results'][0]['Year'])
+        self.assertEqual('1992–1995', found['results'][1]['Year'])
+        self.assertEqual('', found['results'][1]['Poster'])
+
+        missing = remote._norm_omdb_search({'Response': 'False', 'Error': 'Movie not found!'}, 'zzz', 1)
+        self.assertEqual((0, 0, []), (missing['total'], missing['pages'], missing['results']))
+
+    def testCached(self):
+        with self.app.app_context():
+            remote.search_titles('dark knight')
+            remote.search_titles('Dark  Knight')
+            remote.search_titles('dark knight', page=2)
+            self.assertEqual([('dark knight', 1), ('dark knight', 2)], self.calls)
+
+            self.assertEqual(0, len(remote.search_titles('')['results']))
+            self.assertEqual(2, len(self.calls))
+
+    def testExpired(self):
+        with self.app.app_context():
+            remote.search_titles('dark knight')
+            with mock.patch.object(remote.time, 'time', lambda: 10 ** 12):
+                remote.search_titles('dark knight')
+        self.assertEqual(2, len(self.calls))
+
+    def testErrorsNotCached(self):
+        with self.app.app_context():
+            for reply in [(200, {'Response': 'False', 'Error': 'Request limit reached!'}),
+                          (200, {'Response': 'False', 'Error': 'Invalid API key!'}),
+                          (503, {})]:
+                self.reply = reply
+                self.assertEqual([], remote.search_titles('dark knight')['results'])
+            self.assertEqual(3, len(self.calls))
+
+            # Back to normal: the next search asks again and gets results
+            self.reply = (200, SEARCH)
+            self.assertEqual(2, len(remote.search_titles('dark knight')['results']))
+            remote.search_titles('dark knight')
+            self.assertEqual(4, len(self.calls))
+
+    def testNotFoundCached(self):
+        self.reply = (200, {'Response': 'False', 'Error': 'Movie not found!'})
+        with self.app.app_context():
+            remote.search_titles('zzz')
+            remote.search_titles('zzz')
+        self.assertEqual(1, len(self.calls))
@@ -0,0 +1,75 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import os
+import shutil
+import tempfile
+import json
+import unittest
+
+from flask import Flask
+from gludb.config import default_database, clear_database_config, Database
+
+from nbmn import attendance, dbhook, rawsql
+from nbmn.model import Attendee, Night
+from nbmn.schema import MIGRATIONS, SCHEMA_VERSION, SchemaInfo, ensure_schema, read_marker
+
+
+class SchemaTesting(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        default_database(Database('sqlite', filename=os.path.join(self.workdir, 'schema.sqlite')))
+
+    def tearDown(self):
+        clear_database_config()
+        shutil.rmtree(self.workdir)
+
+    def testFreshDatabase(self):
+        self.assertIsNone(read_marker())
+        self.assertTrue(ensure_schema())
+
+        marker = read_marker()
+        self.assertEqual(SCHEMA_VERSION, marker.version)
+        self.assertEqual(sorted(Attendee.OLIGARCHS), marker.seeded)
+        self.assertEqual(Attendee.OLIGARCHS, set(a.name for a in Attendee.find_all()))
+
+    def testWarmStart(self):
+        ensure_schema()
+        self.assertFalse(ensure_schema())
+
+    def testReseed(self):
+        ensure_schema()
+        marker = read_marker()
+        marker.seeded = ['Adam']
+        marker.save()
+        for att in Attendee.find_all():
+            att.delete()
+
+        self.assertTrue(ensure_schema())
+        self.assertEqual(Attendee.OLIGARCHS, set(a.name for a in Attendee.find_all()))
+
+    def testNewerDatabase(self):
+        ensure_schema()
+        SchemaInfo(id='schema', version=SCHEMA_VERSION + 1).save()
+        self.assertFalse(ensure_schema())
+
+    def testUpgradeIsQuiet(self):
+        # A version 2 database: nights saved before they stored their dates
+        for version in (1, 2):
+            MIGRATIONS[version]()
+        SchemaInfo.ensure_table()
+        SchemaInfo(id='schema', version=2, seeded=sorted(Attendee.OLIGARCHS)).save()
+        for datestr in ('20160101', '20160108'):
+            night = Night(datestr=datestr, attendees=['Adam', 'Ann'])
+            night.save()
+            data = json.loads(night.to_data())
+            del data['dates']
+            rawsql.execute(Night, 'update %s set value = ? where id = ?' % Night.get_table_name(), (json.dumps(data), night.id))
+
+        # Installed, so the write listeners are live like they are in the app
+        dbhook.install(Flask(__name__))
+        with self.assertNoLogs('nbmn', level='ERROR'):
+            self.assertTrue(ensure_schema())
+
+        self.assertEqual(SCHEMA_VERSION, read_marker().version)
+        self.assertTrue(all(n.dates['year'] == 2016 for n in Night.find_all()))
+        self.assertEqual(2, attendance.attended(['Ann'])['Ann'].count)
@@ -0,0 +1,30 @@
+# pylama:ignore=D100,D101,D102,E501,E128
+
+import random
+import unittest
+
+from nbmn.synth import imdbid_for, movie_extdata, omdb_record
+
+
+class SynthTesting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testSeeded(self):
+        one = omdb_record(random.Random(7), imdbid_for(1))
+        two = omdb_record(random.Random(7), imdbid_for(1))
+        self.assertEqual(one, two)
+        self.assertNotEqual(one, omdb_record(random.Random(8), imdbid_for(1)))
+
+    def testExtdataNormalized(self):
+        ext = movie_extdata(random.Random(1), imdbid_for(3))
+        omdb = ext['omdb']
+        self.assertEqual('tt9000003', omdb['imdbID'])
+        self.assertTrue(isinstance(omdb['Year'], int))
+        self.assertTrue(isinstance(omdb['imdbRating'], float))
+        for k in ['Actors', 'Director', 'Genre', 'Language', 'Writer']:
+            self.assertTrue(isinstance(omdb[k], list))
+            self.assertTrue(len(omdb[k]) > 0)